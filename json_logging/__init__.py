@@ -4,8 +4,9 @@ import logging
 import sys
 import uuid
 
-from json_logging import util
-from json_logging.dto import RequestResponseDTOBase, DefaultRequestResponseDTO
+from json_logging import util, encoders, context, buffering, sampling, filters
+from json_logging.dto import RequestResponseDTOBase, DefaultRequestResponseDTO, LightweightRequestResponseDTO
+from json_logging.handlers import JSONStreamHandler, BufferedJSONStreamHandler, AsyncHandler
 from json_logging.formatters import JSONRequestLogFormatter, JSONLogFormatter, JSONLogWebFormatter
 from json_logging.framework_base import BaseRequestInfoExtractor, BaseResponseInfoExtractor, \
     BaseAppRequestInstrumentationConfigurator, \
@@ -22,16 +23,58 @@ ENABLE_JSON_LOGGING_DEBUG = False
 EMPTY_VALUE = '-'
 CREATE_CORRELATION_ID_IF_NOT_EXISTS = True
 JSON_SERIALIZER = lambda log: json.dumps(log, ensure_ascii=False, default=str)
+JSON_ENCODER_BACKEND = 'json'
 CORRELATION_ID_HEADERS = ['X-Correlation-ID', 'X-Request-ID']
 COMPONENT_ID = EMPTY_VALUE
 COMPONENT_NAME = EMPTY_VALUE
 COMPONENT_INSTANCE_INDEX = 0
+TIMESTAMP_COARSE_CLOCK = False
+ASYNC_LOGGING = False
+ASYNC_LOGGING_QUEUE_SIZE = 10000
+ASYNC_LOGGING_OVERFLOW_POLICY = 'block'
+ASYNC_LOGGING_FLUSH_TIMEOUT = 5.0
+LOG_WRITE_BUFFER_SIZE = 0
+LOG_WRITE_FLUSH_INTERVAL = 1.0
+LOG_WRITE_FLUSH_LEVEL = logging.ERROR
+LOG_COLLECTOR_SOCKET = None
+LOG_OUTPUT_ENCODING = None
+LOG_OUTPUT_FRAMING = None
+REQUEST_LOG_FIELDS = None
+RELEASE_REQUEST_RESPONSE_OBJECTS = False
+REQUEST_INSTRUMENTATION_WSGI_MIDDLEWARE = False
+REQUEST_START_HEADERS = ['X-Request-Start', 'X-Queue-Start']
+REQUEST_SAMPLING_RATE = None
+REQUEST_SAMPLING_BURST = None
+REQUEST_SAMPLING_SLOW_THRESHOLD_MS = 1000
+REQUEST_SAMPLING_MAX_ROUTES = 1000
+CORRELATION_ID_SAMPLE_RATE = None
+FORCE_LOG_HEADERS = ['X-Force-Log']
+REQUEST_LOG_BUFFERING = False
+REQUEST_LOG_BUFFER_SIZE = 1000
+REQUEST_LOG_BUFFER_LEVEL = logging.WARNING
+REQUEST_LOG_BUFFER_LATENCY_MS = 1000
+LOG_DEDUPLICATION_WINDOW = None
+LOG_RATE_LIMIT = None
+LOG_RATE_LIMIT_BURST = None
+LOG_DEDUPLICATION_MAX_CALL_SITES = 10000
+EXCEPTION_FORMAT = 'text'
+EXCEPTION_MAX_FRAMES = None
+EXCEPTION_MAX_SIZE = None
+EXCEPTION_FINGERPRINT = False
+EXCEPTION_CACHE_SIZE = 256
+LOG_FIELD_MAX_LENGTH = None
+LOG_EXTRA_FIELDS_MAX_COUNT = None
+LOG_FIELD_MAX_DEPTH = None
+LOG_LINE_MAX_BYTES = None
 
 _framework_support_map = {}
 _current_framework = None
 _logger = get_library_logger(__name__)
 _request_util = None
+_request_sampler = None
 _default_formatter = None
+_default_json_serializer = JSON_SERIALIZER
+_encoder_backend = encoders.load_stdlib_backend()
 
 
 def get_correlation_id(request=None):
@@ -63,6 +106,99 @@ def config_root_logger():
 
         util.update_formatter_for_loggers([logging.root], _default_formatter)
 
+    if LOG_WRITE_BUFFER_SIZE > 0 or LOG_COLLECTOR_SOCKET or LOG_OUTPUT_ENCODING or LOG_OUTPUT_FRAMING:
+        ENABLE_JSON_LOGGING_DEBUG and _logger.debug("Replace root logger stream handlers")
+
+        logging.root.handlers = [_create_buffered_handler(handler) for handler in logging.root.handlers]
+
+    if ASYNC_LOGGING:
+        ENABLE_JSON_LOGGING_DEBUG and _logger.debug("Move root logger output to background writer thread")
+
+        logging.root.handlers = [_create_async_handler(handler) for handler in logging.root.handlers]
+
+
+def _create_async_handler(handler):
+    """
+    wrap handler so records are formatted and written by a background writer thread
+
+    :param handler: handler to wrap
+    :return: AsyncHandler
+    """
+    if isinstance(handler, AsyncHandler):
+        return handler
+
+    async_handler = AsyncHandler(handler, queue_size=ASYNC_LOGGING_QUEUE_SIZE,
+                                 overflow_policy=ASYNC_LOGGING_OVERFLOW_POLICY,
+                                 flush_timeout=ASYNC_LOGGING_FLUSH_TIMEOUT)
+    # sampling, buffering & deduplication depend on the logging thread, e.g. its request context
+    filters.move_filters(handler, async_handler)
+    return async_handler
+
+
+def _create_buffered_handler(handler):
+    """
+    replace a plain stream handler with a write-coalescing one writing to the same stream, or shipping to the log
+    collector if LOG_COLLECTOR_SOCKET is set, in the configured output encoding
+
+    :param handler: handler to replace
+    :return: BufferedJSONStreamHandler, JSONStreamHandler if writes are not coalesced or given handler if it is not
+        a plain stream handler
+    """
+    if type(handler) not in (logging.StreamHandler, JSONStreamHandler):
+        return handler
+
+    if LOG_WRITE_BUFFER_SIZE > 0 or LOG_COLLECTOR_SOCKET:
+        buffered_handler = _create_batching_handler(handler.stream)
+    else:
+        buffered_handler = JSONStreamHandler(handler.stream, **_get_output_encoding_options())
+    buffered_handler.setLevel(handler.level)
+    buffered_handler.setFormatter(handler.formatter)
+    filters.move_filters(handler, buffered_handler)
+    for log_filter in handler.filters:
+        buffered_handler.addFilter(log_filter)
+    handler.close()
+    return buffered_handler
+
+
+def _create_output_handler(stream):
+    """
+    create handler writing JSON lines to stream according to current configuration
+
+    :param stream: output stream e.g. sys.stdout
+    :return: handler
+    """
+    if LOG_WRITE_BUFFER_SIZE > 0 or LOG_COLLECTOR_SOCKET:
+        handler = _create_batching_handler(stream)
+    else:
+        handler = JSONStreamHandler(stream, **_get_output_encoding_options())
+    if ASYNC_LOGGING:
+        handler = _create_async_handler(handler)
+    return handler
+
+
+def _create_batching_handler(stream):
+    """
+    :param stream: output stream, fallback stream of the log collector
+    :return: CollectorHandler if LOG_COLLECTOR_SOCKET is set, BufferedJSONStreamHandler otherwise
+    """
+    if LOG_COLLECTOR_SOCKET:
+        from json_logging.collector import CollectorHandler
+
+        return CollectorHandler(LOG_COLLECTOR_SOCKET, stream, buffer_size=LOG_WRITE_BUFFER_SIZE,
+                                flush_interval=LOG_WRITE_FLUSH_INTERVAL, flush_level=LOG_WRITE_FLUSH_LEVEL,
+                                **_get_output_encoding_options())
+    return BufferedJSONStreamHandler(stream, buffer_size=LOG_WRITE_BUFFER_SIZE,
+                                     flush_interval=LOG_WRITE_FLUSH_INTERVAL, flush_level=LOG_WRITE_FLUSH_LEVEL,
+                                     **_get_output_encoding_options())
+
+
+def _get_output_encoding_options():
+    """
+    :return: record_encoding & framing keyword arguments of stream handlers for LOG_OUTPUT_ENCODING and
+        LOG_OUTPUT_FRAMING
+    """
+    return {'record_encoding': encoders.get_record_encoding(LOG_OUTPUT_ENCODING), 'framing': LOG_OUTPUT_FRAMING}
+
 
 def init_non_web(*args, **kw):
     """
@@ -87,6 +223,8 @@ def __init(framework_name=None, custom_formatter=None, enable_json=False):
     global _current_framework
     global ENABLE_JSON_LOGGING
     global _default_formatter
+    global _encoder_backend
+    global JSON_SERIALIZER
 
     if _current_framework is not None:
         raise RuntimeError("Can not call init more than once")
@@ -104,14 +242,19 @@ def __init(framework_name=None, custom_formatter=None, enable_json=False):
 
     ENABLE_JSON_LOGGING_DEBUG and _logger.info("init framework " + str(framework_name))
 
+    _encoder_backend = encoders.get_encoder_backend(JSON_ENCODER_BACKEND)
+    if JSON_SERIALIZER is _default_json_serializer:
+        JSON_SERIALIZER = _encoder_backend.dumps
+    ENABLE_JSON_LOGGING_DEBUG and _logger.info("using JSON encoder backend " + _encoder_backend.name)
+
     if framework_name:
-        framework_name = framework_name.lower()
-        if framework_name not in _framework_support_map.keys():
-            raise RuntimeError(framework_name + " is not a supported framework")
+        framework_support = frameworks.get_framework_support(framework_name)
+        if framework_support is None:
+            raise RuntimeError(framework_name.lower() + " is not a supported framework")
 
         global _request_util
 
-        _current_framework = _framework_support_map[framework_name]
+        _current_framework = framework_support
         _request_util = util.RequestUtil(
             request_info_extractor_class=_current_framework['request_info_extractor_class'],
             response_info_extractor_class=_current_framework['response_info_extractor_class'])
@@ -155,13 +298,21 @@ def init_request_instrument(app=None, custom_formatter=None, exclude_url_pattern
         raise ValueError('request_response_dto_class is not subclass of json_logging.RequestInfoBase',
                          custom_formatter)
 
+    global _request_sampler
+    _request_sampler = None
+    if REQUEST_SAMPLING_RATE:
+        _request_sampler = sampling.RequestSampler(REQUEST_SAMPLING_RATE, burst=REQUEST_SAMPLING_BURST,
+                                                   slow_request_threshold_ms=REQUEST_SAMPLING_SLOW_THRESHOLD_MS,
+                                                   max_routes=REQUEST_SAMPLING_MAX_ROUTES)
+
     configurator = _current_framework['app_request_instrumentation_configurator']()
-    configurator.config(app, request_response_dto_class, exclude_url_patterns=exclude_url_patterns)
+    configurator.config(app, request_response_dto_class,
+                        exclude_url_patterns=util.UrlPatternMatcher(exclude_url_patterns))
 
     formatter = custom_formatter if custom_formatter else JSONRequestLogFormatter
     request_logger = configurator.request_logger
     request_logger.setLevel(logging.DEBUG)
-    request_logger.addHandler(logging.StreamHandler(sys.stdout))
+    request_logger.addHandler(_create_output_handler(sys.stdout))
     util.update_formatter_for_loggers([request_logger], formatter)
     request_logger.parent = None
 
@@ -179,7 +330,8 @@ def get_request_logger():
     return instance.request_logger
 
 
-import json_logging.frameworks
+from json_logging import frameworks
+from json_logging.frameworks import register_framework_support
 
 
 def init_flask(custom_formatter=None, enable_json=False):
@@ -200,3 +352,11 @@ def init_connexion(custom_formatter=None, enable_json=False):
 
 def init_fastapi(custom_formatter=None, enable_json=False):
     __init(framework_name='fastapi', custom_formatter=custom_formatter, enable_json=enable_json)
+
+
+def init_framework(framework_name, custom_formatter=None, enable_json=False):
+    """
+    Initialize for a framework by name, e.g. one whose support is provided by an entry point
+    (see json_logging.frameworks)
+    """
+    __init(framework_name=framework_name, custom_formatter=custom_formatter, enable_json=enable_json)
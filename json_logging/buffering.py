@@ -0,0 +1,85 @@
+# coding=utf-8
+import collections
+
+import json_logging
+from json_logging.context import get_request_context
+from json_logging.formatters import LOG_RECORD_BUILT_IN_ATTRS
+
+SUPPRESSED_LOG_COUNT_FIELD = 'suppressed_log_count'
+
+# record attribute holding the loggers & handlers a buffered record has been held back from
+HELD_BACK_ATTR = 'json_logging_held_back'
+LOG_RECORD_BUILT_IN_ATTRS.append(HELD_BACK_ATTR)
+
+
+class RequestLogBuffer(object):
+    """
+        Bounded buffer of the records logged while processing a request (see json_logging.REQUEST_LOG_BUFFERING).
+        Once full, the oldest records are dropped and counted in **dropped_count**. A record held back from several
+        loggers or handlers is buffered once and handed to each of them when flushed.
+    """
+    __slots__ = ('records', 'dropped_count')
+
+    def __init__(self, size):
+        self.records = collections.deque(maxlen=size)
+        self.dropped_count = 0
+
+    def append(self, target, record):
+        """
+        :param target: logger or handler the record has been held back from
+        :param record: logging.LogRecord
+        """
+        held_back = record.__dict__.get(HELD_BACK_ATTR)
+        if held_back is not None:
+            # buffered already, e.g. by another handler the record propagated to
+            held_back.append(target)
+            return
+        if len(self.records) == self.records.maxlen:
+            self.dropped_count += 1
+        record.__dict__[HELD_BACK_ATTR] = [target]
+        self.records.append(record)
+
+    def complete(self, status_code, duration_ns, failed=False):
+        """
+        hand the records to their loggers & handlers if the request failed or exceeded the latency budget, drop
+        them otherwise
+
+        :param status_code: response status code
+        :param duration_ns: request duration in nanoseconds
+        :param failed: whether the request raised an exception, whatever its status code
+        :return: number of records that have not been written
+        """
+        latency_budget_ms = json_logging.REQUEST_LOG_BUFFER_LATENCY_MS
+        failed = failed or isinstance(status_code, int) and status_code >= 500
+        if failed or latency_budget_ms is not None and duration_ns >= latency_budget_ms * 1000000:
+            for record in self.records:
+                for target in record.__dict__.pop(HELD_BACK_ATTR):
+                    target.handle(record)
+            return self.dropped_count
+
+        return len(self.records) + self.dropped_count
+
+
+def start_request_log_buffer():
+    """
+    start buffering the records of the request currently being processed, if enabled
+    """
+    if not json_logging.REQUEST_LOG_BUFFERING:
+        return
+    context = get_request_context()
+    if context is not None:
+        context.log_buffer = RequestLogBuffer(json_logging.REQUEST_LOG_BUFFER_SIZE)
+
+
+def pop_request_log_buffer():
+    """
+    stop buffering the records of the request currently being processed
+
+    :return: RequestLogBuffer of the request or None
+    """
+    context = get_request_context()
+    if context is None:
+        return None
+    log_buffer = context.log_buffer
+    context.log_buffer = None
+    return log_buffer
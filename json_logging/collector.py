@@ -0,0 +1,303 @@
+# coding=utf-8
+"""
+    Multi-process log aggregation for pre-fork servers (gunicorn, uvicorn workers...). Instead of every worker
+    writing to the inherited stdout, where lines larger than PIPE_BUF interleave, workers ship batches of complete
+    lines over a Unix socket to a single LogCollector which owns the output, e.g. in the master process:
+
+        # gunicorn.conf.py
+        import sys
+        import json_logging.collector
+
+        collector = json_logging.collector.LogCollector('/tmp/app-logs.sock', sys.stdout)
+
+        def on_starting(server):
+            collector.start()
+
+        def on_exit(server):
+            collector.close()
+
+    and in the application, before init_<framework_name>():
+
+        json_logging.LOG_COLLECTOR_SOCKET = '/tmp/app-logs.sock'
+
+    Batches are framed with their length, a batch is written with a single write once it has been fully received,
+    so lines are never torn. A collector can also run as a separate process:
+    **python -m json_logging.collector /tmp/app-logs.sock**
+"""
+import logging
+import os
+import selectors
+import socket
+import struct
+import sys
+import threading
+import time
+import weakref
+
+from json_logging.handlers import BufferedJSONStreamHandler, get_utf8_buffer
+from json_logging.util import get_library_logger
+
+_FRAME_HEADER = struct.Struct('>I')
+_logger = get_library_logger(__name__)
+# collectors whose listening socket is closed in forked child processes
+_collectors = weakref.WeakSet()
+
+
+def _close_collectors_after_fork():
+    for collector in list(_collectors):
+        collector._after_fork_in_child()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_close_collectors_after_fork)
+
+
+class LogCollector(object):
+    """
+        Receives batches of log lines from CollectorHandlers on a Unix socket and writes them to **stream** from a
+        single thread. Incomplete batches of disconnected workers are discarded rather than written torn.
+    """
+
+    def __init__(self, path, stream=None, max_batch_size=16 * 1024 * 1024):
+        """
+        :param path: path of the Unix socket, an existing socket file is replaced
+        :param stream: output stream, default to sys.stdout
+        :param max_batch_size: connections sending larger batches are closed
+        """
+        self.path = path
+        self.stream = stream if stream is not None else sys.stdout
+        self.max_batch_size = max_batch_size
+        self.received_batch_count = 0
+        self.discarded_batch_count = 0
+        self._buffer = get_utf8_buffer(self.stream)
+        self._server = None
+        self._thread = None
+        self._wakeup = None
+        self._closed = threading.Event()
+        _collectors.add(self)
+
+    def start(self):
+        """
+        bind the socket and start receiving in a background thread
+        """
+        self._bind()
+        self._thread = threading.Thread(target=self.serve, name='json_logging-collector', daemon=True)
+        self._thread.start()
+
+    def serve(self):
+        """
+        receive and write batches until close is called
+        """
+        if self._server is None:
+            self._bind()
+
+        selector = selectors.DefaultSelector()
+        selector.register(self._server, selectors.EVENT_READ)
+        selector.register(self._wakeup[0], selectors.EVENT_READ)
+        pending = {}
+        try:
+            while not self._closed.is_set():
+                batches = []
+                for key, _ in selector.select():
+                    sock = key.fileobj
+                    if sock is self._server:
+                        connection, _ = sock.accept()
+                        connection.setblocking(False)
+                        selector.register(connection, selectors.EVENT_READ)
+                        pending[connection] = bytearray()
+                    elif sock is not self._wakeup[0]:
+                        if not self._receive(sock, pending[sock], batches):
+                            selector.unregister(sock)
+                            self._discard(pending.pop(sock))
+                            sock.close()
+                if batches:
+                    self._write(batches)
+        finally:
+            for connection, data in pending.items():
+                self._discard(data)
+                connection.close()
+            selector.close()
+
+    def close(self):
+        """
+        stop receiving, wait for the background thread and remove the socket file
+        """
+        self._closed.set()
+        if self._wakeup is not None:
+            self._wakeup[1].send(b'\0')
+        if self._thread is not None:
+            self._thread.join()
+        if self._server is not None:
+            self._server.close()
+            self._wakeup[0].close()
+            self._wakeup[1].close()
+            self._server = None
+            try:
+                os.unlink(self.path)
+            except OSError:
+                pass
+        self.stream.flush()
+
+    def _bind(self):
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+        self._server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._server.bind(self.path)
+        self._server.listen(128)
+        self._wakeup = socket.socketpair()
+
+    def _receive(self, connection, data, batches):
+        """
+        :return: False if the connection has been closed
+        """
+        try:
+            chunk = connection.recv(262144)
+        except BlockingIOError:
+            return True
+        except OSError:
+            return False
+        if not chunk:
+            return False
+
+        data += chunk
+        offset = 0
+        while len(data) - offset >= _FRAME_HEADER.size:
+            size, = _FRAME_HEADER.unpack_from(data, offset)
+            if size > self.max_batch_size:
+                _logger.warning("Closing log collector connection sending a batch of %s bytes", size)
+                return False
+            end = offset + _FRAME_HEADER.size + size
+            if len(data) < end:
+                break
+            batches.append(bytes(data[offset + _FRAME_HEADER.size:end]))
+            offset = end
+        del data[:offset]
+        return True
+
+    def _discard(self, data):
+        if data:
+            self.discarded_batch_count += 1
+
+    def _write(self, batches):
+        self.received_batch_count += len(batches)
+        data = b''.join(batches)
+        try:
+            if self._buffer is not None:
+                # keep ordering with text already written to the stream
+                self.stream.flush()
+                self._buffer.write(data)
+                self._buffer.flush()
+            else:
+                self.stream.write(data.decode('utf-8', 'replace'))
+                self.stream.flush()
+        except Exception:
+            _logger.exception("Log collector failed to write %s bytes", len(data))
+
+    def _after_fork_in_child(self):
+        # the listening socket belongs to the parent, the socket file must not be removed by the child
+        if self._server is not None:
+            self._server.close()
+            self._wakeup[0].close()
+            self._wakeup[1].close()
+            self._server = None
+        self._thread = None
+        self._closed.set()
+
+
+class CollectorHandler(BufferedJSONStreamHandler):
+    """
+        BufferedJSONStreamHandler that ships its batches of lines to a LogCollector listening on the Unix socket
+        **path** instead of writing them to a shared stream. With **buffer_size** 0, every record is shipped on its
+        own. While the collector can't be reached, batches are written to **stream** and a reconnect is attempted
+        every **reconnect_interval** seconds.
+
+        Forked child processes open their own connection.
+    """
+
+    def __init__(self, path, stream=None, buffer_size=0, flush_interval=1.0, flush_level=logging.ERROR,
+                 reconnect_interval=1.0, record_encoding=None, framing=None):
+        """
+        :param path: path of the Unix socket of the collector
+        :param stream: fallback output stream, default to sys.stderr
+        :param record_encoding: see JSONStreamHandler
+        :param framing: see JSONStreamHandler
+        """
+        self.path = path
+        self.reconnect_interval = reconnect_interval
+        self._socket = None
+        self._next_connect = 0.0
+        super(CollectorHandler, self).__init__(stream, buffer_size=buffer_size,
+                                               flush_interval=flush_interval if buffer_size > 0 else None,
+                                               flush_level=flush_level, record_encoding=record_encoding,
+                                               framing=framing)
+
+    def flush(self):
+        """
+        ship all buffered lines to the collector, or write them to the fallback stream if it can't be reached
+        """
+        self.acquire()
+        try:
+            if not self._pending:
+                return
+            if self._buffer is not None:
+                data = b''.join(self._pending)
+            else:
+                data = ''.join(self._pending).encode('utf-8')
+            if self._send(data):
+                self._pending = []
+                self._pending_size = 0
+            else:
+                super(CollectorHandler, self).flush()
+        finally:
+            self.release()
+
+    def close(self):
+        try:
+            super(CollectorHandler, self).close()
+        finally:
+            self._disconnect()
+
+    def _send(self, data):
+        if self._socket is None:
+            if time.monotonic() < self._next_connect:
+                return False
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                sock.connect(self.path)
+            except OSError:
+                sock.close()
+                self._next_connect = time.monotonic() + self.reconnect_interval
+                return False
+            self._socket = sock
+
+        try:
+            self._socket.sendall(_FRAME_HEADER.pack(len(data)) + data)
+            return True
+        except OSError:
+            # the collector discards the partially sent batch
+            self._disconnect()
+            self._next_connect = time.monotonic() + self.reconnect_interval
+            return False
+
+    def _disconnect(self):
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
+
+    def _after_fork_in_child(self):
+        # the connection is shared with the parent, batches of both processes would interleave
+        self._disconnect()
+        self._next_connect = 0.0
+        super(CollectorHandler, self)._after_fork_in_child()
+
+
+if __name__ == '__main__':
+    collector = LogCollector(sys.argv[1])
+    try:
+        collector.serve()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        collector.close()
@@ -0,0 +1,51 @@
+# coding=utf-8
+import contextvars
+
+
+class RequestContext(object):
+    """
+        State of the request currently being processed. It is published by the request instrumentation through a
+        ContextVar, so it can be looked up in O(1) from any log statement and follows threads and asyncio tasks.
+    """
+    __slots__ = ('request', 'correlation_id', 'sampled', 'log_buffer')
+
+    def __init__(self, request):
+        self.request = request
+        self.correlation_id = None
+        # correlation id sampling decision, see json_logging.sampling.is_current_request_sampled
+        self.sampled = None
+        # records held back until the request completes, see json_logging.buffering
+        self.log_buffer = None
+
+
+_current_request_context = contextvars.ContextVar('json_logging_request_context', default=None)
+
+
+def get_request_context():
+    """
+    :return: RequestContext of the request currently being processed or None
+    """
+    return _current_request_context.get()
+
+
+def enter_request_context(request):
+    """
+    publish request as the request currently being processed
+
+    :param request: request object
+    :return: token to pass to exit_request_context
+    """
+    return _current_request_context.set(RequestContext(request))
+
+
+def exit_request_context(token):
+    """
+    restore the request context that was current before enter_request_context was called
+
+    :param token: token returned by enter_request_context
+    """
+    try:
+        _current_request_context.reset(token)
+    except ValueError:
+        # token was created in a different context e.g. hooks executed in different asyncio tasks
+        _current_request_context.set(None)
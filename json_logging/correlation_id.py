@@ -0,0 +1,112 @@
+# coding=utf-8
+"""
+    Correlation-id generators that can be used as json_logging.CORRELATION_ID_GENERATOR, e.g.
+
+        json_logging.CORRELATION_ID_GENERATOR = json_logging.correlation_id.ULIDGenerator()
+
+    All of them are safe to use from multiple threads and re-seed themselves in forked child processes,
+    so pre-fork workers never hand out the same ids.
+"""
+import base64
+import itertools
+import os
+import threading
+import time
+import weakref
+
+_CROCKFORD_BASE32 = bytes.maketrans(b'ABCDEFGHIJKLMNOPQRSTUVWXYZ234567', b'0123456789ABCDEFGHJKMNPQRSTVWXYZ')
+
+# random buffers & counters re-seeded in forked child processes
+_fork_aware_states = weakref.WeakSet()
+
+
+def _reset_states_after_fork():
+    for state in list(_fork_aware_states):
+        state._reset()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_states_after_fork)
+
+
+class _RandomBuffer(object):
+    """
+        Pre-filled buffer of os.urandom bytes, handed out in fixed size chunks
+    """
+
+    def __init__(self, chunk_size, chunks_per_refill=256):
+        self.chunk_size = chunk_size
+        self.refill_size = chunk_size * chunks_per_refill
+        self._reset()
+        _fork_aware_states.add(self)
+
+    def _reset(self):
+        self._lock = threading.Lock()
+        self._buffer = b''
+        self._position = 0
+
+    def take(self):
+        with self._lock:
+            position = self._position
+            if position >= len(self._buffer):
+                self._buffer = os.urandom(self.refill_size)
+                position = 0
+            self._position = position + self.chunk_size
+            return self._buffer[position:position + self.chunk_size]
+
+
+class CounterIdGenerator(object):
+    """
+        Cheapest generator: random per-process prefix followed by an incrementing counter, e.g. 3f9c0e1a7b2d4c5e-1f
+    """
+
+    def __init__(self):
+        self._reset()
+        _fork_aware_states.add(self)
+
+    def _reset(self):
+        self._prefix = os.urandom(8).hex()
+        self._counter = itertools.count(1)
+
+    def __call__(self):
+        return '%s-%x' % (self._prefix, next(self._counter))
+
+
+class ULIDGenerator(object):
+    """
+        Time-sortable ids following the ULID layout: 48 bit millisecond timestamp followed by 80 random bits,
+        encoded as 26 Crockford base32 characters, e.g. 01HF8Z3K9V4Q6W2N8C5T7R1M0B
+    """
+
+    def __init__(self):
+        self._random = _RandomBuffer(10)
+        self._encoded_millisecond = (None, None)
+
+    def __call__(self):
+        millisecond = int(time.time() * 1000) & 0xFFFFFFFFFFFF
+        cached_millisecond, encoded_time = self._encoded_millisecond
+        if cached_millisecond != millisecond:
+            # 2 leading zero bits + 48 bits are exactly 10 base32 characters
+            encoded_time = base64.b32encode((millisecond << 6).to_bytes(7, 'big'))[:10]
+            self._encoded_millisecond = (millisecond, encoded_time)
+
+        # 80 random bits are exactly 16 base32 characters
+        encoded = encoded_time + base64.b32encode(self._random.take())
+        return encoded.translate(_CROCKFORD_BASE32).decode('ascii')
+
+
+class BufferedUUID4Generator(object):
+    """
+        Random (version 4) UUIDs rendered from a pre-filled buffer of random bytes, e.g.
+        1b4e28ba-2fa1-41d2-883f-0016d3cca427
+    """
+
+    def __init__(self):
+        self._random = _RandomBuffer(16)
+
+    def __call__(self):
+        random_bytes = bytearray(self._random.take())
+        random_bytes[6] = random_bytes[6] & 0x0F | 0x40
+        random_bytes[8] = random_bytes[8] & 0x3F | 0x80
+        hex_ = random_bytes.hex()
+        return '%s-%s-%s-%s-%s' % (hex_[:8], hex_[8:12], hex_[12:16], hex_[16:20], hex_[20:])
@@ -1,13 +1,47 @@
+import time
 from datetime import datetime, timezone
 
+import json_logging
 from json_logging import util
 
+# fields of the request log extracted from request & response objects, in output order
+REQUEST_FIELDS = ('correlation_id', 'remote_user', 'request', 'referer', 'x_forwarded_for', 'protocol', 'method',
+                  'remote_ip', 'request_size_b', 'remote_host', 'remote_port')
+RESPONSE_FIELDS = ('response_status', 'response_size_b', 'response_content_type')
+
+_timestamp_renderer = util.TimestampRenderer()
+
+
+class RequestResponseSnapshot(object):
+    """
+        Compact copy of the request & response information of the request log, extracted in a single pass when the
+        request completes, so request and response objects are not needed anymore to format the request log
+    """
+    __slots__ = ('keys', 'values')
+
+    def __init__(self, keys, values):
+        """
+        :param keys: tuple of log object keys
+        :param values: tuple of values in order of keys
+        """
+        self.keys = keys
+        self.values = values
+
+    def write_fields(self, log_object):
+        for key, value in zip(self.keys, self.values):
+            log_object[key] = value
+
 
 class RequestResponseDTOBase(dict):
     """
         Data transfer object (DTO) for request instrumentation logging
         Served as base class for any actual RequestResponseDTO implementation
+
+        Besides **on_request_complete**, request instrumentations that are able to tell call **on_handler_complete**
+        and **on_first_byte**, every phase is timed with time.perf_counter_ns() relative to the creation of the DTO.
     """
+    __slots__ = ('_request', '_response', '_snapshot', '_start_epoch', '_start_ns', '_handler_complete_ns',
+                 '_first_byte_ns', '_end_ns', '_queue_time_ms', '__dict__', '__weakref__')
 
     def __init__(self, request, **kwargs):
         """
@@ -16,14 +50,83 @@ class RequestResponseDTOBase(dict):
         """
         super(RequestResponseDTOBase, self).__init__(**kwargs)
         self._request = request
+        self._snapshot = None
+        self._start_epoch = time.time()
+        self._start_ns = time.perf_counter_ns()
+        self._handler_complete_ns = None
+        self._first_byte_ns = None
+        self._end_ns = None
+        self._queue_time_ms = None
+
+    def set_request_start(self, start_epoch, start_ns):
+        """
+        backdate the start of the request, for DTOs created after the request started
+        :param start_epoch: time.time() when the request started
+        :param start_ns: time.perf_counter_ns() when the request started
+        """
+        self._start_epoch = start_epoch
+        self._start_ns = start_ns
+
+    def on_handler_complete(self):
+        """
+        invoked when the request handler produced the response status & headers
+        """
+        self._handler_complete_ns = time.perf_counter_ns()
+
+    def on_first_byte(self):
+        """
+        invoked when the first response body bytes are handed to the server
+        """
+        if self._first_byte_ns is None:
+            self._first_byte_ns = time.perf_counter_ns()
 
     def on_request_complete(self, response):
         """
         invoked when request complete, update response information into this object, must be called before invoke request logging statement
         :param response: response object
         """
+        self._end_ns = time.perf_counter_ns()
         self._response = response
 
+        request_util = json_logging._request_util
+        if request_util is not None:
+            self._queue_time_ms = self._get_queue_time_ms(request_util)
+            if json_logging.RELEASE_REQUEST_RESPONSE_OBJECTS:
+                # taken when the request log is formatted otherwise, e.g. not at all for dropped records
+                self._snapshot = request_util.create_snapshot(self._request, response)
+                self._request = None
+                self._response = None
+
+    def _get_queue_time_ms(self, request_util):
+        for header_name in json_logging.REQUEST_START_HEADERS:
+            request_start = util.parse_request_start_time(
+                request_util.request_adapter.get_http_header(self._request, header_name))
+            if request_start is not None:
+                # wall clock of the proxy, can't be measured with a monotonic clock
+                return max(0, int((self._start_epoch - request_start) * 1000))
+        return None
+
+    def write_latency_fields(self):
+        """
+        write the latency breakdown fields that have been measured: **queue_time_ms**, **handler_time_ms**,
+        **ttfb_ms** and **total_time_ms**
+        """
+        if self._queue_time_ms is not None:
+            self["queue_time_ms"] = self._queue_time_ms
+        if self._handler_complete_ns is not None:
+            self["handler_time_ms"] = (self._handler_complete_ns - self._start_ns) // 1000000
+        if self._first_byte_ns is not None:
+            self["ttfb_ms"] = (self._first_byte_ns - self._start_ns) // 1000000
+        if self._end_ns is not None:
+            self["total_time_ms"] = (self._end_ns - self._start_ns) // 1000000
+
+    def render_fields(self):
+        """
+        invoked by the request log formatter right before this object is serialized, render any field whose
+        rendering has been deferred into this object
+        """
+        pass
+
 
 class DefaultRequestResponseDTO(RequestResponseDTOBase):
     """
@@ -32,7 +135,13 @@ class DefaultRequestResponseDTO(RequestResponseDTOBase):
 
     def __init__(self, request, **kwargs):
         super(DefaultRequestResponseDTO, self).__init__(request, **kwargs)
-        utcnow = datetime.now(timezone.utc)
+        utcnow = datetime.fromtimestamp(self._start_epoch, timezone.utc)
+        self._request_start = utcnow
+        self["request_received_at"] = util.iso_time_format(utcnow)
+
+    def set_request_start(self, start_epoch, start_ns):
+        super(DefaultRequestResponseDTO, self).set_request_start(start_epoch, start_ns)
+        utcnow = datetime.fromtimestamp(start_epoch, timezone.utc)
         self._request_start = utcnow
         self["request_received_at"] = util.iso_time_format(utcnow)
 
@@ -43,3 +152,25 @@ class DefaultRequestResponseDTO(RequestResponseDTOBase):
         time_delta = utcnow - self._request_start
         self["response_time_ms"] = int(time_delta.total_seconds()) * 1000 + int(time_delta.microseconds / 1000)
         self["response_sent_at"] = util.iso_time_format(utcnow)
+        self.write_latency_fields()
+
+
+class LightweightRequestResponseDTO(RequestResponseDTOBase):
+    """
+        Allocation-light implementation: captures a single epoch timestamp and a monotonic clock reading, response
+        time is measured with time.perf_counter_ns(). Timestamps are only rendered when the request log is
+        formatted. In addition to the default fields, **response_time_us** holds the sub-millisecond response time.
+    """
+    __slots__ = ()
+
+    def render_fields(self):
+        if 'request_received_at' in self:
+            return
+
+        self["request_received_at"] = _timestamp_renderer.render(self._start_epoch)[0]
+        if self._end_ns is not None:
+            duration_ns = self._end_ns - self._start_ns
+            self["response_time_ms"] = duration_ns // 1000000
+            self["response_time_us"] = duration_ns // 1000
+            self["response_sent_at"] = _timestamp_renderer.render(self._start_epoch + duration_ns / 1e9)[0]
+        self.write_latency_fields()
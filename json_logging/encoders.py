@@ -0,0 +1,453 @@
+# coding=utf-8
+import json
+import struct
+
+
+class EncoderBackend(object):
+    """
+        JSON encoder backend. Both functions must keep json.dumps(default=str) semantics: objects that can not be
+        serialized natively are rendered with str()
+
+        - **dumps**: encode object to JSON str
+        - **dumps_bytes**: encode object to UTF-8 encoded JSON bytes
+    """
+
+    def __init__(self, name, dumps, dumps_bytes):
+        self.name = name
+        self.dumps = dumps
+        self.dumps_bytes = dumps_bytes
+
+    def __repr__(self):
+        return '<EncoderBackend %s>' % self.name
+
+
+def _stdlib_dumps(obj):
+    return json.dumps(obj, ensure_ascii=False, default=str)
+
+
+def _stdlib_dumps_bytes(obj):
+    return _stdlib_dumps(obj).encode('utf-8')
+
+
+def load_stdlib_backend():
+    return EncoderBackend('json', _stdlib_dumps, _stdlib_dumps_bytes)
+
+
+def load_orjson_backend():
+    import orjson
+
+    # let default=str render datetime & dataclass objects like json.dumps does
+    option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+    orjson_dumps = orjson.dumps
+
+    def dumps_bytes(obj):
+        try:
+            return orjson_dumps(obj, default=str, option=option)
+        except TypeError:
+            # e.g. integers exceeding 64 bit, fallback to stdlib
+            return _stdlib_dumps_bytes(obj)
+
+    def dumps(obj):
+        return dumps_bytes(obj).decode('utf-8')
+
+    return EncoderBackend('orjson', dumps, dumps_bytes)
+
+
+def load_ujson_backend():
+    import ujson
+
+    ujson_dumps = ujson.dumps
+    options = {'ensure_ascii': False, 'escape_forward_slashes': False}
+    try:
+        ujson_dumps(None, default=str, **options)
+        options['default'] = str
+    except TypeError:
+        # ujson < 5.5 has no default, objects it can't serialize are rendered by the stdlib fallback
+        pass
+
+    def dumps(obj):
+        try:
+            return ujson_dumps(obj, **options)
+        except (TypeError, OverflowError):
+            return _stdlib_dumps(obj)
+
+    def dumps_bytes(obj):
+        return dumps(obj).encode('utf-8')
+
+    return EncoderBackend('ujson', dumps, dumps_bytes)
+
+
+# name selecting the fastest available backend, whose output may differ from json.dumps in whitespace and in
+# how it renders NaN and infinite floats
+AUTO_ENCODER_BACKEND = 'auto'
+
+# registered backend loaders, auto-selection tries the most recently registered one first
+_encoder_backend_loaders = {}
+_loaded_backends = {}
+
+
+def register_encoder_backend(name, loader):
+    """
+    register an encoder backend. Backends registered later take precedence in auto-selection
+
+    :param name: name of backend
+    :param loader: callable returning an EncoderBackend, raise ImportError if backend is not available
+    """
+    if not name:
+        raise RuntimeError("encoder backend name can not be null or empty")
+
+    _encoder_backend_loaders.pop(name, None)
+    _loaded_backends.pop(name, None)
+    _encoder_backend_loaders[name] = loader
+
+
+def get_encoder_backend(name=None):
+    """
+    get encoder backend by name. If no name is given, the fastest available backend is selected
+
+    :param name: name of a registered backend, AUTO_ENCODER_BACKEND or None for auto-selection
+    :return: EncoderBackend instance
+    """
+    if name and name != AUTO_ENCODER_BACKEND:
+        if name not in _encoder_backend_loaders:
+            raise RuntimeError(name + " is not a registered encoder backend")
+        return _load_backend(name)
+
+    for candidate in reversed(list(_encoder_backend_loaders)):
+        try:
+            return _load_backend(candidate)
+        except ImportError:
+            continue
+
+    return load_stdlib_backend()
+
+
+def _load_backend(name):
+    if name not in _loaded_backends:
+        _loaded_backends[name] = _encoder_backend_loaders[name]()
+    return _loaded_backends[name]
+
+
+register_encoder_backend('json', load_stdlib_backend)
+register_encoder_backend('ujson', load_ujson_backend)
+register_encoder_backend('orjson', load_orjson_backend)
+
+
+class MsgpackExt(object):
+    """
+        MessagePack extension type, e.g. the EventTime of the Fluent Forward protocol
+    """
+    __slots__ = ('code', 'data')
+
+    def __init__(self, code, data):
+        self.code = code
+        self.data = data
+
+
+def msgpack_dumps(obj):
+    """
+    encode object to MessagePack with the msgpack package if it is installed, with a built-in packer otherwise.
+    Like the JSON backends, objects that can not be packed natively are rendered with str()
+
+    :param obj: object to encode
+    :return: bytes
+    """
+    global _msgpack_packb
+    if _msgpack_packb is None:
+        _msgpack_packb = _load_msgpack_packb()
+    return _msgpack_packb(obj)
+
+
+_msgpack_packb = None
+
+
+def _load_msgpack_packb():
+    try:
+        import msgpack
+    except ImportError:
+        return _pack_msgpack
+
+    ext_type = msgpack.ExtType
+    packb = msgpack.packb
+
+    def default(obj):
+        if isinstance(obj, MsgpackExt):
+            return ext_type(obj.code, obj.data)
+        return str(obj)
+
+    def dumps(obj):
+        try:
+            return packb(obj, default=default, use_bin_type=True)
+        except (OverflowError, ValueError, TypeError):
+            # e.g. integers exceeding 64 bit, fallback to built-in packer
+            return _pack_msgpack(obj)
+
+    return dumps
+
+
+def _pack_msgpack(obj):
+    parts = []
+    _pack(obj, parts.append)
+    return b''.join(parts)
+
+
+_FIXEXT_CODES = {1: 0xd4, 2: 0xd5, 4: 0xd6, 8: 0xd7, 16: 0xd8}
+_UINT_FORMATS = ((0x100, 0xcc, '>BB'), (0x10000, 0xcd, '>BH'), (0x100000000, 0xce, '>BI'),
+                 (0x10000000000000000, 0xcf, '>BQ'))
+_INT_FORMATS = ((-0x80, 0xd0, '>Bb'), (-0x8000, 0xd1, '>Bh'), (-0x80000000, 0xd2, '>Bi'),
+                (-0x8000000000000000, 0xd3, '>Bq'))
+
+
+def _pack_length(append, length, fix_code, fix_limit, codes):
+    if length < fix_limit:
+        append(struct.pack('B', fix_code | length))
+    elif codes[0] is not None and length < 0x100:
+        append(struct.pack('>BB', codes[0], length))
+    elif length < 0x10000:
+        append(struct.pack('>BH', codes[1], length))
+    else:
+        append(struct.pack('>BI', codes[2], length))
+
+
+def _pack(obj, append):
+    if obj is None:
+        append(b'\xc0')
+    elif obj is True:
+        append(b'\xc3')
+    elif obj is False:
+        append(b'\xc2')
+    elif isinstance(obj, int):
+        if 0 <= obj < 0x80 or -0x20 <= obj < 0:
+            append(struct.pack('b' if obj < 0 else 'B', obj))
+        elif 0 <= obj < 0x10000000000000000:
+            for limit, code, fmt in _UINT_FORMATS:
+                if obj < limit:
+                    append(struct.pack(fmt, code, obj))
+                    break
+        elif -0x8000000000000000 <= obj < 0:
+            for limit, code, fmt in _INT_FORMATS:
+                if obj >= limit:
+                    append(struct.pack(fmt, code, obj))
+                    break
+        else:
+            _pack(str(obj), append)
+    elif isinstance(obj, float):
+        append(struct.pack('>Bd', 0xcb, obj))
+    elif isinstance(obj, str):
+        data = obj.encode('utf-8', 'surrogatepass')
+        _pack_length(append, len(data), 0xa0, 0x20, (0xd9, 0xda, 0xdb))
+        append(data)
+    elif isinstance(obj, (bytes, bytearray, memoryview)):
+        data = bytes(obj)
+        _pack_length(append, len(data), 0, 0, (0xc4, 0xc5, 0xc6))
+        append(data)
+    elif isinstance(obj, (list, tuple)):
+        _pack_length(append, len(obj), 0x90, 0x10, (None, 0xdc, 0xdd))
+        for item in obj:
+            _pack(item, append)
+    elif isinstance(obj, dict):
+        _pack_length(append, len(obj), 0x80, 0x10, (None, 0xde, 0xdf))
+        for key, value in obj.items():
+            _pack(key, append)
+            _pack(value, append)
+    elif isinstance(obj, MsgpackExt):
+        length = len(obj.data)
+        if length in _FIXEXT_CODES:
+            append(struct.pack('>Bb', _FIXEXT_CODES[length], obj.code))
+        else:
+            _pack_length(append, length, 0, 0, (0xc7, 0xc8, 0xc9))
+            append(struct.pack('b', obj.code))
+        append(obj.data)
+    else:
+        _pack(str(obj), append)
+
+
+# header of length-prefixed records: size of the encoded record, big endian
+LENGTH_PREFIX = struct.Struct('>I')
+
+
+def iter_length_prefixed(stream):
+    """
+    read length-prefixed records, e.g. written with LOG_OUTPUT_FRAMING 'length_prefixed'. Records can be
+    skipped without being decoded
+
+    :param stream: binary stream
+    :return: iterator of encoded records as bytes, a truncated last record is not returned
+    """
+    while True:
+        header = stream.read(LENGTH_PREFIX.size)
+        if len(header) < LENGTH_PREFIX.size:
+            return
+        size, = LENGTH_PREFIX.unpack(header)
+        data = stream.read(size)
+        if len(data) < size:
+            return
+        yield data
+
+
+class RecordEncoding(object):
+    """
+        Binary encoding of log objects, alternative to JSON text. **encode** must keep json.dumps(default=str)
+        semantics: objects that can not be encoded natively are rendered with str()
+
+        - **encode**: encode object to bytes
+    """
+
+    def __init__(self, name, encode):
+        self.name = name
+        self.encode = encode
+
+    def __repr__(self):
+        return '<RecordEncoding %s>' % self.name
+
+
+def load_msgpack_encoding():
+    return RecordEncoding('msgpack', msgpack_dumps)
+
+
+def load_cbor_encoding():
+    return RecordEncoding('cbor', cbor_dumps)
+
+
+_record_encoding_loaders = {}
+_loaded_record_encodings = {}
+
+
+def register_record_encoding(name, loader):
+    """
+    register a binary record encoding
+
+    :param name: name of encoding
+    :param loader: callable returning a RecordEncoding, raise ImportError if encoding is not available
+    """
+    if not name:
+        raise RuntimeError("record encoding name can not be null or empty")
+
+    _loaded_record_encodings.pop(name, None)
+    _record_encoding_loaders[name] = loader
+
+
+def get_record_encoding(name):
+    """
+    get binary record encoding by name
+
+    :param name: name of a registered encoding, None or 'json' for JSON text
+    :return: RecordEncoding instance or None for JSON text
+    """
+    if not name or name == 'json':
+        return None
+    if name not in _record_encoding_loaders:
+        raise RuntimeError(name + " is not a registered record encoding")
+    if name not in _loaded_record_encodings:
+        _loaded_record_encodings[name] = _record_encoding_loaders[name]()
+    return _loaded_record_encodings[name]
+
+
+register_record_encoding('msgpack', load_msgpack_encoding)
+register_record_encoding('cbor', load_cbor_encoding)
+
+
+def cbor_dumps(obj):
+    """
+    encode object to CBOR (RFC 8949) with the cbor2 package if it is installed, with a built-in encoder otherwise.
+    Objects that can not be encoded natively are rendered with str()
+
+    :param obj: object to encode
+    :return: bytes
+    """
+    global _cbor_dumps
+    if _cbor_dumps is None:
+        _cbor_dumps = _load_cbor_dumps()
+    return _cbor_dumps(obj)
+
+
+_cbor_dumps = None
+
+
+def _load_cbor_dumps():
+    try:
+        import cbor2
+    except ImportError:
+        return _encode_cbor
+
+    cbor2_dumps = cbor2.dumps
+
+    def dumps(obj):
+        return cbor2_dumps(_normalize_cbor(obj))
+
+    return dumps
+
+
+def _normalize_cbor(obj):
+    """
+    cbor2 writes e.g. datetime, Decimal, UUID and set values with CBOR tags, render them with str() like the
+    built-in encoder so records carry the same values whether cbor2 is installed or not
+    """
+    if obj is None or obj is True or obj is False or isinstance(obj, (str, float, bytes)):
+        return obj
+    if isinstance(obj, int):
+        return obj if -0x10000000000000000 <= obj < 0x10000000000000000 else str(obj)
+    if isinstance(obj, dict):
+        return {_normalize_cbor(key): _normalize_cbor(value) for key, value in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_normalize_cbor(item) for item in obj]
+    if isinstance(obj, (bytearray, memoryview)):
+        return bytes(obj)
+    return str(obj)
+
+
+def _encode_cbor(obj):
+    parts = []
+    _encode_cbor_item(obj, parts.append)
+    return b''.join(parts)
+
+
+def _encode_cbor_head(append, major_type, value):
+    major_type <<= 5
+    if value < 24:
+        append(struct.pack('B', major_type | value))
+    elif value < 0x100:
+        append(struct.pack('>BB', major_type | 24, value))
+    elif value < 0x10000:
+        append(struct.pack('>BH', major_type | 25, value))
+    elif value < 0x100000000:
+        append(struct.pack('>BI', major_type | 26, value))
+    else:
+        append(struct.pack('>BQ', major_type | 27, value))
+
+
+def _encode_cbor_item(obj, append):
+    if obj is None:
+        append(b'\xf6')
+    elif obj is True:
+        append(b'\xf5')
+    elif obj is False:
+        append(b'\xf4')
+    elif isinstance(obj, int):
+        if 0 <= obj < 0x10000000000000000:
+            _encode_cbor_head(append, 0, obj)
+        elif -0x10000000000000000 <= obj < 0:
+            _encode_cbor_head(append, 1, -1 - obj)
+        else:
+            _encode_cbor_item(str(obj), append)
+    elif isinstance(obj, float):
+        append(struct.pack('>Bd', 0xfb, obj))
+    elif isinstance(obj, str):
+        data = obj.encode('utf-8', 'surrogatepass')
+        _encode_cbor_head(append, 3, len(data))
+        append(data)
+    elif isinstance(obj, (bytes, bytearray, memoryview)):
+        data = bytes(obj)
+        _encode_cbor_head(append, 2, len(data))
+        append(data)
+    elif isinstance(obj, (list, tuple)):
+        _encode_cbor_head(append, 4, len(obj))
+        for item in obj:
+            _encode_cbor_item(item, append)
+    elif isinstance(obj, dict):
+        _encode_cbor_head(append, 5, len(obj))
+        for key, value in obj.items():
+            _encode_cbor_item(key, append)
+            _encode_cbor_item(value, append)
+    else:
+        _encode_cbor_item(str(obj), append)
@@ -0,0 +1,290 @@
+# coding=utf-8
+import atexit
+import collections
+import logging
+import threading
+import time
+import weakref
+
+import json_logging
+from json_logging import sampling
+from json_logging.buffering import HELD_BACK_ATTR
+from json_logging.context import get_request_context
+from json_logging.formatters import LOG_RECORD_BUILT_IN_ATTRS
+
+
+REPEAT_COUNT_ATTR = 'repeat_count'
+# record attribute holding the decision of the first DeduplicationFilter that saw the record: True if it passed,
+# the loggers & handlers it has been suppressed for otherwise
+DEDUPLICATION_ATTR = 'json_logging_deduplication'
+LOG_RECORD_BUILT_IN_ATTRS.append(DEDUPLICATION_ATTR)
+# call sites with suppressed records are checked for expired windows at most this often, in seconds
+_SUMMARY_INTERVAL = 1.0
+
+# filters whose pending summaries are written at exit, before logging.shutdown closes the handlers
+_deduplication_filters = weakref.WeakSet()
+
+
+def flush_deduplication_filters():
+    """
+    write the summary records of all call sites with suppressed records, see DeduplicationFilter.flush
+    """
+    for log_filter in list(_deduplication_filters):
+        log_filter.flush()
+
+
+atexit.register(flush_deduplication_filters)
+
+
+class _CallSite(object):
+    __slots__ = ('window_start', 'tokens', 'updated', 'suppressed', 'last_record')
+
+    def __init__(self, now, tokens):
+        self.window_start = now
+        self.tokens = tokens
+        self.updated = now
+        self.suppressed = 0
+        self.last_record = None
+
+
+class DeduplicationFilter(logging.Filter):
+    """
+        Suppresses repeated records per call site, keyed by (logger name, pathname, lineno, msg template), before
+        they are formatted:
+
+        - **window**: after a record has been written, further records of its call site are suppressed for this
+          many seconds
+        - **rate_limit**: at most this many records per second and call site are written (token bucket holding
+          up to **burst** tokens)
+
+        Request logs are never suppressed. Once a call site may write again, the last record suppressed is written
+        as summary, with the number of records suppressed as **repeat_count** field. Expired call sites are checked
+        for while records pass the filter, pending summaries are written by flush, at exit or when the call site is
+        evicted.
+
+        A record reaching several DeduplicationFilters, e.g. on its logger and on the handlers it propagates to, is
+        only counted by the first one. The others follow its decision, the summary is handed to each of them.
+    """
+
+    def __init__(self, window=None, rate_limit=None, burst=None, max_call_sites=10000, target=None):
+        """
+        :param window: seconds repeats are suppressed after a record has been written, None to disable
+        :param rate_limit: records written per second and call site, None to disable
+        :param burst: max number of records written at once after a quiet period, default to rate_limit
+        :param max_call_sites: number of call sites tracked, the least recently logged one is evicted beyond
+        :param target: logger or handler this filter is attached to, summary records are handed to it. Default to
+            the logger of the record
+        """
+        super(DeduplicationFilter, self).__init__()
+        self.window = window
+        self.rate_limit = rate_limit
+        self.burst = float(burst if burst else max(rate_limit or 1, 1))
+        self.max_call_sites = max_call_sites
+        self.target = target
+        self._call_sites = collections.OrderedDict()
+        # keys of call sites with suppressed records
+        self._pending = set()
+        self._summarized_at = time.monotonic()
+        self._lock = threading.Lock()
+        _deduplication_filters.add(self)
+
+    def filter(self, record):
+        if REPEAT_COUNT_ATTR in record.__dict__ or 'request_response_data' in record.__dict__:
+            # summary record or request log, all request logs share one call site
+            return True
+
+        decision = record.__dict__.get(DEDUPLICATION_ATTR)
+        if decision is True:
+            return True
+        if decision is not None:
+            # suppressed by the filter of a logger or handler the record passed before
+            decision.append(self.target)
+            return False
+
+        key = (record.name, record.pathname, record.lineno, record.msg)
+        now = time.monotonic()
+        summaries = []
+        with self._lock:
+            if self._pending and now - self._summarized_at >= _SUMMARY_INTERVAL:
+                self._summarized_at = now
+                for pending_key in list(self._pending):
+                    self._take_summary(pending_key, now, summaries)
+
+            try:
+                call_site = self._call_sites.get(key)
+            except TypeError:
+                # unhashable msg
+                passed = True
+            else:
+                passed = self._pass(key, call_site, record, now, summaries)
+
+        for summary in summaries:
+            self._write_summary(summary)
+        record.__dict__[DEDUPLICATION_ATTR] = True if passed else [self.target]
+        return passed
+
+    def flush(self):
+        """
+        write the summary records of all call sites with suppressed records, even if they may not write yet
+        """
+        with self._lock:
+            summaries = [self._summarize(key, self._call_sites[key]) for key in list(self._pending)]
+        for summary in summaries:
+            self._write_summary(summary)
+
+    def _pass(self, key, call_site, record, now, summaries):
+        if call_site is None:
+            if len(self._call_sites) >= self.max_call_sites:
+                evicted_key, evicted = self._call_sites.popitem(last=False)
+                if evicted.suppressed:
+                    summaries.append(self._summarize(evicted_key, evicted))
+            self._call_sites[key] = _CallSite(now, self.burst - 1.0)
+            return True
+
+        self._call_sites.move_to_end(key)
+        if key in self._pending:
+            # write the summary first, the record may be suppressed again
+            self._take_summary(key, now, summaries)
+        if not self._may_write(call_site, now):
+            call_site.suppressed += 1
+            call_site.last_record = record
+            self._pending.add(key)
+            return False
+        return True
+
+    def _may_write(self, call_site, now):
+        """
+        take a token from the call site if it may write a record now
+        """
+        if self.window is not None and now - call_site.window_start < self.window:
+            return False
+
+        if self.rate_limit is not None:
+            call_site.tokens = min(self.burst, call_site.tokens + (now - call_site.updated) * self.rate_limit)
+            call_site.updated = now
+            if call_site.tokens < 1.0:
+                return False
+            call_site.tokens -= 1.0
+
+        call_site.window_start = now
+        return True
+
+    def _take_summary(self, key, now, summaries):
+        call_site = self._call_sites[key]
+        if self._may_write(call_site, now):
+            summaries.append(self._summarize(key, call_site))
+
+    def _summarize(self, key, call_site):
+        """
+        :return: last record suppressed at call_site, with the number of records suppressed
+        """
+        self._pending.discard(key)
+        summary = call_site.last_record
+        setattr(summary, REPEAT_COUNT_ATTR, call_site.suppressed)
+        call_site.suppressed = 0
+        call_site.last_record = None
+        return summary
+
+    def _write_summary(self, summary):
+        for target in summary.__dict__.pop(DEDUPLICATION_ATTR):
+            if target is None:
+                target = logging.getLogger(summary.name)
+            target.handle(summary)
+
+
+def add_deduplication_filter(logger):
+    """
+    add a DeduplicationFilter configured by json_logging.LOG_DEDUPLICATION_WINDOW & json_logging.LOG_RATE_LIMIT
+    to logger and its handlers, unless they already have one. Records of logger are deduplicated before they are
+    handed to any handler, including handlers added later. Records propagated from other loggers are deduplicated
+    by the handlers of logger.
+
+    :param logger: logging.Logger
+    """
+    for filterer in [logger] + logger.handlers:
+        if not any(isinstance(log_filter, DeduplicationFilter) for log_filter in filterer.filters):
+            filterer.addFilter(DeduplicationFilter(window=json_logging.LOG_DEDUPLICATION_WINDOW,
+                                                   rate_limit=json_logging.LOG_RATE_LIMIT,
+                                                   burst=json_logging.LOG_RATE_LIMIT_BURST,
+                                                   max_call_sites=json_logging.LOG_DEDUPLICATION_MAX_CALL_SITES,
+                                                   target=filterer))
+
+
+class CorrelationIdSamplingFilter(logging.Filter):
+    """
+        Drops records logged while processing a request whose correlation id is not sampled, see
+        json_logging.CORRELATION_ID_SAMPLE_RATE. Records logged outside of requests always pass.
+
+        It must run in the thread that logs the record, so it's attached to an AsyncHandler rather than to its
+        target.
+    """
+
+    def filter(self, record):
+        return sampling.is_current_request_sampled()
+
+
+class RequestLogBufferFilter(logging.Filter):
+    """
+        Holds back records below json_logging.REQUEST_LOG_BUFFER_LEVEL logged while processing a request, until the
+        request completes (see json_logging.buffering). Records logged outside of requests always pass.
+    """
+
+    def __init__(self, target):
+        """
+        :param target: logger (or handler) this filter is attached to, records are handed to it again when flushed
+        """
+        super(RequestLogBufferFilter, self).__init__()
+        self.target = target
+
+    def filter(self, record):
+        held_back = record.__dict__.get(HELD_BACK_ATTR)
+        if held_back is not None:
+            # buffered by the filter of a logger or handler the record passed before
+            held_back.append(self.target)
+            return False
+        if record.levelno >= json_logging.REQUEST_LOG_BUFFER_LEVEL:
+            return True
+        context = get_request_context()
+        if context is None or context.log_buffer is None:
+            return True
+        context.log_buffer.append(self.target, record)
+        return False
+
+
+def has_request_filters(filterer):
+    """
+    :return: True if logger or handler has the filters added by add_request_filters
+    """
+    return any(isinstance(log_filter, (CorrelationIdSamplingFilter, RequestLogBufferFilter))
+               for log_filter in filterer.filters)
+
+
+def add_request_filters(logger):
+    """
+    add the filters that sample and buffer records logged while processing requests to logger and its handlers,
+    unless they already have them. Records of logger are sampled and buffered before they are handed to any
+    handler, including handlers added later. Records propagated from other loggers are sampled and buffered by the
+    handlers of logger. Each record is buffered once.
+
+    :param logger: logging.Logger
+    """
+    for filterer in [logger] + logger.handlers:
+        if not has_request_filters(filterer):
+            filterer.addFilter(CorrelationIdSamplingFilter())
+            filterer.addFilter(RequestLogBufferFilter(filterer))
+
+
+def move_filters(handler, new_handler):
+    """
+    move the filters added by add_request_filters & add_deduplication_filter from handler to new_handler, which
+    wraps or replaces it
+
+    :param handler: logging.Handler
+    :param new_handler: logging.Handler
+    """
+    for log_filter in list(handler.filters):
+        if isinstance(log_filter, (CorrelationIdSamplingFilter, RequestLogBufferFilter, DeduplicationFilter)):
+            handler.removeFilter(log_filter)
+            if getattr(log_filter, 'target', None) is handler:
+                log_filter.target = new_handler
+            new_handler.addFilter(log_filter)
@@ -1,9 +1,9 @@
 import logging
+import operator
 import sys
-import traceback
-from datetime import datetime, timezone
 
 import json_logging
+from json_logging import tracebacks, limits
 
 # The list contains all the attributes listed in that will not be overwritten by custom extra props
 # http://docs.python.org/library/logging.html#logrecord-attributes
@@ -16,6 +16,19 @@ LOG_RECORD_BUILT_IN_ATTRS = [
     'props',
 ]
 
+EXCEPTION_FORMAT_TEXT = 'text'
+EXCEPTION_FORMAT_STRUCTURED = 'structured'
+
+# record attribute holding fields resolved by prepare_record in the logging thread
+PREPARED_FIELDS_ATTR = 'json_logging_prepared_fields'
+LOG_RECORD_BUILT_IN_ATTRS.append(PREPARED_FIELDS_ATTR)
+# record attribute holding the exception fields rendered by prepare_record, exc_info can then be released
+PREPARED_EXC_FIELDS_ATTR = 'json_logging_prepared_exc_fields'
+LOG_RECORD_BUILT_IN_ATTRS.append(PREPARED_EXC_FIELDS_ATTR)
+
+# max number of cached static JSON fragments per formatter, e.g. distinct (logger, level, module) combinations
+STATIC_FRAGMENT_CACHE_SIZE = 1024
+
 # python 2 compatible check
 try:
     basestring
@@ -38,14 +51,82 @@ def _sanitize_log_msg(record):
     return record.getMessage().replace('\n', '_').replace('\r', '_').replace('\t', '_')
 
 
+class _StaticFieldsFragment(object):
+    """
+        Static fields of a log object, pre-serialized per writer of static fields, e.g. '"type": "log", "logger":
+        "app"'. The dynamic field plan writes a placeholder field where each non-empty group of static fields
+        belongs, the serialized placeholders are then replaced by the serialized groups, so fields keep the order
+        of a full render.
+    """
+    __slots__ = ('keys', 'placeholders', 'text_replacements', 'data_replacements', 'reserved_bytes')
+
+    def __init__(self, static_field_groups, serializer):
+        keys = set()
+        self.placeholders = []
+        self.text_replacements = []
+        for slot, static_fields in enumerate(static_field_groups):
+            keys.update(static_fields)
+            if not static_fields:
+                self.placeholders.append(None)
+                continue
+            placeholder = _STATIC_FIELDS_PLACEHOLDERS[slot]
+            self.placeholders.append(placeholder)
+            # '"<placeholder>": 0' as rendered by the serializer, control characters are always escaped in JSON
+            # strings and quotes within strings too, so the serialized placeholder can't occur anywhere else
+            self.text_replacements.append((serializer({placeholder: 0})[1:-1], serializer(static_fields)[1:-1]))
+
+        self.keys = frozenset(keys)
+        self.data_replacements = [(token.encode('utf-8'), text.encode('utf-8'))
+                                  for token, text in self.text_replacements]
+        # with the separator of each group
+        self.reserved_bytes = sum(len(data) + 2 for _, data in self.data_replacements)
+
+    def splice_text(self, text):
+        for token, fields_text in self.text_replacements:
+            text = text.replace(token, fields_text, 1)
+        return text
+
+    def splice_data(self, data):
+        for token, fields_data in self.data_replacements:
+            data = data.replace(token, fields_data, 1)
+        return data
+
+
+# keys of placeholder fields, one per writer of static fields
+_STATIC_FIELDS_PLACEHOLDERS = ['\x00%d' % slot for slot in range(8)]
+
+
+def _get_no_key(record):
+    return None
+
+
+def _is_spliceable(serializer):
+    # other serializers may not render compact objects, e.g. indented ones
+    return serializer is json_logging._encoder_backend.dumps or serializer is json_logging._default_json_serializer
+
+
 class BaseJSONFormatter(logging.Formatter):
     """
        Base class for JSON formatters
+
+       Log objects are rendered in a single pass from a field plan that is compiled once per formatter instance:
+       each class in the hierarchy lists, in **_field_writers**, the methods that write its fields straight into
+       the log object. Subclasses which override **_format_log_object** without declaring their own
+       **_field_writers** are rendered through the layered **_format_log_object** chain as before.
+
+       Writers listed in **_static_field_writers** write fields that only depend on the formatter and on the record
+       attributes listed in **_static_field_key_attrs**. These fields are serialized once per distinct value of
+       those attributes into cached JSON fragments which are spliced into each line at the position of their
+       writer, only the remaining fields are serialized per record. Splicing requires the default JSON_SERIALIZER
+       or the one of the encoder backend.
     """
-    base_object_common = {}
+    _field_writers = ('_write_base_fields', '_write_component_fields', '_write_extra_fields')
+    _static_field_writers = ('_write_component_fields',)
+    _static_field_key_attrs = ()
 
     def __init__(self, *args, **kw):
         super(BaseJSONFormatter, self).__init__(*args, **kw)
+        self.base_object_common = {}
         if json_logging.COMPONENT_ID and json_logging.COMPONENT_ID != json_logging.EMPTY_VALUE:
             self.base_object_common["component_id"] = json_logging.COMPONENT_ID
         if json_logging.COMPONENT_NAME and json_logging.COMPONENT_NAME != json_logging.EMPTY_VALUE:
@@ -53,27 +134,217 @@ class BaseJSONFormatter(logging.Formatter):
         if json_logging.COMPONENT_INSTANCE_INDEX and json_logging.COMPONENT_INSTANCE_INDEX != json_logging.EMPTY_VALUE:
             self.base_object_common["component_instance_idx"] = json_logging.COMPONENT_INSTANCE_INDEX
 
+        self._timestamp_renderer = json_logging.util.TimestampRenderer(coarse=json_logging.TIMESTAMP_COARSE_CLOCK)
+        self._custom_format = type(self).format is not BaseJSONFormatter.format
+        self._custom_extra_fields = type(self)._get_extra_fields is not BaseJSONFormatter._get_extra_fields
+        self._size_limiter = limits.get_size_limiter()
+        self._max_extra_fields = self._size_limiter.max_extra_fields if self._size_limiter is not None else None
+        self._field_plan = self._compile_field_plan()
+        self._spliced_field_plan, self._static_field_plan, self._get_static_fields_key = \
+            self._compile_static_field_plan()
+        self._static_fragments = {}
+        self._static_fragments_serializer = None
+
     def format(self, record):
         """
             Format the specified record as text. Overriding default python logging implementation
         """
-        log_object = self._format_log_object(record, request_util=json_logging._request_util)
-        return json_logging.JSON_SERIALIZER(log_object)
+        serializer = json_logging.JSON_SERIALIZER
+        if self._static_field_plan is not None and _is_spliceable(serializer):
+            log_object, fragment = self._render_dynamic_log_object(record, json_logging._request_util, serializer)
+            if fragment is not None:
+                return fragment.splice_text(serializer(log_object))
+            return serializer(log_object)
 
-    def _format_log_object(self, record, request_util):
-        utcnow = datetime.now(timezone.utc).replace(tzinfo=None)
+        log_object = self._render_log_object(record, request_util=json_logging._request_util)
+        return serializer(log_object)
 
-        base_obj = {
-            "written_at": json_logging.util.iso_time_format(utcnow),
-            "written_ts": json_logging.util.epoch_nano_second(utcnow),
-        }
+    def format_bytes(self, record):
+        """
+            Format the specified record as UTF-8 encoded JSON bytes, used by bytes-aware handlers
+        """
+        if self._custom_format:
+            return self.format(record).encode('utf-8')
+
+        serializer = json_logging.JSON_SERIALIZER
+        fragment = None
+        if self._static_field_plan is not None and _is_spliceable(serializer):
+            log_object, fragment = self._render_dynamic_log_object(record, json_logging._request_util, serializer)
+        else:
+            log_object = self._render_log_object(record, request_util=json_logging._request_util)
+
+        encoder_backend = json_logging._encoder_backend
+        if serializer is encoder_backend.dumps:
+            data = encoder_backend.dumps_bytes(log_object)
+        else:
+            data = serializer(log_object).encode('utf-8')
+        return data if fragment is None else fragment.splice_data(data)
+
+    def format_object(self, record):
+        """
+            Render the log object of the specified record as dict, used by handlers encoding it themselves
+        """
+        return self._render_log_object(record, request_util=json_logging._request_util)
+
+    def format_encoded(self, record, encoding):
+        """
+            Format the specified record with a binary record encoding (see json_logging.encoders.RecordEncoding),
+            as UTF-8 encoded JSON bytes if encoding is None
+        """
+        if encoding is None:
+            return self.format_bytes(record)
+        if self._custom_format:
+            return encoding.encode({'message': self.format(record)})
+        return encoding.encode(self._render_log_object(record, request_util=json_logging._request_util))
+
+    def prepare_record(self, record):
+        """
+            Resolve fields that depend on the logging thread's context before the record is handed over to
+            another thread for formatting (see json_logging.handlers.AsyncHandler)
+        """
+        pass
+
+    def _compile_field_plan(self):
+        """
+        Build the ordered list of bound field writers for this formatter class.
+
+        :return: list of field writers or None if the layered _format_log_object chain must be used
+        """
+        plan = []
+        for klass in reversed(type(self).__mro__):
+            klass_attrs = vars(klass)
+            if '_format_log_object' in klass_attrs and '_field_writers' not in klass_attrs:
+                return None
+            plan.extend(getattr(self, name) for name in klass_attrs.get('_field_writers', ()))
+        return plan
+
+    def _compile_static_field_plan(self):
+        """
+        Split the field plan into writers of static fields and writers of fields serialized for every record.
+
+        :return: (field plan of (writer, None) or (None, static fields slot) tuples, static field plan, static fields
+            key getter) or three times None if static fields can't be spliced
+        """
+        if self._field_plan is None or self._custom_format:
+            return None, None, None
+
+        static_writer_names = set()
+        key_attrs = []
+        for klass in reversed(type(self).__mro__):
+            klass_attrs = vars(klass)
+            static_writer_names.update(klass_attrs.get('_static_field_writers', ()))
+            key_attrs.extend(attr for attr in klass_attrs.get('_static_field_key_attrs', ()) if attr not in key_attrs)
+
+        static_plan = [writer for writer in self._field_plan if writer.__name__ in static_writer_names]
+        if not static_plan or len(static_plan) > len(_STATIC_FIELDS_PLACEHOLDERS):
+            return None, None, None
+        spliced_plan = []
+        for writer in self._field_plan:
+            if writer.__name__ in static_writer_names:
+                spliced_plan.append((None, len([entry for entry in spliced_plan if entry[0] is None])))
+            else:
+                spliced_plan.append((writer, None))
+        get_key = operator.attrgetter(*key_attrs) if key_attrs else _get_no_key
+        return spliced_plan, static_plan, get_key
+
+    def _render_log_object(self, record, request_util):
+        if self._field_plan is None:
+            log_object = self._format_log_object(record, request_util=request_util)
+        else:
+            log_object = {}
+            for write_fields in self._field_plan:
+                write_fields(log_object, record, request_util)
 
-        base_obj.update(self.base_object_common)
-        # Add extra fields
-        base_obj.update(self._get_extra_fields(record))
+        if self._size_limiter is not None:
+            self._size_limiter.limit(log_object)
+        return log_object
+
+    def _render_dynamic_log_object(self, record, request_util, serializer):
+        """
+        :return: (log object with placeholders of static fields, _StaticFieldsFragment) or (full log object, None)
+            if an extra field is named like a static field
+        """
+        fragment = None
+        if self._static_fragments_serializer is serializer:
+            fragment = self._static_fragments.get(self._get_static_fields_key(record))
+        if fragment is None:
+            fragment = self._get_static_fragment(record, request_util, serializer)
+
+        log_object = {}
+        placeholders = fragment.placeholders
+        for write_fields, slot in self._spliced_field_plan:
+            if write_fields is not None:
+                write_fields(log_object, record, request_util)
+            elif placeholders[slot] is not None:
+                log_object[placeholders[slot]] = 0
+        if not fragment.keys.isdisjoint(log_object):
+            return self._render_log_object(record, request_util), None
+
+        if self._size_limiter is not None:
+            self._size_limiter.limit(log_object, reserved_bytes=fragment.reserved_bytes,
+                                     reserved_fields=fragment.placeholders)
+        return log_object, fragment
+
+    def _get_static_fragment(self, record, request_util, serializer):
+        fragments = self._static_fragments
+        if self._static_fragments_serializer is not serializer:
+            fragments = self._static_fragments = {}
+            self._static_fragments_serializer = serializer
+
+        key = self._get_static_fields_key(record)
+        fragment = fragments.get(key)
+        if fragment is None:
+            static_field_groups = []
+            for write_fields in self._static_field_plan:
+                static_fields = {}
+                write_fields(static_fields, record, request_util)
+                static_field_groups.append(static_fields)
+            if len(fragments) >= STATIC_FRAGMENT_CACHE_SIZE:
+                fragments.clear()
+            fragment = fragments[key] = _StaticFieldsFragment(static_field_groups, serializer)
+        return fragment
+
+    def _format_log_object(self, record, request_util):
+        base_obj = {}
+        self._write_base_fields(base_obj, record, request_util)
+        self._write_component_fields(base_obj, record, request_util)
+        self._write_extra_fields(base_obj, record, request_util)
 
         return base_obj
 
+    def _write_base_fields(self, log_object, record, request_util):
+        written_at, written_ts = self._timestamp_renderer.render(record.created)
+
+        log_object["written_at"] = written_at
+        log_object["written_ts"] = written_ts
+
+    def _write_component_fields(self, log_object, record, request_util):
+        log_object.update(self.base_object_common)
+
+    def _write_extra_fields(self, log_object, record, request_util):
+        if self._custom_extra_fields or self._max_extra_fields is not None:
+            fields = self._get_extra_fields(record)
+            if self._max_extra_fields is not None:
+                fields = limits.limit_extra_fields(fields, self._max_extra_fields)
+            log_object.update(fields)
+            return
+
+        if record.args:
+            log_object['msg'] = record.msg
+
+        for key, value in record.__dict__.items():
+            if key not in LOG_RECORD_BUILT_IN_ATTRS:
+                if isinstance(value, EASY_SERIALIZABLE_TYPES):
+                    log_object[key] = value
+                else:
+                    # try to cast it to a string representation
+                    log_object[key] = repr(value)
+
+        # Always add 'props' to the root of the log, assumes props is a dict
+        props = getattr(record, 'props', None)
+        if isinstance(props, dict):
+            log_object.update(props)
+
     def _get_extra_fields(self, record):
         """
         Get the dict of custom extra fields passed to the log statement
@@ -104,90 +375,136 @@ class JSONLogFormatter(BaseJSONFormatter):
     """
     Default formatter for non-web application log
     """
+    # msg, type, logger, thread, level, module, line_no: static fields are interleaved with the others
+    _field_writers = ('_write_message', '_write_logger_fields', '_write_thread', '_write_level_fields',
+                      '_write_location_fields')
+    _static_field_writers = ('_write_logger_fields', '_write_level_fields')
+    _static_field_key_attrs = ('name', 'levelname', 'module')
 
     def get_exc_fields(self, record):
         if record.exc_info:
-            exc_info = self.format_exception(record.exc_info)
+            if json_logging.EXCEPTION_FORMAT == EXCEPTION_FORMAT_STRUCTURED:
+                exc_info = tracebacks.format_exception_structured(record.exc_info)
+            else:
+                exc_info = self.format_exception(record.exc_info)
         else:
             exc_info = record.exc_text
-        return {
+        exc_fields = {
             'exc_info': exc_info,
             'filename': record.filename,
         }
+        if json_logging.EXCEPTION_FINGERPRINT and record.exc_info:
+            exc_fields['exc_fingerprint'] = tracebacks.get_exception_fingerprint(record.exc_info)
+        return exc_fields
 
     @classmethod
     def format_exception(cls, exc_info):
-        return ''.join(traceback.format_exception(*exc_info)) if exc_info else ''
+        return tracebacks.format_exception_text(exc_info) if exc_info else ''
+
+    def prepare_record(self, record):
+        if record.exc_info and PREPARED_EXC_FIELDS_ATTR not in record.__dict__:
+            record.__dict__[PREPARED_EXC_FIELDS_ATTR] = self.get_exc_fields(record)
 
     def _format_log_object(self, record, request_util):
         json_log_object = super(JSONLogFormatter, self)._format_log_object(record, request_util)
+        self._write_log_fields(json_log_object, record, request_util)
 
-        json_log_object.update({
-            "msg": _sanitize_log_msg(record),
-            "type": "log",
-            "logger": record.name,
-            "thread": record.threadName,
-            "level": record.levelname,
-            "module": record.module,
-            "line_no": record.lineno,
-        })
+        return json_log_object
 
-        if record.exc_info or record.exc_text:
-            json_log_object.update(self.get_exc_fields(record))
+    def _write_log_fields(self, log_object, record, request_util):
+        self._write_message(log_object, record, request_util)
+        self._write_logger_fields(log_object, record, request_util)
+        self._write_thread(log_object, record, request_util)
+        self._write_level_fields(log_object, record, request_util)
+        self._write_location_fields(log_object, record, request_util)
 
-        return json_log_object
+    def _write_message(self, log_object, record, request_util):
+        log_object["msg"] = _sanitize_log_msg(record)
+
+    def _write_logger_fields(self, log_object, record, request_util):
+        log_object["type"] = "log"
+        log_object["logger"] = record.name
+
+    def _write_thread(self, log_object, record, request_util):
+        log_object["thread"] = record.threadName
+
+    def _write_level_fields(self, log_object, record, request_util):
+        log_object["level"] = record.levelname
+        log_object["module"] = record.module
+
+    def _write_location_fields(self, log_object, record, request_util):
+        log_object["line_no"] = record.lineno
+
+        prepared_exc_fields = record.__dict__.get(PREPARED_EXC_FIELDS_ATTR)
+        if prepared_exc_fields is not None:
+            log_object.update(prepared_exc_fields)
+        elif record.exc_info or record.exc_text:
+            log_object.update(self.get_exc_fields(record))
 
 
 class JSONLogWebFormatter(JSONLogFormatter):
     """
     Formatter for web application log with correlation-id
     """
+    _field_writers = ('_write_correlation_id',)
 
     def _format_log_object(self, record, request_util):
         json_log_object = super(JSONLogWebFormatter, self)._format_log_object(record, request_util)
-
-        if json_logging.CORRELATION_ID_FIELD not in json_log_object:
-            json_log_object.update({
-                json_logging.CORRELATION_ID_FIELD: request_util.get_correlation_id(within_formatter=True),
-            })
+        self._write_correlation_id(json_log_object, record, request_util)
 
         return json_log_object
 
+    def prepare_record(self, record):
+        super(JSONLogWebFormatter, self).prepare_record(record)
+        if PREPARED_FIELDS_ATTR not in record.__dict__ and json_logging._request_util is not None:
+            record.__dict__[PREPARED_FIELDS_ATTR] = {
+                json_logging.CORRELATION_ID_FIELD: json_logging._request_util.get_correlation_id()
+            }
+
+    def _write_correlation_id(self, log_object, record, request_util):
+        if json_logging.CORRELATION_ID_FIELD not in log_object:
+            prepared_fields = record.__dict__.get(PREPARED_FIELDS_ATTR)
+            if prepared_fields is not None:
+                log_object[json_logging.CORRELATION_ID_FIELD] = prepared_fields[json_logging.CORRELATION_ID_FIELD]
+            else:
+                log_object[json_logging.CORRELATION_ID_FIELD] = request_util.get_correlation_id(
+                    within_formatter=True)
+
 
 class JSONRequestLogFormatter(BaseJSONFormatter):
     """
        Formatter for HTTP request instrumentation logging
     """
+    _field_writers = ('_write_request_fields',)
 
     def _format_log_object(self, record, request_util):
         json_log_object = super(JSONRequestLogFormatter, self)._format_log_object(record, request_util)
-
-        request_adapter = request_util.request_adapter
-        response_adapter = request_util.response_adapter
-
-        request = record.request_response_data._request
-        response = record.request_response_data._response
-
-        length = request_adapter.get_content_length(request)
-
-        json_log_object.update({
-            "type": "request",
-            json_logging.CORRELATION_ID_FIELD: request_util.get_correlation_id(request),
-            "remote_user": request_adapter.get_remote_user(request),
-            "request": request_adapter.get_path(request),
-            "referer": request_adapter.get_http_header(request, 'referer', json_logging.EMPTY_VALUE),
-            "x_forwarded_for": request_adapter.get_http_header(request, 'x-forwarded-for', json_logging.EMPTY_VALUE),
-            "protocol": request_adapter.get_protocol(request),
-            "method": request_adapter.get_method(request),
-            "remote_ip": request_adapter.get_remote_ip(request),
-            "request_size_b": json_logging.util.parse_int(length, -1),
-            "remote_host": request_adapter.get_remote_ip(request),
-            "remote_port": request_adapter.get_remote_port(request),
-            "response_status": response_adapter.get_status_code(response),
-            "response_size_b": response_adapter.get_response_size(response),
-            "response_content_type": response_adapter.get_content_type(response),
-        })
-
-        json_log_object.update(record.request_response_data)
+        self._write_request_fields(json_log_object, record, request_util)
 
         return json_log_object
+
+    def prepare_record(self, record):
+        if PREPARED_FIELDS_ATTR not in record.__dict__:
+            prepared_fields = {}
+            self._extract_request_fields(prepared_fields, record, json_logging._request_util)
+            record.__dict__[PREPARED_FIELDS_ATTR] = prepared_fields
+
+    def _write_request_fields(self, log_object, record, request_util):
+        prepared_fields = record.__dict__.get(PREPARED_FIELDS_ATTR)
+        if prepared_fields is not None:
+            log_object.update(prepared_fields)
+        else:
+            self._extract_request_fields(log_object, record, request_util)
+
+        request_response_data = record.request_response_data
+        request_response_data.render_fields()
+        log_object.update(request_response_data)
+
+    def _extract_request_fields(self, log_object, record, request_util):
+        log_object["type"] = "request"
+
+        request_response_data = record.request_response_data
+        snapshot = request_response_data._snapshot
+        if snapshot is None:
+            snapshot = request_util.create_snapshot(request_response_data._request, request_response_data._response)
+        snapshot.write_fields(log_object)
@@ -6,7 +6,9 @@ import json_logging
 import json_logging.framework
 from json_logging import JSONLogWebFormatter
 from json_logging.framework_base import BaseAppRequestInstrumentationConfigurator, BaseRequestInfoExtractor, \
-    BaseResponseInfoExtractor
+    BaseResponseInfoExtractor, StreamedResponseInfo
+from json_logging.context import enter_request_context, exit_request_context
+from json_logging.sampling import create_request_response_data, complete_request_response_data
 from json_logging.util import is_not_match_any_pattern
 
 
@@ -47,26 +49,42 @@ class ConnexionAppRequestInstrumentationConfigurator(BaseAppRequestInstrumentati
         # noinspection PyAttributeOutsideInit
         self.request_logger = logging.getLogger('connexion-request-logger')
 
+        if json_logging.REQUEST_INSTRUMENTATION_WSGI_MIDDLEWARE:
+            from json_logging.framework.wsgi import JSONLoggingWSGIMiddleware
+            app.app.wsgi_app = JSONLoggingWSGIMiddleware(app.app.wsgi_app, self.request_logger,
+                                                         request_response_dto_class, exclude_url_patterns)
+            return
+
         from flask import g
 
         @app.app.before_request
         def before_request():
+            g.json_logging_context_token = enter_request_context(_current_request)
             # for connexion 3.0+, requests use starlette
             if hasattr(_current_request, "_starlette_request"):
                 path = _current_request.url.path
             else:
                 path = _current_request.path
             if is_not_match_any_pattern(path, exclude_url_patterns):
-                g.request_response_data = request_response_dto_class(_current_request)
+                # sample per route template, e.g. /users/<id>, not per path
+                url_rule = getattr(_current_request, 'url_rule', None)
+                g.request_response_data = create_request_response_data(
+                    request_response_dto_class, _current_request, url_rule.rule if url_rule is not None else path)
 
         @app.app.after_request
         def after_request(response):
             if hasattr(g, 'request_response_data'):
-                request_response_data = g.request_response_data
-                request_response_data.on_request_complete(response)
-                self.request_logger.info("", extra={'request_response_data': request_response_data})
+                request_response_data = complete_request_response_data(g.request_response_data, response)
+                if request_response_data is not None:
+                    self.request_logger.info("", extra={'request_response_data': request_response_data})
             return response
 
+        @app.app.teardown_request
+        def teardown_request(exception):
+            token = g.pop('json_logging_context_token', None)
+            if token is not None:
+                exit_request_context(token)
+
 
 class ConnexionRequestInfoExtractor(BaseRequestInfoExtractor):
     @staticmethod
@@ -131,7 +149,11 @@ class ConnexionResponseInfoExtractor(BaseResponseInfoExtractor):
         return response.status_code
 
     def get_response_size(self, response):
+        if isinstance(response, StreamedResponseInfo):
+            return response.body_size
         return response.calculate_content_length()
 
     def get_content_type(self, response):
+        if isinstance(response, StreamedResponseInfo):
+            return response.headers.get('content-type', json_logging.EMPTY_VALUE)
         return response.content_type
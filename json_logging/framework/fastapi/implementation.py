@@ -2,43 +2,90 @@ import logging
 
 import json_logging
 import json_logging.framework
+from json_logging.context import enter_request_context, exit_request_context
 from json_logging.framework_base import BaseAppRequestInstrumentationConfigurator, BaseRequestInfoExtractor, \
-    BaseResponseInfoExtractor
+    BaseResponseInfoExtractor, StreamedResponseInfo
 
+from json_logging.sampling import create_request_response_data, complete_request_response_data
 from json_logging.util import is_not_match_any_pattern
 
 import fastapi
 import starlette.requests
 import starlette.responses
 
-from starlette.middleware.base import BaseHTTPMiddleware, RequestResponseEndpoint
 from starlette.requests import Request
-from starlette.responses import Response
-from starlette.types import ASGIApp
+from starlette.types import ASGIApp, Receive, Scope, Send, Message
 
 _request_config_class = None
 
+# response headers kept in StreamedResponseInfo
+_RESPONSE_HEADERS = {b'content-type', b'content-length'}
+
+
+class JSONLoggingASGIMiddleware:
+    """
+        Pure ASGI middleware: times the request, takes the status from http.response.start and counts body bytes as
+        they are sent. The response body is passed through untouched, so streaming responses are not buffered.
+    """
 
-class JSONLoggingASGIMiddleware(BaseHTTPMiddleware):
     def __init__(self, app: ASGIApp, exclude_url_patterns=tuple()) -> None:
-        super().__init__(app)
+        self.app = app
         self.request_logger = logging.getLogger('fastapi-request-logger')
         self.exclude_url_patterns = exclude_url_patterns
         logging.getLogger("uvicorn.access").propagate = False
 
-    async def dispatch(self, request: Request, call_next: RequestResponseEndpoint) -> Response:
-        log_request = is_not_match_any_pattern(request.url.path, self.exclude_url_patterns)
-
-        if not log_request:
-            return await call_next(request)
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
 
-        request_response_data = _request_config_class(request)
-        response = await call_next(request)
-        request_response_data.on_request_complete(response)
-        self.request_logger.info(
-            "", extra={"request_response_data": request_response_data, "type": "request"}
-        )
-        return response
+        request = Request(scope, receive)
+        context_token = enter_request_context(request)
+        try:
+            path = request.url.path
+            if not is_not_match_any_pattern(path, self.exclude_url_patterns):
+                await self.app(scope, receive, send)
+                return
+
+            request_response_data = create_request_response_data(_request_config_class, request, path)
+            response_info = None
+
+            async def send_wrapper(message: Message) -> None:
+                nonlocal response_info
+                if message['type'] == 'http.response.start':
+                    request_response_data.on_handler_complete()
+                    response_info = StreamedResponseInfo(message['status'], {
+                        name.decode('latin-1'): value.decode('latin-1')
+                        for name, value in message.get('headers', ()) if name.lower() in _RESPONSE_HEADERS
+                    })
+                elif message['type'] == 'http.response.body' and response_info is not None:
+                    body_size = len(message.get('body', b''))
+                    if body_size:
+                        request_response_data.on_first_byte()
+                        response_info.body_size += body_size
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_wrapper)
+            except Exception:
+                if response_info is None:
+                    response_info = StreamedResponseInfo(500)
+                # the status may have been sent already
+                self._log_request(request_response_data, response_info, failed=True)
+                raise
+
+            if response_info is None:
+                response_info = StreamedResponseInfo(500)
+            self._log_request(request_response_data, response_info)
+        finally:
+            exit_request_context(context_token)
+
+    def _log_request(self, request_response_data, response_info, failed=False):
+        request_response_data = complete_request_response_data(request_response_data, response_info, failed)
+        if request_response_data is not None:
+            self.request_logger.info(
+                "", extra={"request_response_data": request_response_data, "type": "request"}
+            )
 
 
 class FastAPIAppRequestInstrumentationConfigurator(BaseAppRequestInstrumentationConfigurator):
@@ -120,12 +167,42 @@ class FastAPIRequestInfoExtractor(BaseRequestInfoExtractor):
             return request.client.port
         return json_logging.EMPTY_VALUE
 
+    def extract_fields(self, request: starlette.requests.Request, field_names):
+        # client & headers are parsed from the ASGI scope once for all fields
+        client = request.client
+        headers = request.headers
+        values = []
+        for name in field_names:
+            if name == 'remote_ip' or name == 'remote_host':
+                values.append(client.host if client is not None else json_logging.EMPTY_VALUE)
+            elif name == 'remote_user':
+                values.append(request.scope.get('user', json_logging.EMPTY_VALUE))
+            elif name == 'request':
+                values.append(request.url.path)
+            elif name == 'referer':
+                values.append(headers.get('referer', json_logging.EMPTY_VALUE))
+            elif name == 'x_forwarded_for':
+                values.append(headers.get('x-forwarded-for', json_logging.EMPTY_VALUE))
+            elif name == 'protocol':
+                values.append(self.get_protocol(request))
+            elif name == 'method':
+                values.append(request.method)
+            elif name == 'request_size_b':
+                values.append(json_logging.util.parse_int(headers.get('content-length'), -1))
+            elif name == 'remote_port':
+                values.append(client.port if client is not None else json_logging.EMPTY_VALUE)
+            else:
+                raise ValueError(name + ' is not a request field')
+        return values
+
 
 class FastAPIResponseInfoExtractor(BaseResponseInfoExtractor):
     def get_status_code(self, response: starlette.responses.Response):
         return response.status_code
 
     def get_response_size(self, response: starlette.responses.Response):
+        if isinstance(response, StreamedResponseInfo):
+            return response.body_size
         return response.headers.get('content-length', json_logging.EMPTY_VALUE)
 
     def get_content_type(self, response: starlette.responses.Response):
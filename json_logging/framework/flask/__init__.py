@@ -5,8 +5,10 @@ import json_logging
 import json_logging.formatters
 import json_logging.framework
 from json_logging.framework_base import BaseAppRequestInstrumentationConfigurator, BaseRequestInfoExtractor, \
-    BaseResponseInfoExtractor
+    BaseResponseInfoExtractor, StreamedResponseInfo
 
+from json_logging.context import enter_request_context, exit_request_context
+from json_logging.sampling import create_request_response_data, complete_request_response_data
 from json_logging.util import is_not_match_any_pattern
 
 
@@ -45,22 +47,39 @@ class FlaskAppRequestInstrumentationConfigurator(BaseAppRequestInstrumentationCo
         # noinspection PyAttributeOutsideInit
         self.request_logger = logging.getLogger('flask-request-logger')
 
+        if json_logging.REQUEST_INSTRUMENTATION_WSGI_MIDDLEWARE:
+            from json_logging.framework.wsgi import JSONLoggingWSGIMiddleware
+            app.wsgi_app = JSONLoggingWSGIMiddleware(app.wsgi_app, self.request_logger, request_response_dto_class,
+                                                  exclude_url_patterns)
+            return
+
         from flask import g
 
         @app.before_request
         def before_request():
-            if is_not_match_any_pattern(_current_request.path, exclude_url_patterns):
-                g.request_response_data = request_response_dto_class(_current_request)
+            g.json_logging_context_token = enter_request_context(_current_request)
+            path = _current_request.path
+            if is_not_match_any_pattern(path, exclude_url_patterns):
+                # sample per route template, e.g. /users/<id>, not per path
+                url_rule = _current_request.url_rule
+                g.request_response_data = create_request_response_data(
+                    request_response_dto_class, _current_request, url_rule.rule if url_rule is not None else path)
 
         @app.after_request
         def after_request(response):
             if hasattr(g, 'request_response_data'):
-                request_response_data = g.request_response_data
-                request_response_data.on_request_complete(response)
-                self.request_logger.info("", extra={'request_response_data': request_response_data})
+                request_response_data = complete_request_response_data(g.request_response_data, response)
+                if request_response_data is not None:
+                    self.request_logger.info("", extra={'request_response_data': request_response_data})
 
             return response
 
+        @app.teardown_request
+        def teardown_request(exception):
+            token = g.pop('json_logging_context_token', None)
+            if token is not None:
+                exit_request_context(token)
+
 
 class FlaskRequestInfoExtractor(BaseRequestInfoExtractor):
     @staticmethod
@@ -119,13 +138,45 @@ class FlaskRequestInfoExtractor(BaseRequestInfoExtractor):
     def get_remote_port(self, request):
         return request.environ.get('REMOTE_PORT')
 
+    def extract_fields(self, request, field_names):
+        # headers & CGI variables are read straight from the WSGI environ
+        environ = request.environ
+        values = []
+        for name in field_names:
+            if name == 'remote_ip' or name == 'remote_host':
+                values.append(environ.get('REMOTE_ADDR'))
+            elif name == 'remote_user':
+                values.append(self.get_remote_user(request) if 'HTTP_AUTHORIZATION' in environ
+                              else json_logging.EMPTY_VALUE)
+            elif name == 'request':
+                values.append(request.path)
+            elif name == 'referer':
+                values.append(environ.get('HTTP_REFERER', json_logging.EMPTY_VALUE))
+            elif name == 'x_forwarded_for':
+                values.append(environ.get('HTTP_X_FORWARDED_FOR', json_logging.EMPTY_VALUE))
+            elif name == 'protocol':
+                values.append(environ.get('SERVER_PROTOCOL'))
+            elif name == 'method':
+                values.append(request.method)
+            elif name == 'request_size_b':
+                values.append(json_logging.util.parse_int(request.content_length, -1))
+            elif name == 'remote_port':
+                values.append(environ.get('REMOTE_PORT'))
+            else:
+                raise ValueError(name + ' is not a request field')
+        return values
+
 
 class FlaskResponseInfoExtractor(BaseResponseInfoExtractor):
     def get_status_code(self, response):
         return response.status_code
 
     def get_response_size(self, response):
+        if isinstance(response, StreamedResponseInfo):
+            return response.body_size
         return response.calculate_content_length()
 
     def get_content_type(self, response):
+        if isinstance(response, StreamedResponseInfo):
+            return response.headers.get('content-type', json_logging.EMPTY_VALUE)
         return response.content_type
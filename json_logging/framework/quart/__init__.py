@@ -7,6 +7,8 @@ import json_logging.framework
 from json_logging import JSONLogWebFormatter
 from json_logging.framework_base import BaseAppRequestInstrumentationConfigurator, BaseRequestInfoExtractor, \
     BaseResponseInfoExtractor
+from json_logging.context import enter_request_context, exit_request_context
+from json_logging.sampling import create_request_response_data, complete_request_response_data
 from json_logging.util import is_not_match_any_pattern
 
 
@@ -49,20 +51,33 @@ class QuartAppRequestInstrumentationConfigurator(BaseAppRequestInstrumentationCo
 
         from quart import g
 
+        # coroutine hooks run in the context of the request, sync hooks run in a copied context on an executor
+        # thread where the request context would not reach the view
         @app.before_request
-        def before_request():
-            if is_not_match_any_pattern(_current_request.path, exclude_url_patterns):
-                g.request_response_data = request_response_dto_class(_current_request)
+        async def before_request():
+            g.json_logging_context_token = enter_request_context(_current_request)
+            path = _current_request.path
+            if is_not_match_any_pattern(path, exclude_url_patterns):
+                # sample per route template, e.g. /users/<id>, not per path
+                url_rule = _current_request.url_rule
+                g.request_response_data = create_request_response_data(
+                    request_response_dto_class, _current_request, url_rule.rule if url_rule is not None else path)
 
         @app.after_request
-        def after_request(response):
+        async def after_request(response):
             if hasattr(g, 'request_response_data'):
-                request_response_data = g.request_response_data
-                request_response_data.on_request_complete(response)
+                request_response_data = complete_request_response_data(g.request_response_data, response)
                 # TODO:handle to print out request instrumentation in non-JSON mode
-                self.request_logger.info("", extra={'request_response_data': request_response_data})
+                if request_response_data is not None:
+                    self.request_logger.info("", extra={'request_response_data': request_response_data})
             return response
 
+        @app.teardown_request
+        async def teardown_request(exception):
+            token = g.pop('json_logging_context_token', None)
+            if token is not None:
+                exit_request_context(token)
+
 
 class QuartRequestInfoExtractor(BaseRequestInfoExtractor):
     @staticmethod
@@ -12,6 +12,8 @@ from json_logging.framework_base import (
     BaseRequestInfoExtractor,
     BaseResponseInfoExtractor,
 )
+from json_logging.context import enter_request_context, exit_request_context
+from json_logging.sampling import create_request_response_data, complete_request_response_data
 from json_logging.util import is_not_match_any_pattern
 
 
@@ -66,17 +68,24 @@ class SanicAppRequestInstrumentationConfigurator(BaseAppRequestInstrumentationCo
 
         @app.middleware("request")
         def before_request(request):
+            request.ctx.json_logging_context_token = enter_request_context(request)
             if is_not_match_any_pattern(request.path, exclude_url_patterns):
-                request.ctx.request_response_data = request_response_dto_class(request)
+                # sample per route template, e.g. /users/<id:int>, not per path
+                route = getattr(request, "uri_template", None) or request.path
+                request.ctx.request_response_data = create_request_response_data(request_response_dto_class,
+                                                                                 request, route)
 
         @app.middleware("response")
         def after_request(request, response):
             if hasattr(request.ctx, "request_response_data"):
-                request_response_data = request.ctx.request_response_data
-                request_response_data.on_request_complete(response)
-                self.request_logger.info(
-                    "", extra={"request_response_data": request_response_data, "type": "request"}
-                )
+                request_response_data = complete_request_response_data(request.ctx.request_response_data,
+                                                                       response)
+                if request_response_data is not None:
+                    self.request_logger.info(
+                        "", extra={"request_response_data": request_response_data, "type": "request"}
+                    )
+            if hasattr(request.ctx, "json_logging_context_token"):
+                exit_request_context(request.ctx.json_logging_context_token)
 
 
 class SanicRequestInfoExtractor(BaseRequestInfoExtractor):
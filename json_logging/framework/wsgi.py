@@ -0,0 +1,160 @@
+# coding=utf-8
+from json_logging.context import enter_request_context, exit_request_context
+from json_logging.framework_base import StreamedResponseInfo
+from json_logging.sampling import create_request_response_data, complete_request_response_data
+from json_logging.util import is_not_match_any_pattern
+
+# response headers kept in StreamedResponseInfo
+_RESPONSE_HEADERS = {'content-type', 'content-length'}
+
+
+class JSONLoggingWSGIMiddleware(object):
+    """
+        WSGI middleware used by the werkzeug based frameworks (flask, connexion) when
+        json_logging.REQUEST_INSTRUMENTATION_WSGI_MIDDLEWARE is enabled. It wraps app.wsgi_app, so the request time
+        includes all before/after request hooks and the time spent sending the body. Response bytes are counted
+        while the returned iterable is consumed, the body is never materialized.
+
+        Responses returned as wsgi.file_wrapper are passed through untouched to keep sendfile support, their size
+        is taken from the Content-Length header and they are logged as soon as the application returns.
+    """
+
+    def __init__(self, wsgi_app, request_logger, request_response_dto_class, exclude_url_patterns=tuple()):
+        """
+        :param wsgi_app: wrapped WSGI application
+        :param request_logger: logger the request logs are written to
+        :param request_response_dto_class: request DTO class
+        :param exclude_url_patterns: url patterns excluded from request instrumentation
+        """
+        from werkzeug.wrappers import Request
+
+        self.wsgi_app = wsgi_app
+        self.request_logger = request_logger
+        self.request_response_dto_class = request_response_dto_class
+        self.exclude_url_patterns = exclude_url_patterns
+        self._request_class = Request
+
+    def __call__(self, environ, start_response):
+        request = self._request_class(environ)
+        context_token = enter_request_context(request)
+        try:
+            path = request.path
+            if not is_not_match_any_pattern(path, self.exclude_url_patterns):
+                return _ResponseIterable(self.wsgi_app(environ, start_response), context_token)
+
+            request_response_data = create_request_response_data(self.request_response_dto_class, request, path)
+            response_info = _ResponseInfoCollector(start_response, request_response_data)
+            try:
+                app_iter = self.wsgi_app(environ, response_info.start_response)
+            except Exception:
+                # the status may have been sent already
+                self.log_request(request_response_data, response_info.get(500), failed=True)
+                raise
+            request_response_data.on_handler_complete()
+
+            file_wrapper = environ.get('wsgi.file_wrapper')
+            if isinstance(file_wrapper, type) and isinstance(app_iter, file_wrapper):
+                info = response_info.get(500)
+                info.body_size = _to_int(info.headers.get('content-length'))
+                self.log_request(request_response_data, info)
+                exit_request_context(context_token)
+                return app_iter
+
+            return _ResponseIterable(app_iter, context_token, self, request_response_data, response_info)
+        except BaseException:
+            exit_request_context(context_token)
+            raise
+
+    def log_request(self, request_response_data, response_info, failed=False):
+        request_response_data = complete_request_response_data(request_response_data, response_info, failed)
+        if request_response_data is not None:
+            self.request_logger.info("", extra={'request_response_data': request_response_data})
+
+
+class _ResponseInfoCollector(object):
+    __slots__ = ('_start_response', '_request_response_data', 'info')
+
+    def __init__(self, start_response, request_response_data):
+        self._start_response = start_response
+        self._request_response_data = request_response_data
+        self.info = None
+
+    def start_response(self, status, headers, exc_info=None):
+        # may be called again with exc_info to replace the status and headers
+        self.info = StreamedResponseInfo(_to_int(status[:3]), {
+            name.lower(): value for name, value in headers if name.lower() in _RESPONSE_HEADERS
+        })
+        write = self._start_response(status, headers, exc_info)
+        info = self.info
+        request_response_data = self._request_response_data
+
+        def counting_write(data):
+            if data:
+                request_response_data.on_first_byte()
+                info.body_size += len(data)
+            return write(data)
+
+        return counting_write
+
+    def get(self, default_status_code):
+        if self.info is None:
+            self.info = StreamedResponseInfo(default_status_code)
+        return self.info
+
+
+class _ResponseIterable(object):
+    """
+        Passes the response body through while counting its bytes. The request log is written when the server
+        closes the iterable, i.e. after the last byte has been handed to the server or the client went away.
+    """
+
+    def __init__(self, app_iter, context_token, middleware=None, request_response_data=None, response_info=None):
+        self._app_iter = app_iter
+        self._context_token = context_token
+        self._middleware = middleware
+        self._request_response_data = request_response_data
+        self._response_info = response_info
+        self._closed = False
+        self._failed = False
+
+    def __iter__(self):
+        if self._response_info is None:
+            yield from self._app_iter
+            return
+
+        response_info = self._response_info
+        request_response_data = self._request_response_data
+        try:
+            for chunk in self._app_iter:
+                if chunk:
+                    request_response_data.on_first_byte()
+                    # start_response may be deferred until the first chunk is produced
+                    response_info.get(500).body_size += len(chunk)
+                yield chunk
+        except Exception:
+            # raised while streaming the body, after the status has been sent
+            self._failed = True
+            raise
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            close = getattr(self._app_iter, 'close', None)
+            if close is not None:
+                close()
+        finally:
+            try:
+                if self._middleware is not None:
+                    self._middleware.log_request(self._request_response_data, self._response_info.get(500),
+                                                 self._failed)
+            finally:
+                exit_request_context(self._context_token)
+
+
+def _to_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
@@ -1,4 +1,7 @@
 # coding=utf-8
+import json_logging
+
+
 class BaseRequestInfoExtractor:
     """
         Helper class help to extract logging-relevant information from HTTP request object
@@ -121,6 +124,42 @@ class BaseRequestInfoExtractor:
         """
         raise NotImplementedError
 
+    def extract_fields(self, request, field_names):
+        """
+        Extract the request information of the request log in a single pass. Can be overridden with a faster
+        framework specific implementation.
+
+        :param request: request object
+        :param field_names: names of fields to extract, subset of json_logging.dto.REQUEST_FIELDS
+        :return: list of values in order of field_names
+        """
+        values = []
+        remote_ip = None
+        for name in field_names:
+            if name == 'remote_ip' or name == 'remote_host':
+                if remote_ip is None:
+                    remote_ip = self.get_remote_ip(request)
+                values.append(remote_ip)
+            elif name == 'remote_user':
+                values.append(self.get_remote_user(request))
+            elif name == 'request':
+                values.append(self.get_path(request))
+            elif name == 'referer':
+                values.append(self.get_http_header(request, 'referer', json_logging.EMPTY_VALUE))
+            elif name == 'x_forwarded_for':
+                values.append(self.get_http_header(request, 'x-forwarded-for', json_logging.EMPTY_VALUE))
+            elif name == 'protocol':
+                values.append(self.get_protocol(request))
+            elif name == 'method':
+                values.append(self.get_method(request))
+            elif name == 'request_size_b':
+                values.append(json_logging.util.parse_int(self.get_content_length(request), -1))
+            elif name == 'remote_port':
+                values.append(self.get_remote_port(request))
+            else:
+                raise ValueError(name + ' is not a request field')
+        return values
+
 
 class BaseResponseInfoExtractor:
     """
@@ -156,6 +195,44 @@ class BaseResponseInfoExtractor:
         """
         raise NotImplementedError
 
+    def extract_fields(self, response, field_names):
+        """
+        Extract the response information of the request log in a single pass. Can be overridden with a faster
+        framework specific implementation.
+
+        :param response: response object
+        :param field_names: names of fields to extract, subset of json_logging.dto.RESPONSE_FIELDS
+        :return: list of values in order of field_names
+        """
+        values = []
+        for name in field_names:
+            if name == 'response_status':
+                values.append(self.get_status_code(response))
+            elif name == 'response_size_b':
+                values.append(self.get_response_size(response))
+            elif name == 'response_content_type':
+                values.append(self.get_content_type(response))
+            else:
+                raise ValueError(name + ' is not a response field')
+        return values
+
+
+class StreamedResponseInfo(object):
+    """
+        Response information captured by raw ASGI/WSGI middlewares while the response is sent. It is passed to DTOs and
+        response info extractors in place of a framework response object.
+
+        - **status_code**: integer status code
+        - **headers**: dict of lower-cased header name to value
+        - **body_size**: number of body bytes actually sent
+    """
+    __slots__ = ('status_code', 'headers', 'body_size')
+
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers if headers is not None else {}
+        self.body_size = 0
+
 
 class BaseFrameworkConfigurator:
     """
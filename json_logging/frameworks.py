@@ -1,10 +1,19 @@
-# register flask support
-# noinspection PyPep8
-import json_logging.framework.flask as flask_support
+"""
+    Framework support registry. Support for the built-in frameworks is registered lazily, on the first
+    init_<framework_name>() call, so importing json_logging never imports a web framework.
+
+    Third party packages can provide support for further frameworks with an entry point in the
+    **json_logging.frameworks** group, named after the framework and pointing to a callable that calls
+    register_framework_support, e.g. in setup.py:
+
+        entry_points={'json_logging.frameworks': ['falcon = json_logging_falcon:register']}
+"""
 from json_logging import util, BaseRequestInfoExtractor, BaseResponseInfoExtractor, \
     BaseAppRequestInstrumentationConfigurator, \
     BaseFrameworkConfigurator, _framework_support_map, ENABLE_JSON_LOGGING_DEBUG, _logger
 
+ENTRY_POINT_GROUP = 'json_logging.frameworks'
+
 
 def register_framework_support(name, app_configurator, app_request_instrumentation_configurator,
                                request_info_extractor_class,
@@ -38,41 +47,90 @@ def register_framework_support(name, app_configurator, app_request_instrumentati
     }
 
 
-register_framework_support('flask', None, flask_support.FlaskAppRequestInstrumentationConfigurator,
-                           flask_support.FlaskRequestInfoExtractor,
-                           flask_support.FlaskResponseInfoExtractor)
+def get_framework_support(name):
+    """
+    get the support registered for a framework, loading built-in or entry point provided support on first use
+
+    :param name: name of framework
+    :return: dict of framework support classes or None if the framework is not supported
+    """
+    name = name.lower()
+    if name not in _framework_support_map:
+        loader = _builtin_framework_loaders.get(name)
+        if loader is not None:
+            loader()
+        else:
+            _load_entry_point(name)
+    return _framework_support_map.get(name)
+
+
+def _load_entry_point(name):
+    try:
+        from importlib.metadata import entry_points
+    except ImportError:
+        return
+
+    all_entry_points = entry_points()
+    if hasattr(all_entry_points, 'select'):
+        candidates = all_entry_points.select(group=ENTRY_POINT_GROUP)
+    else:
+        candidates = all_entry_points.get(ENTRY_POINT_GROUP, ())
+
+    for entry_point in candidates:
+        if entry_point.name.lower() == name:
+            ENABLE_JSON_LOGGING_DEBUG and _logger.info("Load framework support %s from %s", name, entry_point.value)
+            entry_point.load()()
+            return
+
+
+def _load_flask_support():
+    import json_logging.framework.flask as flask_support
+
+    register_framework_support('flask', None, flask_support.FlaskAppRequestInstrumentationConfigurator,
+                               flask_support.FlaskRequestInfoExtractor,
+                               flask_support.FlaskResponseInfoExtractor)
+
+
+def _load_sanic_support():
+    from json_logging.framework.sanic import SanicAppConfigurator, SanicAppRequestInstrumentationConfigurator, \
+        SanicRequestInfoExtractor, SanicResponseInfoExtractor
+
+    register_framework_support('sanic', SanicAppConfigurator,
+                               SanicAppRequestInstrumentationConfigurator,
+                               SanicRequestInfoExtractor,
+                               SanicResponseInfoExtractor)
+
+
+def _load_quart_support():
+    import json_logging.framework.quart as quart_support
+
+    register_framework_support('quart', None, quart_support.QuartAppRequestInstrumentationConfigurator,
+                               quart_support.QuartRequestInfoExtractor,
+                               quart_support.QuartResponseInfoExtractor)
 
-# register sanic support
-# noinspection PyPep8
-from json_logging.framework.sanic import SanicAppConfigurator, SanicAppRequestInstrumentationConfigurator, \
-    SanicRequestInfoExtractor, SanicResponseInfoExtractor
 
-register_framework_support('sanic', SanicAppConfigurator,
-                           SanicAppRequestInstrumentationConfigurator,
-                           SanicRequestInfoExtractor,
-                           SanicResponseInfoExtractor)
+def _load_connexion_support():
+    import json_logging.framework.connexion as connexion_support
 
-# register quart support
-# noinspection PyPep8
-import json_logging.framework.quart as quart_support
+    register_framework_support('connexion', None, connexion_support.ConnexionAppRequestInstrumentationConfigurator,
+                               connexion_support.ConnexionRequestInfoExtractor,
+                               connexion_support.ConnexionResponseInfoExtractor)
 
-register_framework_support('quart', None, quart_support.QuartAppRequestInstrumentationConfigurator,
-                           quart_support.QuartRequestInfoExtractor,
-                           quart_support.QuartResponseInfoExtractor)
 
-# register connexion support
-# noinspection PyPep8
-import json_logging.framework.connexion as connexion_support
+def _load_fastapi_support():
+    import json_logging.framework.fastapi as fastapi_support
 
-register_framework_support('connexion', None, connexion_support.ConnexionAppRequestInstrumentationConfigurator,
-                           connexion_support.ConnexionRequestInfoExtractor,
-                           connexion_support.ConnexionResponseInfoExtractor)
+    if fastapi_support.is_fastapi_present():
+        register_framework_support('fastapi', app_configurator=None,
+                                   app_request_instrumentation_configurator=fastapi_support.FastAPIAppRequestInstrumentationConfigurator,
+                                   request_info_extractor_class=fastapi_support.FastAPIRequestInfoExtractor,
+                                   response_info_extractor_class=fastapi_support.FastAPIResponseInfoExtractor)
 
-# register FastAPI support
-import json_logging.framework.fastapi as fastapi_support
 
-if fastapi_support.is_fastapi_present():
-    register_framework_support('fastapi', app_configurator=None,
-                               app_request_instrumentation_configurator=fastapi_support.FastAPIAppRequestInstrumentationConfigurator,
-                               request_info_extractor_class=fastapi_support.FastAPIRequestInfoExtractor,
-                               response_info_extractor_class=fastapi_support.FastAPIResponseInfoExtractor)
+_builtin_framework_loaders = {
+    'flask': _load_flask_support,
+    'sanic': _load_sanic_support,
+    'quart': _load_quart_support,
+    'connexion': _load_connexion_support,
+    'fastapi': _load_fastapi_support,
+}
@@ -0,0 +1,397 @@
+# coding=utf-8
+import codecs
+import collections
+import copy
+import io
+import logging
+import os
+import threading
+import weakref
+
+from json_logging.encoders import LENGTH_PREFIX
+
+# one JSON document per line
+FRAMING_NEWLINE = 'newline'
+# every record is preceded by its size, see json_logging.encoders.iter_length_prefixed
+FRAMING_LENGTH_PREFIXED = 'length_prefixed'
+FRAMINGS = (FRAMING_NEWLINE, FRAMING_LENGTH_PREFIXED)
+
+# handlers whose threads & buffers are re-created in forked child processes
+_fork_aware_handlers = weakref.WeakSet()
+
+
+def _reinit_handlers_after_fork():
+    for handler in list(_fork_aware_handlers):
+        handler._after_fork_in_child()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reinit_handlers_after_fork)
+
+
+def get_utf8_buffer(stream):
+    """
+    get the underlying binary buffer of a text stream if JSON bytes can be written to it as is
+
+    :param stream: text stream e.g. sys.stdout
+    :return: binary buffer or None if stream has no buffer or is not UTF-8 encoded
+    """
+    buffer = getattr(stream, 'buffer', None)
+    encoding = getattr(stream, 'encoding', None)
+    if buffer is None or not encoding:
+        return None
+    try:
+        if codecs.lookup(encoding).name != 'utf-8':
+            return None
+    except LookupError:
+        return None
+    return buffer
+
+
+def get_binary_buffer(stream):
+    """
+    :param stream: text or binary stream
+    :return: underlying binary buffer of a text stream, the stream itself if it is binary, None otherwise
+    """
+    if isinstance(stream, (io.RawIOBase, io.BufferedIOBase)):
+        return stream
+    return getattr(stream, 'buffer', None)
+
+
+class JSONStreamHandler(logging.StreamHandler):
+    """
+        StreamHandler that writes UTF-8 encoded JSON lines straight to the binary buffer of the stream when
+        the formatter is able to render bytes (see BaseJSONFormatter.format_bytes), saving the str to bytes
+        encoding of the text layer. Falls back to default StreamHandler behaviour otherwise.
+
+        With a binary **record_encoding** (e.g. MessagePack, see json_logging.encoders.get_record_encoding) or
+        **length_prefixed** framing, records are written length-prefixed to the binary buffer of the stream, or to
+        the stream itself if it is binary.
+    """
+    terminator_bytes = b'\n'
+
+    def __init__(self, stream=None, record_encoding=None, framing=None):
+        """
+        :param stream: output stream, default to sys.stderr
+        :param record_encoding: binary RecordEncoding, None for JSON
+        :param framing: one of FRAMINGS, default to newline for JSON and length_prefixed for binary encodings
+        """
+        if framing is None:
+            framing = FRAMING_NEWLINE if record_encoding is None else FRAMING_LENGTH_PREFIXED
+        if framing not in FRAMINGS:
+            raise ValueError('framing must be one of ' + str(FRAMINGS), framing)
+        if record_encoding is not None and framing == FRAMING_NEWLINE:
+            raise ValueError('binary record encodings require length_prefixed framing', record_encoding.name)
+
+        self.record_encoding = record_encoding
+        self.framing = framing
+        self._framed = framing == FRAMING_LENGTH_PREFIXED
+        super(JSONStreamHandler, self).__init__(stream)
+        self._buffer = self._get_buffer(self.stream)
+
+    def setStream(self, stream):
+        result = super(JSONStreamHandler, self).setStream(stream)
+        self._buffer = self._get_buffer(self.stream)
+        return result
+
+    def _get_buffer(self, stream):
+        if not self._framed:
+            return get_utf8_buffer(stream)
+        buffer = get_binary_buffer(stream)
+        if buffer is None:
+            raise ValueError('length_prefixed framing requires a binary stream or a text stream with a buffer', stream)
+        return buffer
+
+    def _frame_record(self, formatter, record):
+        """
+        :return: length-prefixed record encoded with **record_encoding**
+        """
+        if hasattr(formatter, 'format_encoded'):
+            data = formatter.format_encoded(record, self.record_encoding)
+        elif self.record_encoding is not None:
+            data = self.record_encoding.encode({'message': self.format(record)})
+        else:
+            data = self.format(record).encode('utf-8')
+        return LENGTH_PREFIX.pack(len(data)) + data
+
+    def emit(self, record):
+        formatter = self.formatter or logging._defaultFormatter
+        if not self._framed and (self._buffer is None or not hasattr(formatter, 'format_bytes')):
+            return super(JSONStreamHandler, self).emit(record)
+
+        try:
+            if self._framed:
+                data = self._frame_record(formatter, record)
+            else:
+                data = formatter.format_bytes(record) + self.terminator_bytes
+            # keep ordering with text already written to the stream
+            self.stream.flush()
+            self._buffer.write(data)
+            self._buffer.flush()
+        except RecursionError:
+            raise
+        except Exception:
+            self.handleError(record)
+
+
+class BufferedJSONStreamHandler(JSONStreamHandler):
+    """
+        JSONStreamHandler that coalesces many lines per write: formatted records are accumulated in a reusable
+        buffer which is written with a single write + flush when
+
+        - it holds at least **buffer_size** bytes
+        - **flush_interval** seconds passed since the last write (checked by a background flusher thread)
+        - a record at or above **flush_level** is emitted, so e.g. errors are never held back
+
+        In forked child processes (e.g. pre-fork server workers) the flusher thread is restarted and lines buffered
+        by the parent are discarded, the parent writes them.
+    """
+
+    def __init__(self, stream=None, buffer_size=65536, flush_interval=1.0, flush_level=logging.ERROR,
+                 record_encoding=None, framing=None):
+        """
+        :param stream: output stream, default to sys.stderr
+        :param buffer_size: number of buffered bytes (or characters for text streams) that triggers a write
+        :param flush_interval: max seconds a record stays in buffer, None to disable time based flushing
+        :param flush_level: records at or above this level are written immediately
+        :param record_encoding: see JSONStreamHandler
+        :param framing: see JSONStreamHandler
+        """
+        super(BufferedJSONStreamHandler, self).__init__(stream, record_encoding=record_encoding, framing=framing)
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+        self.flush_level = flush_level
+        self._init_flusher()
+        _fork_aware_handlers.add(self)
+
+    def _init_flusher(self):
+        # lines in emit order, bytes if written to the binary buffer of the stream, str otherwise
+        self._pending = []
+        self._pending_size = 0
+        self._stopped = threading.Event()
+        self._flusher = None
+        if self.flush_interval:
+            self._flusher = threading.Thread(target=self._flush_loop, name='json_logging-flusher', daemon=True)
+            self._flusher.start()
+
+    def _flush_loop(self):
+        while not self._stopped.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception:
+                # e.g. broken pipe or closed stream, the flusher keeps running
+                self.handleError(None)
+
+    def _after_fork_in_child(self):
+        if not self._stopped.is_set():
+            self._init_flusher()
+
+    def emit(self, record):
+        try:
+            formatter = self.formatter or logging._defaultFormatter
+            if self._framed:
+                data = self._frame_record(formatter, record)
+            elif self._buffer is None:
+                data = self.format(record) + self.terminator
+            elif hasattr(formatter, 'format_bytes'):
+                data = formatter.format_bytes(record) + self.terminator_bytes
+            else:
+                # the binary buffer of a UTF-8 stream, encoded like the text layer would
+                data = (self.format(record) + self.terminator).encode('utf-8')
+            self._pending.append(data)
+            self._pending_size += len(data)
+
+            if record.levelno >= self.flush_level or self._pending_size >= self.buffer_size:
+                self.flush()
+        except RecursionError:
+            raise
+        except Exception:
+            self.handleError(record)
+
+    def flush(self):
+        """
+        write all buffered lines to the stream
+        """
+        self.acquire()
+        try:
+            # lines are dropped if writing fails, so the buffer doesn't grow on a broken stream
+            pending = self._pending
+            self._pending = []
+            self._pending_size = 0
+            if pending and self._buffer is not None:
+                # keep ordering with text already written to the stream
+                self.stream.flush()
+                self._buffer.write(b''.join(pending))
+                self._buffer.flush()
+            else:
+                if pending:
+                    self.stream.write(''.join(pending))
+                if self.stream and hasattr(self.stream, "flush"):
+                    self.stream.flush()
+        finally:
+            self.release()
+
+    def close(self):
+        self._stopped.set()
+        try:
+            self.flush()
+        finally:
+            super(BufferedJSONStreamHandler, self).close()
+
+
+OVERFLOW_BLOCK = 'block'
+OVERFLOW_DROP_OLDEST = 'drop_oldest'
+OVERFLOW_DROP_NEW = 'drop_new'
+OVERFLOW_POLICIES = (OVERFLOW_BLOCK, OVERFLOW_DROP_OLDEST, OVERFLOW_DROP_NEW)
+
+
+class AsyncHandler(logging.Handler):
+    """
+        Handler that only enqueues records in the calling thread. A dedicated writer thread formats them and
+        hands them to the wrapped **target** handler, so slow output never blocks the producers.
+
+        Fields bound to the calling context (e.g. correlation-id, request information) are resolved before
+        enqueueing through the **prepare_record** method of the target's formatter. The message is rendered and
+        the arguments and traceback are released before enqueueing too, on a copy of the record.
+
+        When the bounded queue is full, **overflow_policy** decides what happens:
+
+        - **block**: wait until the writer thread makes room
+        - **drop_oldest**: discard the oldest queued record, counted in **dropped_oldest_count**
+        - **drop_new**: discard the new record, counted in **dropped_new_count**
+
+        In forked child processes the writer thread and its locks are re-created and records queued by the parent
+        are discarded, the parent writes them.
+    """
+
+    def __init__(self, target, queue_size=10000, overflow_policy=OVERFLOW_BLOCK, flush_timeout=5.0):
+        """
+        :param target: handler that formats and writes records in the writer thread
+        :param queue_size: max number of queued records
+        :param overflow_policy: one of OVERFLOW_POLICIES
+        :param flush_timeout: max seconds to wait for queued records to be written on flush and close
+        """
+        super(AsyncHandler, self).__init__()
+        if overflow_policy not in OVERFLOW_POLICIES:
+            raise ValueError('overflow_policy must be one of ' + str(OVERFLOW_POLICIES), overflow_policy)
+        if queue_size < 1:
+            raise ValueError('queue_size must be positive', queue_size)
+
+        self.target = target
+        self.queue_size = queue_size
+        self.overflow_policy = overflow_policy
+        self.flush_timeout = flush_timeout
+        self.dropped_oldest_count = 0
+        self.dropped_new_count = 0
+
+        self._init_writer()
+        _fork_aware_handlers.add(self)
+
+    def _init_writer(self):
+        self._queue = collections.deque()
+        self._unfinished = 0
+        self._closed = False
+        self._mutex = threading.Lock()
+        self._not_empty = threading.Condition(self._mutex)
+        self._not_full = threading.Condition(self._mutex)
+        self._all_done = threading.Condition(self._mutex)
+        self._writer = threading.Thread(target=self._write_loop, name='json_logging-writer', daemon=True)
+        self._writer.start()
+
+    def _after_fork_in_child(self):
+        if not self._closed:
+            self._init_writer()
+
+    def prepare(self, record):
+        """
+        resolve what the record needs from the logging thread, like logging.handlers.QueueHandler.prepare: a copy
+        of the record is returned with the message rendered and arguments released, as is the traceback once
+        rendered. The record itself is left untouched for other handlers
+        """
+        record = copy.copy(record)
+        formatter = self.target.formatter or logging._defaultFormatter
+        prepare_record = getattr(formatter, 'prepare_record', None)
+        if prepare_record is not None:
+            # renders the exception fields as well
+            prepare_record(record)
+        elif record.exc_info and not record.exc_text:
+            record.exc_text = formatter.formatException(record.exc_info)
+
+        record.msg = record.getMessage()
+        record.args = None
+        record.exc_info = None
+        return record
+
+    def emit(self, record):
+        if self._closed or threading.current_thread() is self._writer:
+            # logging from within the writer thread must not wait for itself
+            self.target.handle(record)
+            return
+
+        try:
+            record = self.prepare(record)
+        except RecursionError:
+            raise
+        except Exception:
+            self.handleError(record)
+            return
+
+        with self._mutex:
+            while len(self._queue) >= self.queue_size:
+                if self.overflow_policy == OVERFLOW_DROP_NEW:
+                    self.dropped_new_count += 1
+                    return
+                if self.overflow_policy == OVERFLOW_DROP_OLDEST:
+                    self._queue.popleft()
+                    self._unfinished -= 1
+                    self.dropped_oldest_count += 1
+                elif self._closed:
+                    break
+                else:
+                    self._not_full.wait()
+            if not self._closed:
+                self._queue.append(record)
+                self._unfinished += 1
+                self._not_empty.notify()
+                return
+
+        self.target.handle(record)
+
+    def _write_loop(self):
+        while True:
+            with self._mutex:
+                while not self._queue and not self._closed:
+                    self._not_empty.wait()
+                if not self._queue:
+                    return
+                batch = list(self._queue)
+                self._queue.clear()
+                self._not_full.notify_all()
+
+            for record in batch:
+                self.target.handle(record)
+
+            with self._mutex:
+                self._unfinished -= len(batch)
+                if self._unfinished <= 0:
+                    self._all_done.notify_all()
+
+    def flush(self):
+        """
+        wait up to **flush_timeout** seconds for queued records to be written, then flush target
+        """
+        with self._mutex:
+            self._all_done.wait_for(lambda: self._unfinished <= 0, timeout=self.flush_timeout)
+        self.target.flush()
+
+    def close(self):
+        """
+        stop accepting records, write what's queued within **flush_timeout** seconds and close target
+        """
+        with self._mutex:
+            self._closed = True
+            self._not_empty.notify_all()
+            self._not_full.notify_all()
+        self._writer.join(self.flush_timeout)
+        self.target.close()
+        super(AsyncHandler, self).close()
@@ -0,0 +1,197 @@
+# coding=utf-8
+"""
+    Size limits applied to log objects before they are serialized (see json_logging.LOG_FIELD_MAX_LENGTH,
+    LOG_EXTRA_FIELDS_MAX_COUNT, LOG_FIELD_MAX_DEPTH and LOG_LINE_MAX_BYTES). Fields that have been cut are listed in
+    a **truncated_fields** field, extra fields that have been dropped are counted in **extra_fields_omitted**.
+"""
+import itertools
+import threading
+
+import json_logging
+
+TRUNCATED_FIELDS_FIELD = 'truncated_fields'
+EXTRA_FIELDS_OMITTED_FIELD = 'extra_fields_omitted'
+# replaces containers nested deeper than LOG_FIELD_MAX_DEPTH
+MAX_DEPTH_MARKER = '...(max depth exceeded)'
+
+_TRUNCATED_STRING_MARKER = '...(%d characters truncated)'
+_TRUNCATED_FIELD_MARKER = '...(%d bytes truncated)'
+# tracebacks end with the exception that has been logged, their start is cut instead
+_TAIL_FIELDS = ('exc_info',)
+# never cut to fit LOG_LINE_MAX_BYTES
+_PROTECTED_FIELDS = frozenset((
+    'written_at', 'written_ts', 'type', 'logger', 'level', 'thread', 'module', 'line_no', 'component_id',
+    'component_name', 'component_instance_idx', TRUNCATED_FIELDS_FIELD, EXTRA_FIELDS_OMITTED_FIELD,
+))
+
+_truncated_record_count = 0
+_truncated_record_count_lock = threading.Lock()
+
+
+def get_truncated_record_count():
+    """
+    :return: number of log objects that have been truncated by a LogSizeLimiter since the process started
+    """
+    return _truncated_record_count
+
+
+def get_size_limiter():
+    """
+    :return: LogSizeLimiter for the configured limits or None if no limit is configured
+    """
+    limits = (json_logging.LOG_FIELD_MAX_LENGTH, json_logging.LOG_EXTRA_FIELDS_MAX_COUNT,
+              json_logging.LOG_FIELD_MAX_DEPTH, json_logging.LOG_LINE_MAX_BYTES)
+    if all(limit is None for limit in limits):
+        return None
+    return LogSizeLimiter(*limits)
+
+
+def limit_extra_fields(fields, max_count):
+    """
+    :param fields: dict of extra fields
+    :param max_count: max number of extra fields
+    :return: fields or dict of the first max_count fields and the number of dropped ones
+    """
+    omitted_count = len(fields) - max_count
+    if omitted_count <= 0:
+        return fields
+    limited = dict(itertools.islice(fields.items(), max_count))
+    limited[EXTRA_FIELDS_OMITTED_FIELD] = omitted_count
+    return limited
+
+
+class LogSizeLimiter(object):
+    """
+        Cuts log objects in place, walking them once. Strings longer than **field_max_length** characters are cut
+        (keeping their start, the end of tracebacks) and containers nested deeper than **max_depth** are replaced by
+        a marker. Nested containers are copied rather than modified, as they may belong to the caller.
+
+        Then, if the estimated size of the line exceeds **line_max_bytes**, its largest fields are cut until it
+        fits. The estimate counts UTF-8 bytes of keys & values, the separators of json.dumps and the escaping of
+        newlines, quotes and backslashes. Other control characters are not accounted for.
+    """
+
+    def __init__(self, field_max_length=None, max_extra_fields=None, max_depth=None, line_max_bytes=None):
+        """
+        :param field_max_length: max characters of string values, None for no limit
+        :param max_extra_fields: max number of extra fields, see limit_extra_fields
+        :param max_depth: max nesting level of containers, fields of the log object being level 1. None for no limit
+        :param line_max_bytes: max estimated bytes of the serialized log object, None for no limit
+        """
+        self.field_max_length = field_max_length
+        self.max_extra_fields = max_extra_fields
+        self.max_depth = max_depth
+        self.line_max_bytes = line_max_bytes
+        self._walk_fields = field_max_length is not None or max_depth is not None
+
+    def limit(self, log_object, reserved_bytes=0, reserved_fields=()):
+        """
+        :param log_object: dict about to be serialized
+        :param reserved_bytes: bytes of the line taken by fields serialized separately
+        :param reserved_fields: fields of log_object standing in for the fields of reserved_bytes, never cut
+        """
+        truncated_fields = []
+        if self._walk_fields:
+            for key, value in log_object.items():
+                limited = self._limit_value(key, value, 1)
+                if limited is not value:
+                    log_object[key] = limited
+                    truncated_fields.append(key)
+
+        if self.line_max_bytes is not None:
+            self._limit_line(log_object, truncated_fields, reserved_bytes, reserved_fields)
+
+        if truncated_fields:
+            log_object[TRUNCATED_FIELDS_FIELD] = truncated_fields
+        elif EXTRA_FIELDS_OMITTED_FIELD not in log_object:
+            return
+
+        global _truncated_record_count
+        with _truncated_record_count_lock:
+            _truncated_record_count += 1
+
+    def _limit_value(self, key, value, depth):
+        if isinstance(value, str):
+            if self.field_max_length is not None and len(value) > self.field_max_length:
+                return _truncate_string(value, self.field_max_length, key in _TAIL_FIELDS)
+            return value
+
+        if isinstance(value, dict):
+            if self.max_depth is not None and depth > self.max_depth:
+                return MAX_DEPTH_MARKER
+            limited = None
+            for item_key, item in value.items():
+                limited_item = self._limit_value(item_key, item, depth + 1)
+                if limited_item is not item:
+                    if limited is None:
+                        limited = dict(value)
+                    limited[item_key] = limited_item
+            return value if limited is None else limited
+
+        if isinstance(value, (list, tuple)):
+            if self.max_depth is not None and depth > self.max_depth:
+                return MAX_DEPTH_MARKER
+            limited = None
+            for index, item in enumerate(value):
+                limited_item = self._limit_value(None, item, depth + 1)
+                if limited_item is not item:
+                    if limited is None:
+                        limited = list(value)
+                    limited[index] = limited_item
+            return value if limited is None else limited
+
+        return value
+
+    def _limit_line(self, log_object, truncated_fields, reserved_bytes, reserved_fields):
+        # "key": value, for each field, braces and the truncated_fields field added below
+        sizes = {key: len(key) + 6 + _estimate_size(value) for key, value in log_object.items()
+                 if key not in reserved_fields}
+        excess = sum(sizes.values()) + 2 + reserved_bytes - self.line_max_bytes
+        if excess <= 0:
+            return
+
+        excess += len(TRUNCATED_FIELDS_FIELD) + 8 + sum(len(key) + 4 for key in truncated_fields)
+        for key in sorted(sizes, key=sizes.get, reverse=True):
+            if key in _PROTECTED_FIELDS:
+                continue
+            if key not in truncated_fields:
+                truncated_fields.append(key)
+                excess += len(key) + 4
+
+            value = log_object[key]
+            # characters take at least one byte, cutting as many characters as bytes in excess is enough
+            max_length = len(value) - excess if isinstance(value, str) else -1
+            if max_length > len(_TRUNCATED_STRING_MARKER % len(value)):
+                log_object[key] = _truncate_string(value, max_length, key in _TAIL_FIELDS)
+                return
+
+            marker = _TRUNCATED_FIELD_MARKER % sizes[key]
+            log_object[key] = marker
+            excess -= sizes[key] - len(key) - 8 - len(marker)
+            if excess <= 0:
+                return
+
+
+def _truncate_string(value, max_length, keep_tail=False):
+    # marker is at most as long as the one for the number of characters actually cut
+    keep_length = max(max_length - len(_TRUNCATED_STRING_MARKER % len(value)), 0)
+    marker = _TRUNCATED_STRING_MARKER % (len(value) - keep_length)
+    if keep_tail:
+        return marker + value[len(value) - keep_length:]
+    return value[:keep_length] + marker
+
+
+def _estimate_size(value):
+    if isinstance(value, str):
+        size = len(value) if value.isascii() else len(value.encode('utf-8', 'surrogatepass'))
+        return size + value.count('\n') + value.count('"') + value.count('\\') + 2
+    if value is None or isinstance(value, bool):
+        return 5
+    if isinstance(value, (int, float)):
+        return len(repr(value))
+    if isinstance(value, dict):
+        return sum(len(str(key)) + 6 + _estimate_size(item) for key, item in value.items()) + 2
+    if isinstance(value, (list, tuple)):
+        return sum(_estimate_size(item) + 2 for item in value) + 2
+    # rendered with default=str
+    return _estimate_size(str(value))
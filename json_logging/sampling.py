@@ -0,0 +1,249 @@
+# coding=utf-8
+import collections
+import threading
+import time
+import zlib
+
+import json_logging
+from json_logging.buffering import start_request_log_buffer, pop_request_log_buffer, SUPPRESSED_LOG_COUNT_FIELD
+from json_logging.context import get_request_context
+
+SAMPLE_RATE_FIELD = 'sample_rate'
+# values of FORCE_LOG_HEADERS that bypass correlation id sampling
+FORCE_LOG_VALUES = ('1', 'true', 'yes', 'on')
+
+
+class _RouteBucket(object):
+    __slots__ = ('tokens', 'updated', 'window_start', 'seen', 'kept', 'sample_rate')
+
+    def __init__(self, tokens, now):
+        self.tokens = tokens
+        self.updated = now
+        self.window_start = now
+        self.seen = 0
+        self.kept = 0
+        self.sample_rate = None
+
+
+class RequestSampler(object):
+    """
+        Keeps at most **events_per_second** request logs per route (token bucket refilled continuously, holding up
+        to **burst** tokens). Kept request logs are stamped with a **sample_rate** field, the share of requests of
+        their route that were kept in the previous second, so counts can be re-weighted downstream.
+
+        Requests that have been sampled out still have their request log written if they fail (status >= 500 or
+        an exception) or take at least **slow_request_threshold_ms**. These are not re-weighted, i.e. stamped with a
+        sample_rate of 1 (or json_logging.CORRELATION_ID_SAMPLE_RATE if correlation id sampling is enabled).
+    """
+
+    def __init__(self, events_per_second, burst=None, slow_request_threshold_ms=1000, max_routes=1000):
+        """
+        :param events_per_second: request logs kept per second and route
+        :param burst: max number of request logs kept at once after a quiet period, default to events_per_second
+        :param slow_request_threshold_ms: requests taking at least this long are always kept, None to disable
+        :param max_routes: number of routes tracked, the least recently requested route is forgotten beyond
+        """
+        if events_per_second <= 0:
+            raise ValueError('events_per_second must be positive', events_per_second)
+
+        self.events_per_second = float(events_per_second)
+        self.burst = float(burst if burst else max(events_per_second, 1))
+        self.slow_request_threshold_ns = None if slow_request_threshold_ms is None \
+            else int(slow_request_threshold_ms * 1000000)
+        self.max_routes = max_routes
+        self._buckets = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def sample(self, route):
+        """
+        take a token from the bucket of route
+
+        :param route: route of request, its route template if known, its path otherwise
+        :return: sample rate to stamp the request log with or None if the request has been sampled out
+        """
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(route)
+            if bucket is None:
+                if len(self._buckets) >= self.max_routes:
+                    self._buckets.popitem(last=False)
+                bucket = self._buckets[route] = _RouteBucket(self.burst, now)
+            else:
+                self._buckets.move_to_end(route)
+
+            bucket.tokens = min(self.burst, bucket.tokens + (now - bucket.updated) * self.events_per_second)
+            bucket.updated = now
+
+            window_age = now - bucket.window_start
+            if window_age >= 1.0:
+                # rate of the previous window, unknown if it has been a quiet one
+                bucket.sample_rate = bucket.kept / bucket.seen if window_age < 2.0 and bucket.seen else None
+                bucket.window_start = now
+                bucket.seen = 0
+                bucket.kept = 0
+
+            bucket.seen += 1
+            if bucket.tokens < 1.0:
+                return None
+
+            bucket.tokens -= 1.0
+            bucket.kept += 1
+            sample_rate = bucket.sample_rate if bucket.sample_rate is not None else bucket.kept / bucket.seen
+            return round(sample_rate, 4)
+
+    def is_always_kept(self, status_code, duration_ns):
+        """
+        :return: True if request log must be written regardless of sampling
+        """
+        if isinstance(status_code, int) and status_code >= 500:
+            return True
+        return self.slow_request_threshold_ns is not None and duration_ns >= self.slow_request_threshold_ns
+
+
+class SampledOutRequest(object):
+    """
+        Placeholder kept by request instrumentations instead of a request DTO for requests that have been sampled
+        out, so neither a DTO is created nor a request log formatted unless the request must be kept after all
+    """
+    __slots__ = ('request_response_dto_class', 'request', 'start_ns', 'keep_failed')
+
+    def __init__(self, request_response_dto_class, request, keep_failed=True):
+        """
+        :param keep_failed: create the request log after all if the request fails or is slow
+        """
+        self.request_response_dto_class = request_response_dto_class
+        self.request = request
+        self.start_ns = time.perf_counter_ns()
+        self.keep_failed = keep_failed
+
+    def on_handler_complete(self):
+        pass
+
+    def on_first_byte(self):
+        pass
+
+
+def is_correlation_id_sampled(correlation_id, sample_rate):
+    """
+    deterministic sampling decision, the same in every service seeing the same correlation id
+
+    :param correlation_id: correlation id string
+    :param sample_rate: share of correlation ids that are sampled, between 0 and 1
+    """
+    return zlib.crc32(correlation_id.encode('utf-8')) < sample_rate * 4294967296
+
+
+def is_current_request_sampled():
+    """
+    whether logs of the request currently being processed are written according to
+    json_logging.CORRELATION_ID_SAMPLE_RATE. The decision is made once per request and cached in its request
+    context. Outside of requests, this is always True.
+    """
+    sample_rate = json_logging.CORRELATION_ID_SAMPLE_RATE
+    if sample_rate is None:
+        return True
+
+    context = get_request_context()
+    if context is None:
+        return True
+
+    sampled = context.sampled
+    if sampled is None:
+        sampled = context.sampled = _is_request_sampled(context.request, sample_rate)
+    return sampled
+
+
+def _is_request_sampled(request, sample_rate):
+    request_util = json_logging._request_util
+    if request_util is None:
+        return True
+
+    for header_name in json_logging.FORCE_LOG_HEADERS:
+        value = request_util.request_adapter.get_http_header(request, header_name)
+        if value and value.strip().lower() in FORCE_LOG_VALUES:
+            return True
+
+    return is_correlation_id_sampled(request_util.get_correlation_id(request), sample_rate)
+
+
+def create_request_response_data(request_response_dto_class, request, route):
+    """
+    create the request DTO of a request that starts, unless the request is sampled out. Starts buffering the
+    records logged while processing the request if json_logging.REQUEST_LOG_BUFFERING is enabled.
+
+    :param request_response_dto_class: request DTO class
+    :param request: request object
+    :param route: route of request, its route template (e.g. /users/<id>) if known, its path otherwise
+    :return: request DTO or SampledOutRequest
+    """
+    sampler = json_logging._request_sampler
+    correlation_id_sample_rate = json_logging.CORRELATION_ID_SAMPLE_RATE
+    if sampler is None and correlation_id_sample_rate is None:
+        start_request_log_buffer()
+        return request_response_dto_class(request)
+
+    sample_rate = 1.0
+    if correlation_id_sample_rate is not None:
+        if not is_current_request_sampled():
+            # application logs of the request are dropped by CorrelationIdSamplingFilter, nothing to buffer
+            return SampledOutRequest(request_response_dto_class, request, keep_failed=False)
+        sample_rate = correlation_id_sample_rate
+
+    start_request_log_buffer()
+    if sampler is not None:
+        route_sample_rate = sampler.sample(route)
+        if route_sample_rate is None:
+            return SampledOutRequest(request_response_dto_class, request)
+        sample_rate *= route_sample_rate
+
+    request_response_data = request_response_dto_class(request)
+    request_response_data[SAMPLE_RATE_FIELD] = round(sample_rate, 4)
+    return request_response_data
+
+
+def complete_request_response_data(request_response_data, response, failed=False):
+    """
+    complete the request DTO or SampledOutRequest created by create_request_response_data. Buffered records of
+    the request are written if the request failed or was slow, dropped otherwise.
+
+    :param request_response_data: request DTO or SampledOutRequest
+    :param response: response object
+    :param failed: whether the request raised an exception, e.g. after its response status had been sent. It is
+        then kept like requests with status >= 500
+    :return: completed request DTO to write the request log for or None if the request log must be skipped
+    """
+    sampler = json_logging._request_sampler
+    log_buffer = pop_request_log_buffer()
+    sampled_out = request_response_data if isinstance(request_response_data, SampledOutRequest) else None
+    if sampler is None and log_buffer is None:
+        if sampled_out is not None:
+            return None
+        request_response_data.on_request_complete(response)
+        return request_response_data
+
+    start_ns = sampled_out.start_ns if sampled_out is not None else request_response_data._start_ns
+    duration_ns = time.perf_counter_ns() - start_ns
+    status_code = json_logging._request_util.response_adapter.get_status_code(response)
+    suppressed_log_count = log_buffer.complete(status_code, duration_ns, failed) if log_buffer is not None else 0
+    always_kept = sampler is not None and (failed or sampler.is_always_kept(status_code, duration_ns))
+
+    if sampled_out is not None:
+        if not sampled_out.keep_failed or not always_kept:
+            return None
+
+        request_response_data = sampled_out.request_response_dto_class(sampled_out.request)
+        request_response_data.set_request_start(time.time() - duration_ns / 1e9, start_ns)
+        request_response_data[SAMPLE_RATE_FIELD] = _get_always_kept_sample_rate()
+    elif always_kept and SAMPLE_RATE_FIELD in request_response_data:
+        request_response_data[SAMPLE_RATE_FIELD] = _get_always_kept_sample_rate()
+
+    if suppressed_log_count:
+        request_response_data[SUPPRESSED_LOG_COUNT_FIELD] = suppressed_log_count
+    request_response_data.on_request_complete(response)
+    return request_response_data
+
+
+def _get_always_kept_sample_rate():
+    # failed & slow requests bypass the route budget, not the correlation id sampling
+    correlation_id_sample_rate = json_logging.CORRELATION_ID_SAMPLE_RATE
+    return 1.0 if correlation_id_sample_rate is None else correlation_id_sample_rate
@@ -0,0 +1,613 @@
+# coding=utf-8
+"""
+    Handlers shipping log records straight to a log forwarder (fluent-bit, fluentd, vector...) or to compressed
+    files instead of writing them to stdout, e.g.
+
+        handler = json_logging.sinks.SocketSinkHandler(('127.0.0.1', 24224), framing='forward', tag='app.logs',
+                                                       spill_path='/var/tmp/app-logs.spill')
+        json_logging.get_request_logger().addHandler(handler)
+"""
+import functools
+import gzip
+import json
+import logging
+import os
+import socket
+import struct
+import threading
+import time
+
+from json_logging import encoders
+from json_logging.handlers import _fork_aware_handlers
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# one JSON document per line
+FRAMING_NEWLINE = 'newline'
+# Fluent Forward protocol, PackedForward mode: [tag, MessagePack encoded [time, record] entries, options]
+FRAMING_FORWARD = 'forward'
+FRAMINGS = (FRAMING_NEWLINE, FRAMING_FORWARD)
+
+_EVENT_TIME_EXT_CODE = 0
+_EVENT_TIME = struct.Struct('>II')
+
+_connections = {}
+_connections_lock = threading.Lock()
+_connections_pid = None
+
+
+class SocketConnection(object):
+    """
+        Persistent connection to a Unix domain socket (**address** is a path) or TCP (**address** is a (host, port)
+        tuple). Failed connects and sends close the connection, reconnects are attempted with exponential backoff.
+    """
+
+    def __init__(self, address, connect_timeout=1.0, send_timeout=5.0, backoff_initial=0.1, backoff_max=30.0):
+        """
+        :param address: path of Unix domain socket or (host, port) tuple
+        :param connect_timeout: max seconds to wait for connect
+        :param send_timeout: max seconds a send may block before the connection is considered broken
+        :param backoff_initial: seconds to wait before the first reconnect, doubled for each failed attempt
+        :param backoff_max: max seconds between reconnect attempts
+        """
+        self.address = address
+        self.connect_timeout = connect_timeout
+        self.send_timeout = send_timeout
+        self.backoff_initial = backoff_initial
+        self.backoff_max = backoff_max
+        self.connect_count = 0
+        self._socket = None
+        self._backoff = backoff_initial
+        self._next_connect = 0.0
+        self._lock = threading.Lock()
+
+    def send(self, data):
+        """
+        :param data: bytes to send
+        :return: True if data has been sent, False if the peer can't be reached
+        """
+        with self._lock:
+            if self._socket is None and not self._connect():
+                return False
+            try:
+                self._socket.sendall(data)
+                return True
+            except OSError:
+                self._disconnect()
+                self._schedule_reconnect()
+                return False
+
+    def close(self):
+        with self._lock:
+            self._disconnect()
+
+    def _connect(self):
+        if time.monotonic() < self._next_connect:
+            return False
+        try:
+            if isinstance(self.address, str):
+                sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                try:
+                    sock.settimeout(self.connect_timeout)
+                    sock.connect(self.address)
+                except OSError:
+                    sock.close()
+                    raise
+            else:
+                sock = socket.create_connection(self.address, timeout=self.connect_timeout)
+        except OSError:
+            self._schedule_reconnect()
+            return False
+
+        sock.settimeout(self.send_timeout)
+        self._socket = sock
+        self._backoff = self.backoff_initial
+        self.connect_count += 1
+        return True
+
+    def _disconnect(self):
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
+
+    def _schedule_reconnect(self):
+        self._next_connect = time.monotonic() + self._backoff
+        self._backoff = min(self._backoff * 2, self.backoff_max)
+
+
+def get_socket_connection(address, **kw):
+    """
+    get the connection to address shared by all handlers of this process, created with the given keyword arguments
+    (see SocketConnection) on first use
+
+    :param address: path of Unix domain socket or (host, port) tuple
+    :return: SocketConnection
+    """
+    global _connections_pid
+    key = address if isinstance(address, str) else tuple(address)
+    with _connections_lock:
+        if _connections_pid != os.getpid():
+            # connections inherited from the parent process are used by the parent
+            _connections.clear()
+            _connections_pid = os.getpid()
+        connection = _connections.get(key)
+        if connection is None:
+            connection = _connections[key] = SocketConnection(key, **kw)
+        return connection
+
+
+class SocketSinkHandler(logging.Handler):
+    """
+        Handler that encodes records in the calling thread and ships them in batches over a persistent socket
+        connection (see get_socket_connection) from a background sender thread. A batch is sent once it holds
+        **batch_size** bytes, **flush_interval** seconds after the previous one or as soon as a record at or above
+        **flush_level** is emitted.
+
+        While the peer can't be reached, up to **buffer_limit** bytes of records are kept in memory. Older records
+        are then appended to the **spill_path** file (shared by processes using the same path), which is sent first
+        once the peer is back, including spill files left by a previous run. Without spill file, or once it holds
+        **spill_limit** bytes, records are dropped and counted in **dropped_count**. Delivery is at least once:
+        a batch interrupted by a broken connection is sent again.
+    """
+
+    def __init__(self, address, framing=FRAMING_NEWLINE, tag='json_logging', batch_size=65536, flush_interval=1.0,
+                 flush_level=logging.ERROR, buffer_limit=8 * 1024 * 1024, spill_path=None,
+                 spill_limit=64 * 1024 * 1024, flush_timeout=5.0, connect_timeout=1.0, send_timeout=5.0,
+                 backoff_initial=0.1, backoff_max=30.0):
+        """
+        :param address: path of Unix domain socket or (host, port) tuple
+        :param framing: one of FRAMINGS
+        :param tag: Fluent tag of records for **forward** framing
+        :param flush_timeout: max seconds to wait for buffered records to be sent on flush and close
+        """
+        super(SocketSinkHandler, self).__init__()
+        if framing not in FRAMINGS:
+            raise ValueError('framing must be one of ' + str(FRAMINGS), framing)
+
+        self.address = address
+        self.framing = framing
+        self.tag = tag
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.flush_level = flush_level
+        self.buffer_limit = buffer_limit
+        self.spill_path = spill_path
+        self.spill_limit = spill_limit
+        self.flush_timeout = flush_timeout
+        self.dropped_count = 0
+        self._connection_options = dict(connect_timeout=connect_timeout, send_timeout=send_timeout,
+                                        backoff_initial=backoff_initial, backoff_max=backoff_max)
+        self._spill_lock = threading.Lock()
+
+        self._init_sender()
+        _fork_aware_handlers.add(self)
+
+    def _init_sender(self):
+        self._connection = get_socket_connection(self.address, **self._connection_options)
+        self._pending = []
+        self._pending_size = 0
+        self._sending = False
+        self._stopped = False
+        self._mutex = threading.Lock()
+        self._wakeup = threading.Condition(self._mutex)
+        self._idle = threading.Condition(self._mutex)
+        self._sender = threading.Thread(target=self._send_loop, name='json_logging-socket-sink', daemon=True)
+        self._sender.start()
+
+    def _after_fork_in_child(self):
+        # records buffered by the parent are sent by the parent
+        if not self._stopped:
+            self._spill_lock = threading.Lock()
+            self._init_sender()
+
+    def emit(self, record):
+        try:
+            entry = self.encode(record)
+        except RecursionError:
+            raise
+        except Exception:
+            self.handleError(record)
+            return
+
+        overflow = None
+        with self._mutex:
+            if self._pending and self._pending_size + len(entry) > self.buffer_limit:
+                overflow = self._take_pending()
+            self._pending.append(entry)
+            self._pending_size += len(entry)
+            if self._pending_size >= self.batch_size or record.levelno >= self.flush_level:
+                self._wakeup.notify()
+
+        if overflow:
+            self._spill(overflow, record)
+
+    def encode(self, record):
+        """
+        :param record: logging.LogRecord
+        :return: bytes of record as framed by **framing**
+        """
+        formatter = self.formatter or logging._defaultFormatter
+        if self.framing == FRAMING_NEWLINE:
+            if hasattr(formatter, 'format_bytes'):
+                return formatter.format_bytes(record) + b'\n'
+            return formatter.format(record).encode('utf-8') + b'\n'
+
+        if hasattr(formatter, 'format_object') and not formatter._custom_format:
+            log_object = formatter.format_object(record)
+        else:
+            log_object = {'message': formatter.format(record)}
+        seconds = int(record.created)
+        event_time = encoders.MsgpackExt(_EVENT_TIME_EXT_CODE, _EVENT_TIME.pack(
+            seconds, int((record.created - seconds) * 1e9)))
+        return encoders.msgpack_dumps([event_time, log_object])
+
+    def flush(self):
+        """
+        wait up to **flush_timeout** seconds for buffered records to be sent
+        """
+        with self._mutex:
+            self._wakeup.notify()
+            self._idle.wait_for(lambda: not self._pending and not self._sending, timeout=self.flush_timeout)
+
+    def close(self):
+        """
+        send buffered records within **flush_timeout** seconds, spill what's left
+        """
+        with self._mutex:
+            self._stopped = True
+            self._wakeup.notify()
+        self._sender.join(self.flush_timeout)
+        with self._mutex:
+            entries = self._take_pending()
+        if entries:
+            self._spill(entries)
+        super(SocketSinkHandler, self).close()
+
+    def _take_pending(self):
+        entries = self._pending
+        self._pending = []
+        self._pending_size = 0
+        return entries
+
+    def _send_loop(self):
+        failed = False
+        while True:
+            with self._mutex:
+                if not self._stopped and (failed or self._pending_size < self.batch_size):
+                    self._wakeup.wait(self.flush_interval)
+                stopped = self._stopped
+                entries = self._take_pending()
+                self._sending = True
+
+            try:
+                failed = not self._ship(entries)
+            except Exception:
+                # keep sending, e.g. once the peer accepts connections again
+                failed = True
+                self.handleError(None)
+            overflow = None
+            with self._mutex:
+                if failed and entries:
+                    # keep order, the records emitted meanwhile are newer
+                    self._pending[:0] = entries
+                    self._pending_size += sum(len(entry) for entry in entries)
+                    if self._pending_size > self.buffer_limit:
+                        overflow = self._take_pending()
+                self._sending = False
+                self._idle.notify_all()
+
+            if overflow:
+                self._spill(overflow)
+            if stopped:
+                return
+
+    def _ship(self, entries):
+        """
+        :return: True if the spill file and entries have been sent
+        """
+        if self.spill_path is not None and not self._send_spill_file():
+            return False
+        return not entries or self._connection.send(self._frame(entries))
+
+    def _frame(self, entries):
+        if self.framing == FRAMING_NEWLINE:
+            return b''.join(entries)
+        return encoders.msgpack_dumps([self.tag, b''.join(entries), {'size': len(entries)}])
+
+    def _drop(self, entries):
+        with self._mutex:
+            self.dropped_count += len(entries)
+
+    def _spill(self, entries, record=None):
+        """
+        append entries to the spill file, drop them if there is none, if it is full or can't be written
+        """
+        if self.spill_path is None:
+            self._drop(entries)
+            return
+
+        try:
+            data = self._frame(entries)
+            with self._spill_lock, open(self.spill_path, 'ab') as spill_file:
+                _lock_file(spill_file)
+                if spill_file.seek(0, os.SEEK_END) + len(data) > self.spill_limit:
+                    self._drop(entries)
+                    return
+                spill_file.write(data)
+                spill_file.flush()
+        except Exception:
+            self._drop(entries)
+            self.handleError(record)
+
+    def _send_spill_file(self):
+        """
+        :return: False if the spill file could not be sent, True if it has been sent, is empty or can't be read
+        """
+        try:
+            if not os.path.getsize(self.spill_path):
+                return True
+        except OSError:
+            return True
+
+        try:
+            with self._spill_lock, open(self.spill_path, 'r+b') as spill_file:
+                _lock_file(spill_file)
+                data = spill_file.read()
+                if data and not self._connection.send(data):
+                    return False
+                spill_file.truncate(0)
+                return True
+        except OSError:
+            # records buffered in memory are still sent
+            self.handleError(None)
+            return True
+
+
+def _lock_file(file):
+    # released on close, serializes spilling & sending of processes sharing the spill file
+    if fcntl is not None:
+        fcntl.flock(file.fileno(), fcntl.LOCK_EX)
+
+
+COMPRESSION_GZIP = 'gzip'
+COMPRESSION_ZSTD = 'zstd'
+COMPRESSIONS = (None, COMPRESSION_GZIP, COMPRESSION_ZSTD)
+
+_COMPRESSION_SUFFIXES = {None: '', COMPRESSION_GZIP: '.gz', COMPRESSION_ZSTD: '.zst'}
+_DEFAULT_COMPRESSION_LEVELS = {None: None, COMPRESSION_GZIP: 6, COMPRESSION_ZSTD: 3}
+
+
+def _load_compressor(compression, level, zstd_dictionary):
+    """
+    :return: function compressing bytes into a self-contained gzip member or zstd frame
+    """
+    if compression == COMPRESSION_GZIP:
+        return functools.partial(gzip.compress, compresslevel=level, mtime=0)
+    if compression == COMPRESSION_ZSTD:
+        import zstandard
+
+        dict_data = zstandard.ZstdCompressionDict(zstd_dictionary) if zstd_dictionary is not None else None
+        return zstandard.ZstdCompressor(level=level, dict_data=dict_data, write_content_size=True).compress
+    return bytes
+
+
+def train_zstd_dictionary(samples, dict_size=112640):
+    """
+    train a zstd dictionary for RotatingCompressedFileHandler, short JSON lines compress a lot better with it.
+    Requires the zstandard package
+
+    :param samples: list of sample lines as bytes, e.g. read from existing log files
+    :param dict_size: max size of dictionary in bytes
+    :return: dictionary as bytes
+    """
+    import zstandard
+
+    return zstandard.train_dictionary(dict_size, samples).as_bytes()
+
+
+class RotatingCompressedFileHandler(logging.Handler):
+    """
+        Handler writing JSON lines to compressed segment files, e.g. for batch jobs using init_non_web. Lines are
+        buffered and compressed into a self-contained frame (a gzip member or a zstd frame), appended to the
+        current segment with a single unbuffered write when
+
+        - the buffer holds at least **frame_size** bytes
+        - **flush_interval** seconds passed since the last write (checked by a background flusher thread)
+        - a record at or above **flush_level** is emitted
+        - the handler is flushed or closed
+
+        Segments are concatenations of complete frames, readable with zcat or zstdcat. Should the process crash,
+        only the frame being written may be torn. Segments are named
+        **<root>-<YYYYmmddTHHMMSS>-<pid>-<sequence><ext><suffix>**, e.g. job-20261018T120000-4242-0.jsonl.gz for
+        filename job.jsonl, and rotated after **max_bytes** bytes of lines or **rotate_interval** seconds.
+
+        Every frame written is appended as a JSON line to the **<root>.index.jsonl** index: segment file name,
+        offset & length of the frame, number of records, bytes of lines and created timestamps of its first &
+        last record, so readers can decompress frames of a time range only.
+
+        In forked child processes the flusher thread is restarted, lines buffered by the parent are discarded and
+        a new segment is started.
+    """
+
+    def __init__(self, filename, compression=COMPRESSION_GZIP, compression_level=None, frame_size=262144,
+                 max_bytes=256 * 1024 * 1024, rotate_interval=None, flush_interval=1.0, flush_level=logging.ERROR,
+                 zstd_dictionary=None, index=True, fsync=False):
+        """
+        :param filename: base name of segment files
+        :param compression: one of COMPRESSIONS, **zstd** requires the zstandard package
+        :param compression_level: default to 6 for gzip, 3 for zstd
+        :param max_bytes: bytes of lines (before compression) after which the segment is rotated, None for no limit
+        :param rotate_interval: seconds after which the segment is rotated, None for no limit
+        :param flush_interval: max seconds a record stays in buffer, None to disable time based flushing
+        :param zstd_dictionary: dictionary as bytes, see train_zstd_dictionary. Needed to decompress the segments
+        :param index: write the frame index
+        :param fsync: fsync segment files after every frame
+        """
+        super(RotatingCompressedFileHandler, self).__init__()
+        if compression not in COMPRESSIONS:
+            raise ValueError('compression must be one of ' + str(COMPRESSIONS), compression)
+
+        self.filename = os.path.abspath(filename)
+        self.compression = compression
+        self.compression_level = compression_level if compression_level is not None \
+            else _DEFAULT_COMPRESSION_LEVELS[compression]
+        self.frame_size = frame_size
+        self.max_bytes = max_bytes
+        self.rotate_interval = rotate_interval
+        self.flush_interval = flush_interval
+        self.flush_level = flush_level
+        self.fsync = fsync
+        self._compress = _load_compressor(compression, self.compression_level, zstd_dictionary)
+        self._root, self._ext = os.path.splitext(self.filename)
+        self.index_path = self._root + '.index.jsonl' if index else None
+        self._index_file = None
+
+        self._init_segments()
+        _fork_aware_handlers.add(self)
+
+    def _init_segments(self):
+        self._pending = bytearray()
+        self._pending_count = 0
+        self._first_created = None
+        self._last_created = None
+        self._segment = None
+        self._segment_name = None
+        self._segment_size = 0
+        self._segment_raw_size = 0
+        self._segment_opened_at = 0.0
+        self._sequence = 0
+        self._stopped = threading.Event()
+        self._flusher = None
+        if self.flush_interval:
+            self._flusher = threading.Thread(target=self._flush_loop, name='json_logging-file-flusher', daemon=True)
+            self._flusher.start()
+
+    def _flush_loop(self):
+        while not self._stopped.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception:
+                # e.g. disk full, lines stay buffered until the next flush
+                self.handleError(None)
+
+    def _after_fork_in_child(self):
+        if not self._stopped.is_set():
+            # the files are closed in the child only, the parent keeps writing them
+            self._close_files()
+            self._init_segments()
+
+    @property
+    def segment_path(self):
+        """
+        :return: path of the segment being written, None if no segment is open
+        """
+        return None if self._segment is None else self._segment_path(self._segment_name)
+
+    def _segment_path(self, name):
+        return os.path.join(os.path.dirname(self.filename), name)
+
+    def emit(self, record):
+        try:
+            formatter = self.formatter or logging._defaultFormatter
+            if hasattr(formatter, 'format_bytes'):
+                self._pending += formatter.format_bytes(record)
+            else:
+                self._pending += self.format(record).encode('utf-8')
+            self._pending += b'\n'
+            self._pending_count += 1
+            if self._first_created is None:
+                self._first_created = record.created
+            self._last_created = record.created
+
+            if record.levelno >= self.flush_level or len(self._pending) >= self.frame_size:
+                self.flush()
+        except RecursionError:
+            raise
+        except Exception:
+            self.handleError(record)
+
+    def flush(self):
+        """
+        write buffered lines as a complete frame, rotate the segment if due
+        """
+        self.acquire()
+        try:
+            if self._pending:
+                self._write_frame()
+            if self._segment is not None and self._rotation_due():
+                self._close_files()
+        finally:
+            self.release()
+
+    def close(self):
+        self._stopped.set()
+        try:
+            self.flush()
+        finally:
+            self.acquire()
+            try:
+                self._close_files()
+            finally:
+                self.release()
+            super(RotatingCompressedFileHandler, self).close()
+
+    def _rotation_due(self):
+        if self.max_bytes is not None and self._segment_raw_size >= self.max_bytes:
+            return True
+        return self.rotate_interval is not None and \
+            time.monotonic() - self._segment_opened_at >= self.rotate_interval
+
+    def _open_segment(self):
+        self._segment_name = '%s-%s-%d-%d%s%s' % (
+            os.path.basename(self._root), time.strftime('%Y%m%dT%H%M%S', time.gmtime()), os.getpid(),
+            self._sequence, self._ext, _COMPRESSION_SUFFIXES[self.compression])
+        self._sequence += 1
+        self._segment = open(self._segment_path(self._segment_name), 'ab', buffering=0)
+        self._segment_size = self._segment.seek(0, os.SEEK_END)
+        self._segment_raw_size = 0
+        self._segment_opened_at = time.monotonic()
+        if self.index_path is not None and self._index_file is None:
+            self._index_file = open(self.index_path, 'ab', buffering=0)
+
+    def _write_frame(self):
+        if self._segment is None:
+            self._open_segment()
+
+        frame = self._compress(bytes(self._pending))
+        offset = self._segment_size
+        _write_all(self._segment, frame)
+        self._segment_size += len(frame)
+        self._segment_raw_size += len(self._pending)
+        entry = {
+            'segment': self._segment_name, 'offset': offset, 'length': len(frame),
+            'records': self._pending_count, 'raw_bytes': len(self._pending),
+            'first_created': self._first_created, 'last_created': self._last_created,
+        }
+        # the frame is written, an index or fsync error must not write it again
+        del self._pending[:]
+        self._pending_count = 0
+        self._first_created = None
+        self._last_created = None
+
+        if self.fsync:
+            os.fsync(self._segment.fileno())
+        if self._index_file is not None:
+            # a single small append, lines of processes sharing the index don't interleave
+            _write_all(self._index_file, json.dumps(entry).encode('utf-8') + b'\n')
+
+    def _close_files(self):
+        if self._segment is not None:
+            self._segment.close()
+            self._segment = None
+        if self._index_file is not None:
+            self._index_file.close()
+            self._index_file = None
+
+
+def _write_all(file, data):
+    view = memoryview(data)
+    while view:
+        view = view[file.write(view):]
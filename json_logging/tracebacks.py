@@ -0,0 +1,252 @@
+# coding=utf-8
+"""
+    Exception rendering for the log formatters. Everything derived from the stack of an exception (formatted
+    traceback lines, structured frames and fingerprint) is cached, keyed by exception type and the code objects &
+    instructions of its frames, so an exception raised over and over from the same place is only rendered once.
+    The exception message is still rendered for every record.
+"""
+import collections
+import hashlib
+import threading
+import traceback
+
+import json_logging
+
+_CAUSE_MESSAGE = '\nThe above exception was the direct cause of the following exception:\n\n'
+_CONTEXT_MESSAGE = '\nDuring handling of the above exception, another exception occurred:\n\n'
+_TRACEBACK_HEADER = 'Traceback (most recent call last):\n'
+
+try:
+    # rendered by traceback, uncached
+    _EXCEPTION_GROUP_TYPES = (BaseExceptionGroup,)
+except NameError:
+    _EXCEPTION_GROUP_TYPES = ()
+
+
+class _RenderedStack(object):
+    """
+        Cached rendering of the stacks of an exception chain, root cause first
+    """
+    __slots__ = ('connectors', 'formatted_frames', 'frames', 'fingerprint')
+
+    def __init__(self, connectors, formatted_frames, frames, fingerprint):
+        self.connectors = connectors
+        self.formatted_frames = formatted_frames
+        self.frames = frames
+        self.fingerprint = fingerprint
+
+
+class TracebackCache(object):
+    """
+        LRU cache of rendered exception stacks
+    """
+
+    def __init__(self, size=256):
+        self.size = size
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, chain):
+        """
+        :param chain: exception chain as returned by get_exception_chain
+        :return: _RenderedStack
+        """
+        key = tuple((type(exc), connector, _get_stack_key(tb)) for exc, tb, connector in chain)
+        with self._lock:
+            rendered = self._entries.get(key)
+            if rendered is not None:
+                self._entries.move_to_end(key)
+                return rendered
+
+        rendered = _render_stack(chain)
+        with self._lock:
+            self._entries[key] = rendered
+            if len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+        return rendered
+
+
+_traceback_cache = None
+
+
+def get_traceback_cache():
+    """
+    :return: TracebackCache shared by all formatters, sized by json_logging.EXCEPTION_CACHE_SIZE
+    """
+    global _traceback_cache
+    if _traceback_cache is None:
+        _traceback_cache = TracebackCache(json_logging.EXCEPTION_CACHE_SIZE)
+    return _traceback_cache
+
+
+def get_exception_chain(exc_info):
+    """
+    :param exc_info: (type, value, traceback) tuple
+    :return: list of (exception, traceback, connector message) tuples in the order traceback prints them or None
+        if the exception can't be rendered from cache
+    """
+    exc_value = exc_info[1]
+    chain = []
+    seen = set()
+    connector = ''
+    while exc_value is not None and id(exc_value) not in seen:
+        if _is_exception_group(exc_value):
+            return None
+        seen.add(id(exc_value))
+        chain.append((exc_value, exc_value.__traceback__ if chain else exc_info[2], connector))
+
+        if exc_value.__cause__ is not None:
+            exc_value, connector = exc_value.__cause__, _CAUSE_MESSAGE
+        elif exc_value.__context__ is not None and not exc_value.__suppress_context__:
+            exc_value, connector = exc_value.__context__, _CONTEXT_MESSAGE
+        else:
+            break
+
+    if not chain:
+        return None
+
+    # the connector printed before an exception is the one that led to the exception printed before it
+    connectors = [entry[2] for entry in chain[1:]] + ['']
+    return [(exc, tb, connectors[i]) for i, (exc, tb, _) in enumerate(chain)][::-1]
+
+
+def format_exception_text(exc_info):
+    """
+    render exception like traceback.format_exception, innermost json_logging.EXCEPTION_MAX_FRAMES frames per
+    traceback and at most the last json_logging.EXCEPTION_MAX_SIZE characters
+
+    :param exc_info: (type, value, traceback) tuple
+    :return: str
+    """
+    chain = get_exception_chain(exc_info)
+    if chain is None:
+        text = ''.join(traceback.format_exception(*exc_info))
+    else:
+        rendered = get_traceback_cache().get(chain)
+        max_frames = json_logging.EXCEPTION_MAX_FRAMES
+        parts = []
+        for (exc, tb, _), connector, formatted_frames in zip(chain, rendered.connectors, rendered.formatted_frames):
+            parts.append(connector)
+            if tb is not None:
+                parts.append(_TRACEBACK_HEADER)
+                if max_frames is not None and len(formatted_frames) > max_frames:
+                    parts.append('  ... %d frames omitted\n' % (len(formatted_frames) - max_frames))
+                    formatted_frames = formatted_frames[-max_frames:] if max_frames else []
+                parts.extend(formatted_frames)
+            parts.extend(_format_exception_only(exc))
+        text = ''.join(parts)
+
+    max_size = json_logging.EXCEPTION_MAX_SIZE
+    if max_size is not None and len(text) > max_size:
+        # the end holds the exception that has been logged
+        text = '...' + text[len(text) - max_size + 3:]
+    return text
+
+
+def format_exception_structured(exc_info):
+    """
+    render exception as dict with **type**, **message** and **frames** (file, line, function) of the
+    innermost json_logging.EXCEPTION_MAX_FRAMES frames. The exception that caused it is nested as **cause** or
+    **context**. Messages are truncated to json_logging.EXCEPTION_MAX_SIZE characters.
+
+    :param exc_info: (type, value, traceback) tuple
+    :return: dict
+    """
+    chain = get_exception_chain(exc_info)
+    if chain is None:
+        exc_value = exc_info[1]
+        return {'type': _get_type_name(exc_info[0]), 'message': _truncate(_get_message(exc_value)), 'frames': []}
+
+    rendered = get_traceback_cache().get(chain)
+    max_frames = json_logging.EXCEPTION_MAX_FRAMES
+    structured = None
+    for (exc, _, _), connector, frames in zip(chain, rendered.connectors, rendered.frames):
+        exception = {'type': _get_type_name(type(exc)), 'message': _truncate(_get_message(exc))}
+        if max_frames is not None and len(frames) > max_frames:
+            exception['frames_omitted'] = len(frames) - max_frames
+            frames = frames[-max_frames:] if max_frames else []
+        exception['frames'] = frames
+        if structured is not None:
+            exception['cause' if connector == _CAUSE_MESSAGE else 'context'] = structured
+        structured = exception
+    return structured
+
+
+def get_exception_fingerprint(exc_info):
+    """
+    :param exc_info: (type, value, traceback) tuple
+    :return: hex digest identifying exception types & code locations of an exception chain, the same across
+        processes, independent of exception messages
+    """
+    chain = get_exception_chain(exc_info)
+    if chain is None:
+        return _fingerprint([(exc_info[0], [])])
+    return get_traceback_cache().get(chain).fingerprint
+
+
+def _render_stack(chain):
+    connectors = []
+    formatted_frames = []
+    frames = []
+    for exc, tb, connector in chain:
+        stack = traceback.extract_tb(tb) if tb is not None else traceback.StackSummary()
+        connectors.append(connector)
+        formatted_frames.append(stack.format())
+        frames.append([{'file': frame.filename, 'line': frame.lineno, 'function': frame.name} for frame in stack])
+    fingerprint = _fingerprint([(type(exc), exc_frames) for (exc, _, _), exc_frames in zip(chain, frames)])
+    return _RenderedStack(connectors, formatted_frames, frames, fingerprint)
+
+
+def _fingerprint(exceptions):
+    digest = hashlib.blake2b(digest_size=8)
+    for exc_type, frames in exceptions:
+        digest.update(_get_type_name(exc_type).encode('utf-8'))
+        for frame in frames:
+            digest.update(('|%s:%s:%s' % (frame['file'], frame['function'], frame['line'])).encode('utf-8'))
+        digest.update(b'\n')
+    return digest.hexdigest()
+
+
+def _format_exception_only(exc):
+    if isinstance(exc, SyntaxError) or hasattr(exc, '__notes__'):
+        return traceback.format_exception_only(type(exc), exc)
+    # same as traceback.format_exception_only, without extracting the stacks of the whole exception chain again
+    message = _get_message(exc)
+    if not message:
+        return [_get_type_name(type(exc)) + '\n']
+    return ['%s: %s\n' % (_get_type_name(type(exc)), message)]
+
+
+def _get_stack_key(tb):
+    key = []
+    while tb is not None:
+        key.append((tb.tb_frame.f_code, tb.tb_lasti))
+        tb = tb.tb_next
+    return tuple(key)
+
+
+def _get_type_name(exc_type):
+    if exc_type is None:
+        return 'None'
+    module = exc_type.__module__
+    if module in ('__main__', 'builtins'):
+        return exc_type.__qualname__
+    return module + '.' + exc_type.__qualname__
+
+
+def _get_message(exc_value):
+    try:
+        return str(exc_value)
+    except Exception:
+        return '<exception str() failed>'
+
+
+def _truncate(message):
+    max_size = json_logging.EXCEPTION_MAX_SIZE
+    if max_size is not None and len(message) > max_size:
+        return message[:max_size]
+    return message
+
+
+def _is_exception_group(exc_value):
+    return isinstance(exc_value, _EXCEPTION_GROUP_TYPES)
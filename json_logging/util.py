@@ -1,13 +1,14 @@
 # coding=utf-8
+import functools
 import logging
 import os
 import re
 import sys
+import time
 from datetime import datetime
 from logging import Logger, StreamHandler
 
 import json_logging
-import inspect
 
 
 def is_env_var_toggle(var_name):
@@ -43,7 +44,15 @@ def update_formatter_for_loggers(loggers_iter, formatter):
     for logger in loggers_iter:
         if not isinstance(logger, Logger):
             raise RuntimeError("%s is not a logging.Logger instance", logger)
+        if issubclass(formatter, json_logging.formatters.JSONLogWebFormatter):
+            json_logging.filters.add_request_filters(logger)
+        if issubclass(formatter, json_logging.formatters.JSONLogFormatter) and \
+                (json_logging.LOG_DEDUPLICATION_WINDOW or json_logging.LOG_RATE_LIMIT):
+            json_logging.filters.add_deduplication_filter(logger)
         for handler in logger.handlers:
+            # records handed over to a background writer are formatted by its target
+            while isinstance(handler, json_logging.handlers.AsyncHandler):
+                handler = handler.target
             if not isinstance(handler.formatter, formatter):
                 handler.formatter = formatter()
 
@@ -84,6 +93,48 @@ def iso_time_format(datetime_):
         int(datetime_.microsecond / 1000))
 
 
+class TimestampRenderer(object):
+    """
+        Render the written_at / written_ts pair of a log record from its epoch time (e.g. LogRecord.created).
+        The "YYYY-MM-DDTHH:MM:SS" prefix is cached per second so only the millisecond suffix is rendered per record.
+        In coarse mode timestamps are truncated to milliseconds and the whole pair is reused within a millisecond.
+    """
+
+    def __init__(self, coarse=False):
+        self.coarse = coarse
+        self._second_prefix = (None, None)
+        self._last_millisecond = (None, None)
+
+    def render(self, created):
+        """
+        :param created: epoch time in seconds as float
+        :return: tuple of ISO-8601 UTC time string with milliseconds and epoch time in nanoseconds
+        """
+        if self.coarse:
+            millisecond = int(created * 1000)
+            cached_millisecond, timestamps = self._last_millisecond
+            if cached_millisecond != millisecond:
+                timestamps = self._render(millisecond // 1000, (millisecond % 1000) * 1000)
+                self._last_millisecond = (millisecond, timestamps)
+            return timestamps
+
+        # rounded to the nearest microsecond like datetime.fromtimestamp
+        second = int(created)
+        microsecond = round((created - second) * 1000000)
+        if microsecond >= 1000000:
+            second += 1
+            microsecond -= 1000000
+        return self._render(second, microsecond)
+
+    def _render(self, second, microsecond):
+        cached_second, prefix = self._second_prefix
+        if cached_second != second:
+            prefix = time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(second))
+            self._second_prefix = (second, prefix)
+
+        return '%s.%03dZ' % (prefix, microsecond // 1000), (second * 1000000 + microsecond) * 1000
+
+
 if hasattr(sys, '_getframe'):
     currentframe = lambda _no_of_go_up_level: sys._getframe(_no_of_go_up_level)
 else:  # pragma: no cover
@@ -118,9 +169,45 @@ class RequestUtil(object):
             cls._instance.response_adapter = response_info_extractor_class()
             cls._instance.is_support_global_request_object = request_info_extractor_class.support_global_request_object()
             cls._instance.create_correlation_id_if_not_exists = json_logging.CREATE_CORRELATION_ID_IF_NOT_EXISTS
+            cls._instance._init_snapshot_fields(json_logging.REQUEST_LOG_FIELDS)
 
         return cls._instance
 
+    def _init_snapshot_fields(self, field_names):
+        all_field_names = json_logging.dto.REQUEST_FIELDS + json_logging.dto.RESPONSE_FIELDS
+        if field_names is None:
+            field_names = all_field_names
+        for name in field_names:
+            if name not in all_field_names:
+                raise ValueError(name + ' is not a request log field, must be one of ' + str(all_field_names))
+
+        # keep output order regardless of the order of configured field names
+        field_names = [name for name in all_field_names if name in field_names]
+        self._snapshot_correlation_id = 'correlation_id' in field_names
+        self._snapshot_request_fields = tuple(name for name in field_names if name in json_logging.dto.REQUEST_FIELDS
+                                              and name != 'correlation_id')
+        self._snapshot_response_fields = tuple(name for name in field_names if name in json_logging.dto.RESPONSE_FIELDS)
+        self._snapshot_keys = tuple(json_logging.CORRELATION_ID_FIELD if name == 'correlation_id' else name
+                                    for name in field_names)
+
+    def create_snapshot(self, request, response):
+        """
+        Extract the request log information of request and response in a single pass.
+        Fields are selected by json_logging.REQUEST_LOG_FIELDS
+
+        :param request: request object
+        :param response: response object
+        :return: json_logging.dto.RequestResponseSnapshot
+        """
+        values = []
+        if self._snapshot_correlation_id:
+            values.append(self.get_correlation_id(request))
+        if self._snapshot_request_fields:
+            values.extend(self.request_adapter.extract_fields(request, self._snapshot_request_fields))
+        if self._snapshot_response_fields:
+            values.extend(self.response_adapter.extract_fields(response, self._snapshot_response_fields))
+        return json_logging.dto.RequestResponseSnapshot(self._snapshot_keys, tuple(values))
+
     def get_correlation_id(self, request=None, within_formatter=False):
         """
         Gets the correlation id from the header of the request. \
@@ -130,29 +217,45 @@ class RequestUtil(object):
         :return: correlation id string
         """
 
+        context = json_logging.context.get_request_context()
         if request is None:
-            if self.is_support_global_request_object:
+            if context is not None:
+                if context.correlation_id is not None:
+                    return context.correlation_id
+                request = context.request
+            elif self.is_support_global_request_object:
                 request = self.request_info_extractor_class.get_current_request()
             else:
                 request = self.get_request_from_call_stack()
 
             if request is None:
                 return json_logging.EMPTY_VALUE
+        elif context is not None:
+            if context.request is not request:
+                context = None
+            elif context.correlation_id is not None:
+                return context.correlation_id
 
         correlation_id = self.request_adapter.get_correlation_id_in_request_context(request)
-        if correlation_id is not None:
-            return correlation_id
 
-        correlation_id = self._get_correlation_id_in_request_header(self.request_adapter, request)
+        if correlation_id is None:
+            correlation_id = self._get_correlation_id_in_request_header(self.request_adapter, request)
+
+            if correlation_id is None and self.create_correlation_id_if_not_exists:
+                correlation_id = str(json_logging.CORRELATION_ID_GENERATOR())
+                if context is None:
+                    # otherwise the request context below keeps it for the rest of the request
+                    self.request_adapter.set_correlation_id(request, correlation_id)
 
-        if correlation_id is None and self.create_correlation_id_if_not_exists:
-            correlation_id = str(json_logging.CORRELATION_ID_GENERATOR())
-            self.request_adapter.set_correlation_id(request, correlation_id)
+        if context is not None and correlation_id:
+            context.correlation_id = correlation_id
 
         return correlation_id if correlation_id else json_logging.EMPTY_VALUE
 
     def get_request_from_call_stack(self, within_formatter=False):
         """
+        Fallback for frameworks without global request object when no request context has been published
+        (see json_logging.context).
 
         :return: get request object from call stack
         """
@@ -170,8 +273,6 @@ class RequestUtil(object):
             09 info [__init__.py:1279]
             10 logging statement
         """
-        module = inspect.getmodule(inspect.currentframe().f_back)
-
         class_type = self.request_info_extractor_class.get_request_class_type()
         no_of_go_up_level = 11 if within_formatter else 1
 
@@ -206,5 +307,102 @@ class RequestUtil(object):
         return None
 
 
+_REGEX_SPECIAL_CHARS = frozenset('.^$*+?{}[]\\|()')
+# numbered backreferences refer to group positions, which shift when patterns are combined
+_NUMBERED_BACKREFERENCE = re.compile(r'\\[1-9]')
+
+
+def parse_request_start_time(value):
+    """
+    parse the request start time a proxy puts in e.g. X-Request-Start header. Values may be prefixed by "t=" and
+    given in seconds (with fraction), milliseconds or microseconds since epoch
+
+    :param value: header value
+    :return: epoch seconds or None if value can not be parsed
+    """
+    if not value:
+        return None
+    if value.startswith('t='):
+        value = value[2:]
+    try:
+        request_start = float(value)
+    except ValueError:
+        return None
+
+    # tell units apart by magnitude
+    if request_start > 1e14:
+        return request_start / 1e6
+    if request_start > 1e11:
+        return request_start / 1e3
+    return request_start
+
+
+class UrlPatternMatcher(object):
+    """
+        Matches URL paths against a list of regex patterns with re.search semantics, compiled once:
+
+        - patterns without regex special characters are checked as substrings
+        - "^" followed by such a literal is checked as a prefix
+        - patterns with numbered backreferences are compiled on their own
+        - all other patterns are combined into a single regex
+
+        Decisions for recently seen paths are kept in a bounded LRU cache.
+        Iterating over the matcher yields the original patterns.
+    """
+
+    def __init__(self, patterns, cache_size=1024):
+        self.patterns = list(patterns)
+        self._literals = []
+        self._prefixes = []
+        self._regexes = []
+
+        regex_sources = []
+        for pattern in self.patterns:
+            if not isinstance(pattern, str):
+                self._regexes.append(pattern)
+            elif not _REGEX_SPECIAL_CHARS.intersection(pattern):
+                self._literals.append(pattern)
+            elif pattern.startswith('^') and not _REGEX_SPECIAL_CHARS.intersection(pattern[1:]):
+                self._prefixes.append(pattern[1:])
+            elif _NUMBERED_BACKREFERENCE.search(pattern):
+                self._regexes.append(re.compile(pattern))
+            else:
+                regex_sources.append(pattern)
+
+        if regex_sources:
+            try:
+                self._regexes.append(re.compile('|'.join('(?:%s)' % source for source in regex_sources)))
+            except re.error:
+                # e.g. patterns with global inline flags can not be combined
+                self._regexes.extend(re.compile(source) for source in regex_sources)
+
+        self._prefixes = tuple(self._prefixes)
+        self.is_excluded = functools.lru_cache(maxsize=cache_size)(self._is_excluded) if self.patterns \
+            else self._is_excluded
+
+    def _is_excluded(self, path):
+        """
+        :param path: URL path
+        :return: whether path matches any of the patterns
+        """
+        if self._prefixes and path.startswith(self._prefixes):
+            return True
+        for literal in self._literals:
+            if literal in path:
+                return True
+        for regex in self._regexes:
+            if regex.search(path) is not None:
+                return True
+        return False
+
+    def __iter__(self):
+        return iter(self.patterns)
+
+    def __len__(self):
+        return len(self.patterns)
+
+
 def is_not_match_any_pattern(path, patterns):
+    if isinstance(patterns, UrlPatternMatcher):
+        return not patterns.is_excluded(path)
     return all(map(lambda pattern: re.search(pattern, path) is None, patterns))
\ No newline at end of file
@@ -0,0 +1,18 @@
+# coding=utf-8
+import timeit
+import uuid
+
+from json_logging.correlation_id import CounterIdGenerator, ULIDGenerator, BufferedUUID4Generator
+
+numbers = 1000000
+
+generators = [
+    ('uuid1 (default)', lambda: str(uuid.uuid1())),
+    ('uuid4', lambda: str(uuid.uuid4())),
+    ('CounterIdGenerator', CounterIdGenerator()),
+    ('ULIDGenerator', ULIDGenerator()),
+    ('BufferedUUID4Generator', BufferedUUID4Generator()),
+]
+
+for name, generator in generators:
+    print(name, generator(), timeit.timeit(generator, number=numbers))
@@ -0,0 +1,32 @@
+# coding=utf-8
+"""
+    Compare bytes per record and encode cost of JSON lines with the binary record encodings, for the same log
+    objects rendered by JSONLogFormatter. The msgpack and cbor2 packages are used when installed.
+"""
+import logging
+import timeit
+
+import json_logging
+from json_logging import encoders
+from json_logging.encoders import LENGTH_PREFIX
+
+numbers = 100000
+
+json_logging.init_non_web(enable_json=True)
+formatter = json_logging.JSONLogFormatter()
+records = [
+    logging.LogRecord('app', logging.INFO, __file__, 42, 'processed order %s in %d ms', ('4f2a9c', 12), None),
+    logging.LogRecord('app', logging.WARNING, __file__, 42, 'slow query', None, None),
+]
+records[1].props = {'query': 'SELECT * FROM orders WHERE id = ?', 'duration_ms': 1234.5, 'rows': 1, 'cached': False}
+
+encodings = [('json lines', None, b'\n'), ('json length-prefixed', None, None)]
+encodings += [(name, encoders.get_record_encoding(name), None) for name in ('msgpack', 'cbor')]
+
+for name, encoding, terminator in encodings:
+    for record in records:
+        data = formatter.format_encoded(record, encoding)
+        size = len(data) + (len(terminator) if terminator else LENGTH_PREFIX.size)
+        seconds = timeit.timeit(lambda: formatter.format_encoded(record, encoding), number=numbers)
+        print('%-22s %-8s %4d bytes/record %6.2f us/record' % (name, record.levelname, size,
+                                                               seconds / numbers * 1e6))
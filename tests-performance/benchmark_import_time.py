@@ -0,0 +1,66 @@
+# coding=utf-8
+"""
+    Measure the cold import time of json_logging with python -X importtime, e.g.
+
+        python tests-performance/benchmark_import_time.py --budget-ms 50
+
+    Exits with status 1 if the median of the runs exceeds the budget or if a web framework has been imported.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+WEB_FRAMEWORK_PACKAGES = {'flask', 'werkzeug', 'sanic', 'quart', 'connexion', 'fastapi', 'starlette'}
+PACKAGE_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def measure_import():
+    """
+    :return: (cumulative import time of json_logging in microseconds, names of top level packages it imported)
+    """
+    output = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import json_logging'], cwd=PACKAGE_ROOT,
+                            stderr=subprocess.PIPE, universal_newlines=True, check=True).stderr
+    cumulative_us = None
+    imported = set()
+    for line in output.splitlines():
+        if not line.startswith('import time:') or '|' not in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        if not cumulative.strip().isdigit():
+            continue
+        imported.add(name.strip().split('.')[0])
+        if name.strip() == 'json_logging':
+            cumulative_us = int(cumulative)
+    return cumulative_us, imported
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--budget-ms', type=float, default=None)
+    args = parser.parse_args()
+
+    timings = []
+    imported = set()
+    for _ in range(args.runs):
+        cumulative_us, run_imported = measure_import()
+        timings.append(cumulative_us / 1000.0)
+        imported |= run_imported
+
+    median_ms = statistics.median(timings)
+    print('import json_logging: median %.1f ms, min %.1f ms, max %.1f ms' % (median_ms, min(timings), max(timings)))
+
+    web_frameworks = sorted(imported & WEB_FRAMEWORK_PACKAGES)
+    if web_frameworks:
+        print('web frameworks imported: ' + ', '.join(web_frameworks))
+        return 1
+    if args.budget_ms is not None and median_ms > args.budget_ms:
+        print('over budget of %.1f ms' % args.budget_ms)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
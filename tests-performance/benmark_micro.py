@@ -43,6 +43,21 @@ print(timeit2)
 timeit3 = timeit.timeit(lambda: (int((utcnow - _epoch).total_seconds()) * 1000000 + utcnow.microsecond) * 1000,
                         number=numbers)
 print(timeit3)
+# record.created based rendering with the per-second prefix cache
+from json_logging.util import TimestampRenderer, iso_time_format, epoch_nano_second
+
+created = time.time()
+timestamp_renderer = TimestampRenderer()
+coarse_timestamp_renderer = TimestampRenderer(coarse=True)
+
+timeit4 = timeit.timeit(lambda: (iso_time_format(utcnow), epoch_nano_second(utcnow)), number=numbers)
+print(timeit4)
+
+timeit5 = timeit.timeit(lambda: timestamp_renderer.render(created), number=numbers)
+print(timeit5)
+
+timeit6 = timeit.timeit(lambda: coarse_timestamp_renderer.render(created), number=numbers)
+print(timeit6)
 # 1456820553816849408
 # 1496635859
 # 1496637019171670000
@@ -0,0 +1,125 @@
+"""Test suite for the per-request log buffering"""
+import json
+import logging
+
+import flask
+import pytest
+
+from helpers.handler import FormattedMessageCollectorHandler
+from helpers.imports import undo_imports_from_package
+
+LOGGER_NAME = "buffering-test"
+
+
+@pytest.fixture
+def client_and_log_handlers():
+    import json_logging
+
+    json_logging.REQUEST_LOG_BUFFERING = True
+    json_logging.REQUEST_LOG_BUFFER_SIZE = 2
+    app = flask.Flask(__name__)
+    logger = logging.getLogger(LOGGER_NAME)
+    logger.setLevel(logging.DEBUG)
+    app_handler = FormattedMessageCollectorHandler()
+    logger.addHandler(app_handler)
+    json_logging.init_flask(enable_json=True)
+    json_logging.init_request_instrument(app)
+    request_logger = logging.getLogger("flask-request-logger")
+    request_handler = FormattedMessageCollectorHandler()
+    request_handler.setFormatter(json_logging.JSONRequestLogFormatter())
+    request_logger.addHandler(request_handler)
+
+    @app.route("/status/<int:status>")
+    def respond(status):
+        logger.debug("first")
+        logger.info("second")
+        logger.warning("warning")
+        logger.info("third")
+        return {}, status
+
+    yield app.test_client(), app_handler, request_handler
+
+    logger.removeHandler(app_handler)
+    request_logger.removeHandler(request_handler)
+    undo_imports_from_package("json_logging")  # Necessary because of json-logging's global state
+
+
+def test_records_dropped_for_successful_requests(client_and_log_handlers):
+    """Test if buffered records of a successful request are only counted in the request log"""
+    client, app_handler, request_handler = client_and_log_handlers
+
+    assert client.get("/status/200").status_code == 200
+    assert [json.loads(message)["msg"] for message in app_handler.messages] == ["warning"]
+    assert json.loads(request_handler.messages[0])["suppressed_log_count"] == 3
+
+    app_handler.reset()
+    logging.getLogger(LOGGER_NAME).info("outside of requests")
+    assert len(app_handler.messages) == 1
+
+
+def test_records_flushed_for_failed_requests(client_and_log_handlers):
+    """Test if buffered records of a failed request are written in order, up to the buffer size"""
+    client, app_handler, request_handler = client_and_log_handlers
+
+    assert client.get("/status/503").status_code == 503
+    messages = [json.loads(message) for message in app_handler.messages]
+    assert [msg["msg"] for msg in messages] == ["warning", "second", "third"]
+    assert len({msg["correlation_id"] for msg in messages}) == 1
+    assert json.loads(request_handler.messages[0])["suppressed_log_count"] == 1
+
+
+def test_records_buffered_once_per_logger(client_and_log_handlers):
+    """Test if records are buffered & counted once, also for handlers added after init"""
+    client, app_handler, request_handler = client_and_log_handlers
+    late_handler = FormattedMessageCollectorHandler()
+    logger = logging.getLogger(LOGGER_NAME)
+    logger.addHandler(late_handler)
+
+    try:
+        assert client.get("/status/200").status_code == 200
+        assert json.loads(request_handler.messages[0])["suppressed_log_count"] == 3
+        assert [json.loads(message)["msg"] for message in late_handler.messages] == ["warning"]
+
+        assert client.get("/status/503").status_code == 503
+        for handler in (app_handler, late_handler):
+            assert [json.loads(message)["msg"] for message in handler.messages] == \
+                   ["warning", "warning", "second", "third"]
+    finally:
+        logger.removeHandler(late_handler)
+
+
+@pytest.mark.parametrize("status, written", [(200, []), (503, ["child"])])
+def test_records_of_child_loggers_buffered_once(status, written):
+    """Test if records propagated from loggers created after init are buffered once by the handlers of a parent"""
+    import json_logging
+
+    json_logging.REQUEST_LOG_BUFFERING = True
+    app = flask.Flask(__name__)
+    logger = logging.getLogger(LOGGER_NAME)
+    logger.setLevel(logging.DEBUG)
+    handlers = [FormattedMessageCollectorHandler(), FormattedMessageCollectorHandler()]
+    for handler in handlers:
+        logger.addHandler(handler)
+    json_logging.init_flask(enable_json=True)
+    json_logging.init_request_instrument(app)
+    request_logger = logging.getLogger("flask-request-logger")
+    request_handler = FormattedMessageCollectorHandler()
+    request_handler.setFormatter(json_logging.JSONRequestLogFormatter())
+    request_logger.addHandler(request_handler)
+    child_logger = logging.getLogger(LOGGER_NAME + ".child")
+
+    @app.route("/status/<int:status>")
+    def respond(status):
+        child_logger.info("child")
+        return {}, status
+
+    try:
+        assert app.test_client().get("/status/%d" % status).status_code == status
+        assert json.loads(request_handler.messages[0]).get("suppressed_log_count", 0) == 1 - len(written)
+        for handler in handlers:
+            assert [json.loads(message)["msg"] for message in handler.messages] == written
+    finally:
+        for handler in handlers:
+            logger.removeHandler(handler)
+        request_logger.removeHandler(request_handler)
+        undo_imports_from_package("json_logging")
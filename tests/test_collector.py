@@ -0,0 +1,139 @@
+"""Test suite for the multi-process log collector"""
+import io
+import json
+import logging
+import os
+import socket
+import struct
+import sys
+import time
+
+import pytest
+
+from helpers.imports import undo_imports_from_package
+
+LOGGER_NAME = "collector-test"
+
+pytestmark = pytest.mark.skipif(not hasattr(socket, "AF_UNIX"), reason="requires Unix sockets")
+
+
+@pytest.fixture
+def json_logging():
+    import json_logging
+
+    yield json_logging
+
+    undo_imports_from_package("json_logging")  # Necessary because of json-logging's global state
+
+
+@pytest.fixture
+def socket_path(tmp_path):
+    return str(tmp_path / "collector.sock")
+
+
+def make_record(msg="test message", level=logging.INFO):
+    return logging.LogRecord(LOGGER_NAME, level, __file__, 42, msg, None, None)
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def read_lines(stream):
+    return stream.buffer.getvalue().decode("utf-8").splitlines()
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="requires fork")
+def test_forked_workers_do_not_interleave_lines(json_logging, socket_path):
+    """Test if large lines of forked workers, logged through async handlers, reach the collector untorn"""
+    from json_logging.collector import LogCollector, CollectorHandler
+
+    output = io.TextIOWrapper(io.BytesIO(), encoding="utf-8")
+    collector = LogCollector(socket_path, output)
+    collector.start()
+
+    fallback = io.TextIOWrapper(io.BytesIO(), encoding="utf-8")
+    target = CollectorHandler(socket_path, fallback, buffer_size=256 * 1024)
+    target.setFormatter(json_logging.JSONLogFormatter())
+    handler = json_logging.AsyncHandler(target)
+
+    workers = []
+    for worker in range(4):
+        pid = os.fork()
+        if pid == 0:
+            exit_code = 1
+            try:
+                for index in range(50):
+                    handler.handle(make_record("%d-%d-%s" % (worker, index, "x" * 10000)))
+                handler.flush()
+                exit_code = 0
+            finally:
+                os._exit(exit_code)
+        workers.append(pid)
+
+    for pid in workers:
+        assert os.waitpid(pid, 0)[1] == 0
+    assert wait_for(lambda: len(read_lines(output)) >= 200)
+    handler.close()
+    collector.close()
+
+    messages = sorted(json.loads(line)["msg"].split("-")[0:2] for line in read_lines(output))
+    assert messages == sorted([str(worker), str(index)] for worker in range(4) for index in range(50))
+    assert fallback.buffer.getvalue() == b""
+    assert not os.path.exists(socket_path)
+
+
+def test_collector_handler_falls_back_to_stream(json_logging, socket_path):
+    """Test if lines are written to the fallback stream while the collector can't be reached"""
+    from json_logging.collector import LogCollector, CollectorHandler
+
+    fallback = io.TextIOWrapper(io.BytesIO(), encoding="utf-8")
+    handler = CollectorHandler(socket_path, fallback, reconnect_interval=0)
+    handler.setFormatter(json_logging.JSONLogFormatter())
+
+    handler.handle(make_record("while down"))
+    assert [json.loads(line)["msg"] for line in read_lines(fallback)] == ["while down"]
+
+    output = io.TextIOWrapper(io.BytesIO(), encoding="utf-8")
+    collector = LogCollector(socket_path, output)
+    collector.start()
+    handler.handle(make_record("while up"))
+    assert wait_for(lambda: read_lines(output))
+    handler.close()
+    collector.close()
+
+    assert [json.loads(line)["msg"] for line in read_lines(output)] == ["while up"]
+    assert len(read_lines(fallback)) == 1
+
+
+def test_collector_discards_incomplete_batches(json_logging, socket_path):
+    """Test if the batch of a worker that disconnected while sending it is not written"""
+    from json_logging.collector import LogCollector
+
+    output = io.TextIOWrapper(io.BytesIO(), encoding="utf-8")
+    collector = LogCollector(socket_path, output)
+    collector.start()
+
+    worker = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    worker.connect(socket_path)
+    worker.sendall(struct.pack(">I", 3) + b'{}\n' + struct.pack(">I", 100) + b'{"torn": ')
+    worker.close()
+    assert wait_for(lambda: collector.discarded_batch_count == 1)
+    collector.close()
+
+    assert read_lines(output) == ["{}"]
+    assert collector.received_batch_count == 1
+
+
+def test_output_handler_ships_to_collector(json_logging, socket_path):
+    """Test if LOG_COLLECTOR_SOCKET makes the request & root logger output handlers ship to the collector"""
+    json_logging.LOG_COLLECTOR_SOCKET = socket_path
+
+    handler = json_logging._create_output_handler(sys.stdout)
+
+    assert type(handler).__name__ == "CollectorHandler"
+    assert handler.path == socket_path
+    handler.close()
@@ -0,0 +1,84 @@
+"""Test suite for the correlation-id generators"""
+import os
+import re
+import time
+import uuid
+
+import pytest
+
+from helpers.imports import undo_imports_from_package
+
+CROCKFORD_BASE32 = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+
+
+@pytest.fixture
+def correlation_id():
+    import json_logging.correlation_id
+
+    yield json_logging.correlation_id
+
+    undo_imports_from_package("json_logging")  # Necessary because of json-logging's global state
+
+
+@pytest.mark.parametrize("generator_class", ["CounterIdGenerator", "ULIDGenerator", "BufferedUUID4Generator"])
+def test_generated_ids_are_unique(correlation_id, generator_class):
+    """Test if generators don't repeat ids, also across refills of the random buffer"""
+    generator = getattr(correlation_id, generator_class)()
+
+    ids = [generator() for _ in range(5000)]
+
+    assert len(set(ids)) == len(ids)
+    assert all(isinstance(id_, str) for id_ in ids)
+
+
+def test_buffered_uuid4_format(correlation_id):
+    """Test if buffered UUIDs are valid version 4 UUIDs"""
+    generated = correlation_id.BufferedUUID4Generator()()
+
+    assert uuid.UUID(generated).version == 4
+    assert str(uuid.UUID(generated)) == generated
+
+
+def test_ulid_encodes_time(correlation_id):
+    """Test if ULIDs carry the millisecond timestamp and sort by time"""
+    generator = correlation_id.ULIDGenerator()
+    before = int(time.time() * 1000)
+    first = generator()
+    time.sleep(0.002)
+    second = generator()
+
+    assert re.match("^[" + CROCKFORD_BASE32 + "]{26}$", first)
+    timestamp = 0
+    for char in first[:10]:
+        timestamp = timestamp * 32 + CROCKFORD_BASE32.index(char)
+    assert before <= timestamp <= before + 1000
+    assert first[:10] < second[:10]
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="requires os.fork")
+def test_counter_ids_differ_in_forked_child(correlation_id):
+    """Test if a forked child process does not repeat ids of its parent"""
+    generator = correlation_id.CounterIdGenerator()
+    read_fd, write_fd = os.pipe()
+
+    pid = os.fork()
+    if pid == 0:
+        os.write(write_fd, generator().encode())
+        os._exit(0)
+    os.waitpid(pid, 0)
+    child_id = os.read(read_fd, 100).decode()
+
+    assert child_id != generator()
+
+
+def test_discarded_generators_are_not_kept_for_fork_reset(correlation_id):
+    """Test if generators register with the shared after-fork hook without being kept alive by it"""
+    import gc
+
+    before = len(correlation_id._fork_aware_states)
+    generators = [correlation_id.ULIDGenerator() for _ in range(10)]
+    assert len(correlation_id._fork_aware_states) == before + 10
+
+    del generators
+    gc.collect()
+    assert len(correlation_id._fork_aware_states) == before
@@ -0,0 +1,86 @@
+"""Test suite for the request/response DTOs"""
+import re
+
+import pytest
+
+from helpers.imports import undo_imports_from_package
+
+ISO_TIMESTAMP = r"^\d{4}-\d\d-\d\dT\d\d:\d\d:\d\d\.\d{3}Z$"
+
+
+@pytest.fixture
+def dto():
+    import json_logging.dto
+
+    yield json_logging.dto
+
+    undo_imports_from_package("json_logging")  # Necessary because of json-logging's global state
+
+
+def test_lightweight_dto_renders_on_demand(dto):
+    """Test if timing fields are only rendered when the formatter asks for them"""
+    request, response = object(), object()
+    request_response_data = dto.LightweightRequestResponseDTO(request)
+    request_response_data.on_request_complete(response)
+
+    assert dict(request_response_data) == {}
+    assert not hasattr(request_response_data, "__dict__") or not vars(request_response_data)
+
+    request_response_data.render_fields()
+
+    assert set(request_response_data) == {"request_received_at", "response_time_ms", "response_time_us",
+                                          "response_sent_at", "total_time_ms"}
+    assert re.match(ISO_TIMESTAMP, request_response_data["request_received_at"])
+    assert re.match(ISO_TIMESTAMP, request_response_data["response_sent_at"])
+    assert request_response_data["response_time_ms"] == request_response_data["response_time_us"] // 1000
+    assert request_response_data._request is request
+    assert request_response_data._response is response
+
+
+def test_lightweight_dto_is_request_response_dto(dto):
+    """Test if the lightweight DTO can be passed to init_request_instrument and subclassed with extra attributes"""
+
+    class CustomDTO(dto.LightweightRequestResponseDTO):
+        def on_request_complete(self, response):
+            super(CustomDTO, self).on_request_complete(response)
+            self.status = "done"
+
+    request_response_data = CustomDTO(object())
+    request_response_data.on_request_complete(object())
+
+    assert isinstance(request_response_data, dto.RequestResponseDTOBase)
+    assert request_response_data.status == "done"
+
+
+def test_latency_breakdown_fields(dto):
+    """Test if only the phases that have been marked by the request instrumentation are written"""
+    request_response_data = dto.DefaultRequestResponseDTO(object())
+    request_response_data.on_handler_complete()
+    request_response_data.on_first_byte()
+    request_response_data.on_request_complete(object())
+
+    assert "queue_time_ms" not in request_response_data
+    assert 0 <= request_response_data["handler_time_ms"] <= request_response_data["ttfb_ms"] \
+        <= request_response_data["total_time_ms"]
+
+    request_response_data = dto.DefaultRequestResponseDTO(object())
+    request_response_data.on_request_complete(object())
+
+    assert "handler_time_ms" not in request_response_data
+    assert "ttfb_ms" not in request_response_data
+    assert request_response_data["total_time_ms"] >= 0
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("t=1600000000.123", 1600000000.123),
+    ("1600000000123", 1600000000.123),
+    ("t=1600000000123456", 1600000000.123456),
+    ("", None),
+    (None, None),
+    ("t=invalid", None),
+])
+def test_parse_request_start_time(dto, value, expected):
+    """Test if proxy request start headers in seconds, milliseconds and microseconds are understood"""
+    from json_logging import util
+
+    assert util.parse_request_start_time(value) == pytest.approx(expected)
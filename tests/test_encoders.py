@@ -0,0 +1,113 @@
+"""Test suite for the JSON encoder backends"""
+import datetime
+import decimal
+import json
+import uuid
+
+import pytest
+
+from helpers.imports import undo_imports_from_package
+
+LOG_OBJECT = {"msg": "héllo", "int": 1, "list": [1, 2], "none": None, "object": uuid.UUID(int=0), 1: "int key"}
+
+
+@pytest.fixture
+def encoders():
+    import json_logging.encoders
+
+    yield json_logging.encoders
+
+    undo_imports_from_package("json_logging")  # Necessary because of json-logging's global state
+
+
+@pytest.mark.parametrize("name", ["json", "orjson", "ujson"])
+def test_backend_keeps_default_str_semantics(encoders, name):
+    """Test if every backend renders the same JSON document as json.dumps(default=str)"""
+    try:
+        backend = encoders.get_encoder_backend(name)
+    except ImportError:
+        pytest.skip(name + " is not installed")
+
+    expected = json.loads(json.dumps(LOG_OBJECT, ensure_ascii=False, default=str))
+
+    assert json.loads(backend.dumps(LOG_OBJECT)) == expected
+    assert json.loads(backend.dumps_bytes(LOG_OBJECT).decode("utf-8")) == expected
+    assert json.loads(backend.dumps({"big": 2 ** 70})) == {"big": 2 ** 70}
+
+
+def test_auto_selection_prefers_fastest_available(encoders):
+    """Test if auto-selection picks the most preferred importable backend"""
+
+    def unavailable():
+        raise ImportError
+
+    encoders.register_encoder_backend("unavailable", unavailable)
+
+    expected = "json"
+    for name in ("ujson", "orjson"):
+        try:
+            __import__(name)
+            expected = name
+        except ImportError:
+            pass
+
+    assert encoders.get_encoder_backend().name == expected
+
+
+def test_unknown_backend(encoders):
+    """Test if an unknown backend name is rejected"""
+    with pytest.raises(RuntimeError):
+        encoders.get_encoder_backend("unknown")
+
+
+@pytest.mark.parametrize("obj, expected", [
+    (0, "00"), (24, "1818"), (1000000, "1a000f4240"), (-1, "20"), (-1000, "3903e7"), (1.1, "fb3ff199999999999a"),
+    (None, "f6"), (True, "f5"), ("ü", "62c3bc"), (b"\x01\x02", "420102"), ([1, [2, 3]], "8201820203"),
+    ({"a": 1, "b": [2]}, "a261610161628102"), (2 ** 70, "76" + (str(2 ** 70).encode().hex())),
+])
+def test_builtin_cbor_encoder(encoders, obj, expected):
+    """Test the built-in CBOR encoder against RFC 8949 examples, unsupported values are rendered with str()"""
+    assert encoders._encode_cbor(obj).hex() == expected
+
+
+@pytest.mark.parametrize("obj", [
+    {"ts": datetime.datetime(2020, 1, 1, tzinfo=datetime.timezone.utc), "naive": datetime.datetime(2020, 1, 1)},
+    {"amount": decimal.Decimal("1.10"), "id": uuid.UUID(int=0), "tags": {"a"}, "big": 2 ** 70},
+    [(1, 2.5), bytearray(b"ab"), None, True, "ü", {1: "int key"}],
+])
+def test_cbor2_matches_builtin_cbor_encoder(encoders, obj):
+    """Test if cbor2 writes the same values as the built-in encoder instead of CBOR tags for non-JSON types"""
+    pytest.importorskip("cbor2")
+
+    assert encoders._load_cbor_dumps()(obj) == encoders._encode_cbor(obj)
+
+
+@pytest.mark.parametrize("obj, expected", [
+    (0, "00"), (-32, "e0"), (200, "ccc8"), (-200, "d1ff38"), (None, "c0"), ("a", "a161"), (b"a", "c40161"),
+    ([1, {"a": True}], "920181a161c3"), (uuid.UUID(int=0), "d924" + str(uuid.UUID(int=0)).encode().hex()),
+])
+def test_builtin_msgpack_packer(encoders, obj, expected):
+    """Test the built-in MessagePack packer, unsupported values are rendered with str()"""
+    assert encoders._pack_msgpack(obj).hex() == expected
+
+
+def test_record_encodings(encoders):
+    """Test if binary record encodings are looked up by name, JSON has none"""
+    assert encoders.get_record_encoding(None) is None
+    assert encoders.get_record_encoding("json") is None
+    assert encoders.get_record_encoding("msgpack").encode({"a": 1}) == b"\x81\xa1a\x01"
+    assert encoders.get_record_encoding("cbor").encode({"a": 1}) == b"\xa1\x61a\x01"
+    with pytest.raises(RuntimeError):
+        encoders.get_record_encoding("unknown")
+
+
+def test_stdlib_backend_is_the_default():
+    """Test if the output of json.dumps is kept unless a backend is chosen"""
+    import json_logging
+
+    try:
+        json_logging.init_non_web(enable_json=True)
+        assert json_logging._encoder_backend.name == "json"
+        assert json_logging.JSON_SERIALIZER({"msg": float("nan"), "a": 1}) == '{"msg": NaN, "a": 1}'
+    finally:
+        undo_imports_from_package("json_logging")
@@ -1,10 +1,13 @@
 """Test suite for the flask backend"""
+import asyncio
 import json
 import logging
 import pathlib
 import re
+import time
 
 import fastapi
+import fastapi.responses
 import fastapi.testclient
 import pytest
 from helpers import constants
@@ -75,6 +78,34 @@ def client_and_log_handler():
     async def get_correlation_id():
         return {'correlation_id': json_logging.get_correlation_id()}
 
+    @app.get("/log/from-task")
+    async def log_from_task():
+        async def log_in_task():
+            logger.info("message from task")
+
+        await asyncio.get_running_loop().create_task(log_in_task())
+        return {}
+
+    @app.get("/stream")
+    async def stream():
+        async def chunks():
+            for _ in range(3):
+                yield b"x" * 1000
+
+        return fastapi.responses.StreamingResponse(chunks(), media_type="text/plain")
+
+    @app.get("/stream/raise")
+    async def stream_and_raise():
+        async def chunks():
+            yield b"x" * 1000
+            raise RuntimeError("unhandled")
+
+        return fastapi.responses.StreamingResponse(chunks(), media_type="text/plain")
+
+    @app.get("/raise")
+    async def raise_error():
+        raise RuntimeError("unhandled")
+
     @app.get('/no-request-instrumentation')
     async def excluded_from_request_instrumentation():
         return {}
@@ -137,6 +168,17 @@ def test_correlation_id_generated(client_and_log_handler):
     ), "autogenerated UUID doesn't have expected format"
 
 
+def test_correlation_id_follows_asyncio_tasks(client_and_log_handler):
+    """Test if the correlation ID is found for logs written from a task without the request in its call stack"""
+    api_client, handler = client_and_log_handler
+
+    response = api_client.get("/log/from-task", headers={"X-Correlation-Id": "abc-def"})
+
+    assert response.status_code == 200
+    assert len(handler.messages) == 1
+    assert json.loads(handler.messages[0])["correlation_id"] == "abc-def"
+
+
 def test_get_correlation_id(client_and_log_handler):
     """Test if json_logging.get_correlation_id() finds a given correlation ID"""
     api_client, handler = client_and_log_handler
@@ -204,6 +246,65 @@ def test_request_instrumentation(client_and_log_handler):
     assert len(handler.messages) == 1
 
 
+def test_request_instrumentation_streaming_response(client_and_log_handler):
+    """Test if status and size of a streamed response are taken from the ASGI messages"""
+    import json_logging
+
+    api_client, _ = client_and_log_handler
+    request_logger = logging.getLogger("fastapi-request-logger")
+    handler = FormattedMessageCollectorHandler()
+    handler.setFormatter(json_logging.JSONRequestLogFormatter())
+    request_logger.addHandler(handler)
+
+    response = api_client.get("/stream", headers={"X-Request-Start": "t=%.3f" % (time.time() - 1)})
+
+    assert response.status_code == 200
+    assert response.content == b"x" * 3000
+    assert len(handler.messages) == 1
+    msg = json.loads(handler.messages[0])
+    assert msg["queue_time_ms"] >= 1000
+    assert 0 <= msg["handler_time_ms"] <= msg["ttfb_ms"] <= msg["total_time_ms"]
+    assert msg["response_status"] == 200
+    assert msg["response_size_b"] == 3000
+    assert msg["response_content_type"].startswith("text/plain")
+
+
+def test_request_instrumentation_unhandled_exception(client_and_log_handler):
+    """Test if a request raising an exception is logged with status 500"""
+    import json_logging
+
+    api_client, _ = client_and_log_handler
+    request_logger = logging.getLogger("fastapi-request-logger")
+    handler = FormattedMessageCollectorHandler()
+    handler.setFormatter(json_logging.JSONRequestLogFormatter())
+    request_logger.addHandler(handler)
+
+    with pytest.raises(RuntimeError):
+        api_client.get("/raise")
+
+    assert len(handler.messages) == 1
+    assert json.loads(handler.messages[0])["response_status"] == 500
+
+
+def test_request_raising_after_status_sent_is_kept(client_and_log_handler):
+    """Test if requests raising after http.response.start bypass request sampling like status >= 500"""
+    import json_logging
+
+    api_client, _ = client_and_log_handler
+    json_logging._request_sampler = json_logging.sampling.RequestSampler(1)
+    request_logger = logging.getLogger("fastapi-request-logger")
+    handler = FormattedMessageCollectorHandler()
+    handler.setFormatter(json_logging.JSONRequestLogFormatter())
+    request_logger.addHandler(handler)
+
+    for _ in range(3):
+        with pytest.raises(RuntimeError):
+            api_client.get("/stream/raise")
+
+    assert [(json.loads(message)["response_status"], json.loads(message)["sample_rate"])
+            for message in handler.messages] == [(200, 1.0)] * 3
+
+
 def test_excluded_from_request_instrumentation(client_and_log_handler):
     """Test if endpoints can be excluded from the request log"""
     api_client, _ = client_and_log_handler
@@ -234,3 +335,24 @@ def test_request_info_extractor_handles_missing_client():
 
     assert extractor.get_remote_ip(request) == json_logging.EMPTY_VALUE
     assert extractor.get_remote_port(request) == json_logging.EMPTY_VALUE
+
+
+@pytest.mark.parametrize("headers", [[], [(b"referer", b"https://example.com/"), (b"content-length", b"4"),
+                                          (b"x-forwarded-for", b"10.0.0.2")]])
+def test_request_fields_match_generic_extraction(headers):
+    """Test if the FastAPI specific extract_fields returns the values of the generic implementation"""
+    import starlette.requests
+    import json_logging
+    from json_logging.framework.fastapi import FastAPIRequestInfoExtractor
+
+    extractor = FastAPIRequestInfoExtractor()
+    field_names = json_logging.dto.REQUEST_FIELDS[1:]
+    request = starlette.requests.Request({"type": "http", "http_version": "1.1", "method": "POST", "path": "/path",
+                                          "query_string": b"query=1", "headers": headers,
+                                          "client": ("10.0.0.1", 5555)})
+    try:
+        values = extractor.extract_fields(request, field_names)
+        assert values == json_logging.BaseRequestInfoExtractor.extract_fields(extractor, request, field_names)
+        assert values[field_names.index("request")] == "/path"
+    finally:
+        undo_imports_from_package("json_logging")
@@ -0,0 +1,177 @@
+"""Test suite for the log record filters"""
+import json
+import logging
+
+import pytest
+
+from helpers.handler import FormattedMessageCollectorHandler
+from helpers.imports import undo_imports_from_package
+
+LOGGER_NAME = "filters-test"
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def filters(monkeypatch):
+    import json_logging.filters
+
+    clock = FakeClock()
+    monkeypatch.setattr(json_logging.filters.time, "monotonic", clock)
+    json_logging.filters.clock = clock
+
+    yield json_logging.filters
+
+    undo_imports_from_package("json_logging")  # Necessary because of json-logging's global state
+
+
+def make_record(msg="repeated %s", lineno=42, args=("value",)):
+    return logging.LogRecord(LOGGER_NAME, logging.WARNING, __file__, lineno, msg, args, None)
+
+
+class Target(object):
+    """Collects the summary records handed over by the filter"""
+
+    def __init__(self):
+        self.records = []
+
+    def handle(self, record):
+        self.records.append(record)
+
+
+def test_repeats_suppressed_within_window(filters):
+    """Test if repeats of a call site are suppressed and written as summary once the window expires"""
+    target = Target()
+    log_filter = filters.DeduplicationFilter(window=10, target=target)
+
+    assert log_filter.filter(make_record())
+    assert not any(log_filter.filter(make_record(args=(i,))) for i in range(5))
+    assert log_filter.filter(make_record(lineno=43))
+    assert target.records == []
+
+    # written while other records pass, before the call site logs again
+    filters.clock.now += 10
+    assert log_filter.filter(make_record(lineno=44))
+    assert [(summary.getMessage(), summary.repeat_count) for summary in target.records] == [("repeated 4", 5)]
+    assert log_filter.filter(target.records[0])
+
+    filters.clock.now += 10
+    record = make_record()
+    assert log_filter.filter(record)
+    assert not hasattr(record, "repeat_count")
+    assert len(target.records) == 1
+
+
+def test_summary_written_before_next_record_of_call_site(filters):
+    """Test if the summary is written first when the call site logs again after the window expired"""
+    target = Target()
+    log_filter = filters.DeduplicationFilter(window=10, target=target)
+
+    assert log_filter.filter(make_record())
+    assert not log_filter.filter(make_record())
+
+    filters.clock.now += 10
+    assert not log_filter.filter(make_record(args=("next",)))
+    assert [summary.repeat_count for summary in target.records] == [1]
+
+    log_filter.flush()
+    assert [(summary.getMessage(), summary.repeat_count) for summary in target.records[1:]] == \
+           [("repeated next", 1)]
+    log_filter.flush()
+    assert len(target.records) == 2
+
+
+def test_rate_limit_per_call_site(filters):
+    """Test if each call site has its own token bucket"""
+    target = Target()
+    log_filter = filters.DeduplicationFilter(rate_limit=2, target=target)
+
+    assert [log_filter.filter(make_record()) for _ in range(4)] == [True, True, False, False]
+    assert log_filter.filter(make_record(msg="other"))
+
+    filters.clock.now += 0.5
+    assert not log_filter.filter(make_record())
+    assert [summary.repeat_count for summary in target.records] == [2]
+
+
+def test_unhashable_msg_passes(filters):
+    """Test if records with an unhashable msg are never suppressed"""
+    log_filter = filters.DeduplicationFilter(window=10)
+
+    assert all(log_filter.filter(make_record(msg={"key": "value"}, args=None)) for _ in range(3))
+
+
+def test_call_sites_bounded(filters):
+    """Test if the least recently logged call site is evicted, writing its summary"""
+    target = Target()
+    log_filter = filters.DeduplicationFilter(window=10, max_call_sites=2, target=target)
+
+    assert log_filter.filter(make_record(lineno=0))
+    assert not log_filter.filter(make_record(lineno=0))
+    assert log_filter.filter(make_record(lineno=1))
+    assert log_filter.filter(make_record(lineno=2))
+    assert list(key[2] for key in log_filter._call_sites) == [1, 2]
+    assert [(summary.lineno, summary.repeat_count) for summary in target.records] == [(0, 1)]
+
+
+@pytest.fixture
+def json_logger_and_handler():
+    import json_logging
+
+    json_logging.LOG_DEDUPLICATION_WINDOW = 60
+    logger = logging.getLogger(LOGGER_NAME)
+    logger.setLevel(logging.DEBUG)
+    handler = FormattedMessageCollectorHandler()
+    logger.addHandler(handler)
+    json_logging.init_non_web(enable_json=True)
+
+    yield logger, handler
+
+    logger.removeHandler(handler)
+    # the filters would suppress records of other tests
+    for existing_logger in [logging.root] + list(map(logging.getLogger, logging.Logger.manager.loggerDict)):
+        for filterer in [existing_logger] + existing_logger.handlers:
+            for log_filter in filterer.filters[:]:
+                if isinstance(log_filter, json_logging.filters.DeduplicationFilter):
+                    filterer.removeFilter(log_filter)
+    undo_imports_from_package("json_logging")
+
+
+def test_deduplication_configured_for_json_loggers(json_logger_and_handler):
+    """Test if the filter is added to loggers using a JSONLogFormatter and summaries rendered with repeat_count"""
+    import json_logging
+
+    logger, handler = json_logger_and_handler
+    for i in range(3):
+        logger.warning("hot loop %d", i)
+
+    assert len(handler.messages) == 1
+    assert json.loads(handler.messages[0])["msg"] == "hot loop 0"
+
+    json_logging.filters.flush_deduplication_filters()
+    assert len(handler.messages) == 2
+    summary = json.loads(handler.messages[1])
+    assert (summary["msg"], summary["repeat_count"]) == ("hot loop 2", 2)
+
+
+def test_deduplication_of_propagated_records(json_logger_and_handler):
+    """Test if records of child loggers created after init are deduplicated by the handlers they propagate to"""
+    import json_logging
+
+    logger, handler = json_logger_and_handler
+    child_logger = logging.getLogger(LOGGER_NAME + ".child")
+    for i in range(3):
+        child_logger.warning("hot loop %d", i)
+
+    assert [json.loads(message)["msg"] for message in handler.messages] == ["hot loop 0"]
+
+    json_logging.filters.flush_deduplication_filters()
+    assert len(handler.messages) == 2
+    summary = json.loads(handler.messages[1])
+    assert (summary["logger"], summary["msg"], summary["repeat_count"]) == (child_logger.name, "hot loop 2", 2)
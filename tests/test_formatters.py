@@ -0,0 +1,283 @@
+"""Test suite for the JSON formatters"""
+import json
+import logging
+import sys
+from datetime import datetime, timezone
+
+import pytest
+
+from helpers.imports import undo_imports_from_package
+
+LOGGER_NAME = "formatter-test"
+CREATED = 1577836800.123456
+
+
+@pytest.fixture
+def json_logging():
+    import json_logging
+
+    yield json_logging
+
+    undo_imports_from_package("json_logging")  # Necessary because of json-logging's global state
+
+
+def make_record(msg="test message", args=None, exc_info=None, extra=None):
+    record = logging.LogRecord(LOGGER_NAME, logging.INFO, __file__, 42, msg, args, exc_info, func="test")
+    record.created = CREATED
+    for key, value in (extra or {}).items():
+        setattr(record, key, value)
+    return record
+
+
+def legacy_formatter_class(formatter_class):
+    """Subclass that forces rendering through the layered _format_log_object chain"""
+
+    class LegacyFormatter(formatter_class):
+        def _format_log_object(self, record, request_util):
+            return super(LegacyFormatter, self)._format_log_object(record, request_util)
+
+    return LegacyFormatter
+
+
+@pytest.mark.parametrize("record_kwargs", [
+    {},
+    {"msg": "hello %s", "args": ("world",)},
+    {"extra": {"props": {"msg": "overridden", "extra_property": "extra_value"}, "tags": ["app:name"]}},
+    {"extra": {"object_property": object}},
+    {"msg": "multi\nline\ttext"},
+])
+def test_compiled_plan_matches_layered_chain(json_logging, record_kwargs):
+    """Test if the single-pass renderer produces the same output as the layered chain"""
+    compiled = json_logging.JSONLogFormatter()
+    legacy = legacy_formatter_class(json_logging.JSONLogFormatter)()
+
+    assert compiled._field_plan is not None
+    assert legacy._field_plan is None
+    assert compiled.format(make_record(**record_kwargs)) == legacy.format(make_record(**record_kwargs))
+
+
+def test_field_order_matches_baseline(json_logging):
+    """Test if fields are rendered in the order of the original formatter, static fields included"""
+    json_logging.COMPONENT_NAME = "component"
+    formatter = json_logging.JSONLogFormatter()
+
+    for _ in range(2):  # rendered, then spliced from the cached fragments
+        line = formatter.format(make_record(extra={"tags": ["a"]}))
+        assert list(json.loads(line)) == ["written_at", "written_ts", "component_name", "tags", "msg", "type",
+                                          "logger", "thread", "level", "module", "line_no"]
+
+
+def test_compiled_plan_with_exception(json_logging):
+    """Test if exception fields are rendered by the compiled plan"""
+    try:
+        raise RuntimeError("boom")
+    except RuntimeError:
+        record = make_record(exc_info=sys.exc_info())
+
+    msg = json.loads(json_logging.JSONLogFormatter().format(record))
+
+    assert "RuntimeError: boom" in msg["exc_info"]
+    assert msg["filename"] == record.filename
+
+
+def test_custom_extra_fields_are_used(json_logging):
+    """Test if an overridden _get_extra_fields is still honoured by the compiled plan"""
+
+    class CustomExtraFormatter(json_logging.JSONLogFormatter):
+        def _get_extra_fields(self, record):
+            return {"custom": "value"}
+
+    msg = json.loads(CustomExtraFormatter().format(make_record(extra={"ignored": 1})))
+
+    assert msg["custom"] == "value"
+    assert "ignored" not in msg
+
+
+@pytest.mark.parametrize("created", [
+    CREATED, 1577836800.0, 1577836859.999999, 1700000000.5,
+    # just below a millisecond, microsecond or second boundary
+    1792351606.971, 1577836800.9999995, 1577836800.1234566, 1700000000.0009999,
+])
+def test_timestamps_rendered_from_record_created(json_logging, created):
+    """Test if written_at/written_ts are derived from LogRecord.created like the datetime based helpers"""
+    utc = datetime.fromtimestamp(created, timezone.utc).replace(tzinfo=None)
+    renderer = json_logging.util.TimestampRenderer()
+
+    assert renderer.render(created) == (json_logging.util.iso_time_format(utc),
+                                        json_logging.util.epoch_nano_second(utc))
+
+
+def test_coarse_timestamps(json_logging):
+    """Test if the coarse clock mode truncates timestamps to milliseconds"""
+    renderer = json_logging.util.TimestampRenderer(coarse=True)
+
+    assert renderer.render(CREATED) == ("2020-01-01T00:00:00.123Z", 1577836800123000000)
+    assert renderer.render(CREATED + 0.0005) == renderer.render(CREATED)
+
+
+def test_static_fields_spliced_from_cached_fragment(json_logging):
+    """Test if constant fields are rendered once per logger, level & module and spliced into each line"""
+    json_logging.COMPONENT_NAME = "component"
+    formatter = json_logging.JSONLogFormatter()
+
+    first = formatter.format(make_record(msg="first"))
+    second = formatter.format(make_record(msg="second"))
+
+    assert len(formatter._static_fragments) == 1
+    assert '"component_name": "component", "msg": "first", "type": "log", "logger": "formatter-test", ' \
+           '"thread": "MainThread", "level": "INFO", "module": "test_formatters", "line_no": 42}' in first
+    assert "\\u0000" not in first
+    assert json.loads(second)["msg"] == "second"
+    assert formatter.format_bytes(make_record(msg="first")) == first.encode("utf-8")
+    assert json_logging.JSONLogFormatter().base_object_common is not formatter.base_object_common
+
+
+def test_static_fields_overridden_by_extra_fields(json_logging):
+    """Test if extra fields named like static fields are not written twice"""
+    json_logging.COMPONENT_ID = "component"
+
+    line = json_logging.JSONLogFormatter().format(make_record(extra={"component_id": "extra", "logger": "extra"}))
+    msg = json.loads(line)
+
+    assert msg["component_id"] == "extra"
+    assert msg["logger"] == LOGGER_NAME
+    assert line.count('"component_id"') == 1 and line.count('"logger"') == 1
+
+
+def test_static_fields_spliced_with_encoder_backend(json_logging):
+    """Test if fragments follow the separators of the encoder backend"""
+    pytest.importorskip("orjson")
+    json_logging._encoder_backend = json_logging.encoders.get_encoder_backend("orjson")
+    json_logging.JSON_SERIALIZER = json_logging._encoder_backend.dumps
+
+    data = json_logging.JSONLogFormatter().format_bytes(make_record(extra={"tags": ["a"]}))
+
+    assert data.endswith(b'"type":"log","logger":"formatter-test","thread":"MainThread","level":"INFO",'
+                         b'"module":"test_formatters","line_no":42}')
+    assert json.loads(data)["tags"] == ["a"]
+
+
+def raise_chained(message):
+    def inner():
+        raise ValueError(message)
+
+    try:
+        inner()
+    except ValueError as e:
+        raise RuntimeError("wrapped") from e
+
+
+def exc_info_of(func, *args):
+    try:
+        func(*args)
+    except Exception:
+        return sys.exc_info()
+
+
+def test_cached_traceback_matches_traceback_module(json_logging):
+    """Test if cached rendering produces the same text as traceback.format_exception for every record"""
+    import traceback
+
+    for message in ("first", "second"):
+        exc_info = exc_info_of(raise_chained, message)
+        assert json_logging.JSONLogFormatter.format_exception(exc_info) == \
+               "".join(traceback.format_exception(*exc_info))
+
+    assert len(json_logging.tracebacks.get_traceback_cache()._entries) == 1
+
+
+def test_exception_fingerprint(json_logging):
+    """Test if the fingerprint only depends on exception types and code locations"""
+    json_logging.EXCEPTION_FINGERPRINT = True
+    formatter = json_logging.JSONLogFormatter()
+
+    first = json.loads(formatter.format(make_record(exc_info=exc_info_of(raise_chained, "first"))))
+    second = json.loads(formatter.format(make_record(exc_info=exc_info_of(raise_chained, "second"))))
+    other = json.loads(formatter.format(make_record(exc_info=exc_info_of(lambda: 1 / 0))))
+
+    assert first["exc_fingerprint"] == second["exc_fingerprint"]
+    assert first["exc_fingerprint"] != other["exc_fingerprint"]
+
+
+def test_structured_exception_depth_limited(json_logging):
+    """Test if the structured mode renders frames, nested causes and honours the frame & size limits"""
+    json_logging.EXCEPTION_FORMAT = "structured"
+    json_logging.EXCEPTION_MAX_FRAMES = 1
+    json_logging.EXCEPTION_MAX_SIZE = 3
+
+    msg = json.loads(json_logging.JSONLogFormatter().format(
+        make_record(exc_info=exc_info_of(raise_chained, "message"))))
+    exc_info = msg["exc_info"]
+
+    assert exc_info["type"] == "RuntimeError"
+    assert exc_info["message"] == "wra"
+    assert [frame["function"] for frame in exc_info["frames"]] == ["raise_chained"]
+    assert exc_info["cause"]["type"] == "ValueError"
+    assert exc_info["cause"]["frames_omitted"] == 1
+    assert exc_info["cause"]["frames"] == [{"file": __file__, "line": exc_info["cause"]["frames"][0]["line"],
+                                            "function": "inner"}]
+
+
+def test_text_exception_size_limited(json_logging):
+    """Test if the text mode keeps the end of the traceback"""
+    json_logging.EXCEPTION_MAX_SIZE = 40
+
+    text = json_logging.JSONLogFormatter.format_exception(exc_info_of(raise_chained, "message"))
+
+    assert len(text) == 40
+    assert text.startswith("...")
+    assert text.endswith("RuntimeError: wrapped\n")
+
+
+def test_field_length_and_depth_limited(json_logging):
+    """Test if long strings are cut, deep containers replaced and the caller's objects left untouched"""
+    from json_logging import limits
+
+    json_logging.LOG_FIELD_MAX_LENGTH = 40
+    json_logging.LOG_FIELD_MAX_DEPTH = 2
+    nested = {"level2": {"level3": {"level4": 1}}, "text": "y" * 100}
+    truncated_before = limits.get_truncated_record_count()
+
+    msg = json.loads(json_logging.JSONLogFormatter().format(
+        make_record(msg="x" * 100, extra={"nested": nested, "short": "ok"})))
+
+    assert msg["msg"] == "x" * 11 + "...(89 characters truncated)"
+    assert msg["nested"]["level2"] == {"level3": limits.MAX_DEPTH_MARKER}
+    assert msg["nested"]["text"] == "y" * 11 + "...(89 characters truncated)"
+    assert msg["short"] == "ok"
+    assert sorted(msg[limits.TRUNCATED_FIELDS_FIELD]) == ["msg", "nested"]
+    assert nested["level2"]["level3"] == {"level4": 1}
+    assert limits.get_truncated_record_count() == truncated_before + 1
+
+
+def test_extra_fields_count_limited(json_logging):
+    """Test if extra fields beyond the limit are dropped and counted"""
+    json_logging.LOG_EXTRA_FIELDS_MAX_COUNT = 2
+
+    msg = json.loads(json_logging.JSONLogFormatter().format(
+        make_record(extra={"first": 1, "second": 2, "props": {"third": 3, "fourth": 4}})))
+
+    assert {"first", "second"} <= set(msg)
+    assert "third" not in msg and "fourth" not in msg
+    assert msg["extra_fields_omitted"] == 2
+    assert "truncated_fields" not in msg
+
+
+def test_line_size_limited(json_logging):
+    """Test if the largest fields are cut to fit the line budget, keeping the end of tracebacks"""
+    json_logging.LOG_LINE_MAX_BYTES = 1000
+
+    formatter = json_logging.JSONLogFormatter()
+    line = formatter.format(make_record(msg="m" * 5000, exc_info=exc_info_of(raise_chained, "message"),
+                                        extra={"payload": ["p" * 100] * 50}))
+    msg = json.loads(line)
+
+    assert len(line.encode("utf-8")) <= 1000
+    assert msg["level"] == "INFO"
+    assert msg["payload"].endswith("bytes truncated)")
+    assert msg["msg"].startswith("m") and msg["msg"].endswith("characters truncated)")
+    assert msg["exc_info"].endswith("RuntimeError: wrapped\n")
+    assert set(msg["truncated_fields"]) == {"msg", "payload"}
+
+    small_line = formatter.format(make_record(msg="small"))
+    assert "truncated_fields" not in json.loads(small_line)
@@ -0,0 +1,74 @@
+"""Test suite for the lazy framework support registry"""
+import os
+import subprocess
+import sys
+
+import pytest
+
+from helpers.imports import undo_imports_from_package
+
+WEB_FRAMEWORK_PACKAGES = {"flask", "werkzeug", "sanic", "quart", "connexion", "fastapi", "starlette"}
+PACKAGE_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def json_logging():
+    import json_logging
+
+    yield json_logging
+
+    undo_imports_from_package("json_logging")  # Necessary because of json-logging's global state
+
+
+def test_import_does_not_load_web_frameworks():
+    """Test if importing json_logging imports neither a web framework nor a framework support module"""
+    code = ("import sys, json_logging; "
+            "print(' '.join(name for name in sys.modules if name.startswith('json_logging.framework.')"
+            " or name.split('.')[0] in %r))" % (WEB_FRAMEWORK_PACKAGES,))
+
+    output = subprocess.check_output([sys.executable, "-c", code], cwd=PACKAGE_ROOT, universal_newlines=True)
+
+    assert output.split() == []
+
+
+def test_framework_support_registered_on_first_use(json_logging):
+    """Test if built-in framework support is loaded by the first lookup only"""
+    assert "flask" not in json_logging._framework_support_map
+
+    support = json_logging.frameworks.get_framework_support("Flask")
+
+    assert support is json_logging._framework_support_map["flask"]
+    assert support["request_info_extractor_class"].__name__ == "FlaskRequestInfoExtractor"
+    assert json_logging.frameworks.get_framework_support("unknown") is None
+    with pytest.raises(RuntimeError, match="unknown is not a supported framework"):
+        json_logging.init_framework("unknown")
+
+
+def test_framework_support_loaded_from_entry_point(json_logging, monkeypatch):
+    """Test if support for other frameworks is registered by entry points"""
+    import importlib.metadata
+
+    from json_logging.framework import flask as flask_support
+
+    def register():
+        json_logging.register_framework_support("custom", None,
+                                                flask_support.FlaskAppRequestInstrumentationConfigurator,
+                                                flask_support.FlaskRequestInfoExtractor,
+                                                flask_support.FlaskResponseInfoExtractor)
+
+    class EntryPoint(object):
+        name = "Custom"
+        value = "custom_support:register"
+
+        def load(self):
+            return register
+
+    class EntryPoints(object):
+        def select(self, group):
+            return [EntryPoint()] if group == json_logging.frameworks.ENTRY_POINT_GROUP else []
+
+    monkeypatch.setattr(importlib.metadata, "entry_points", lambda: EntryPoints())
+
+    json_logging.init_framework("custom")
+
+    assert json_logging._current_framework["request_info_extractor_class"] is flask_support.FlaskRequestInfoExtractor
@@ -0,0 +1,372 @@
+"""Test suite for the json_logging handlers"""
+import io
+import json
+import logging
+import sys
+import threading
+import time
+
+import pytest
+
+from helpers.imports import undo_imports_from_package
+
+LOGGER_NAME = "handler-test"
+
+
+@pytest.fixture
+def json_logging():
+    import json_logging
+
+    yield json_logging
+
+    undo_imports_from_package("json_logging")  # Necessary because of json-logging's global state
+
+
+def make_record(msg="test message", level=logging.INFO):
+    return logging.LogRecord(LOGGER_NAME, level, __file__, 42, msg, None, None)
+
+
+def test_json_stream_handler_writes_bytes_to_buffer(json_logging):
+    """Test if JSON lines are written straight to the binary buffer of a UTF-8 stream"""
+    stream = io.TextIOWrapper(io.BytesIO(), encoding="utf-8")
+    handler = json_logging.JSONStreamHandler(stream)
+    handler.setFormatter(json_logging.JSONLogFormatter())
+
+    handler.handle(make_record("héllo"))
+
+    lines = stream.buffer.getvalue().decode("utf-8").splitlines()
+    assert len(lines) == 1
+    assert json.loads(lines[0])["msg"] == "héllo"
+
+
+def test_json_stream_handler_falls_back_to_text(json_logging):
+    """Test if plain text streams and non-JSON formatters still work"""
+    stream = io.StringIO()
+    handler = json_logging.JSONStreamHandler(stream)
+    handler.setFormatter(logging.Formatter("%(message)s"))
+
+    handler.handle(make_record())
+
+    assert stream.getvalue() == "test message\n"
+
+
+class BlockingHandler(logging.Handler):
+    """A handler that blocks in emit until released, to simulate a stalled output"""
+
+    def __init__(self):
+        super().__init__()
+        self.started = threading.Event()
+        self.unblock = threading.Event()
+        self.messages = []
+
+    def emit(self, record):
+        self.started.set()
+        self.unblock.wait(5)
+        self.messages.append(record.getMessage())
+
+
+@pytest.mark.parametrize("policy, expected_messages, dropped_attr", [
+    ("drop_new", ["0", "1", "2"], "dropped_new_count"),
+    ("drop_oldest", ["0", "2", "3"], "dropped_oldest_count"),
+])
+def test_async_handler_overflow_policy(json_logging, policy, expected_messages, dropped_attr):
+    """Test if records are dropped according to the overflow policy once the queue is full"""
+    target = BlockingHandler()
+    handler = json_logging.AsyncHandler(target, queue_size=2, overflow_policy=policy)
+
+    handler.handle(make_record("0"))
+    assert target.started.wait(5)
+    for msg in ("1", "2", "3"):
+        handler.handle(make_record(msg))
+
+    target.unblock.set()
+    handler.close()
+
+    assert target.messages == expected_messages
+    assert getattr(handler, dropped_attr) == 1
+
+
+def test_async_handler_flush_writes_queued_records(json_logging):
+    """Test if flush waits for the writer thread to write all queued records"""
+    stream = io.StringIO()
+    target = logging.StreamHandler(stream)
+    target.setFormatter(json_logging.JSONLogFormatter())
+    handler = json_logging.AsyncHandler(target)
+
+    for i in range(100):
+        handler.handle(make_record(str(i)))
+    handler.flush()
+
+    assert [json.loads(line)["msg"] for line in stream.getvalue().splitlines()] == [str(i) for i in range(100)]
+    handler.close()
+
+
+def test_async_handler_close_is_deadline_bounded(json_logging):
+    """Test if close gives up waiting for a stalled writer after flush_timeout"""
+    target = BlockingHandler()
+    handler = json_logging.AsyncHandler(target, flush_timeout=0.1)
+
+    handler.handle(make_record())
+    assert target.started.wait(5)
+    started = time.monotonic()
+    handler.close()
+
+    assert time.monotonic() - started < 2
+    target.unblock.set()
+
+
+@pytest.mark.parametrize("structured", [False, True])
+def test_async_handler_renders_records_before_queueing(json_logging, structured):
+    """Test if message and traceback are rendered in the logging thread, arguments and exc_info released"""
+    if structured:
+        json_logging.EXCEPTION_FORMAT = "structured"
+    stream = io.StringIO()
+    target = logging.StreamHandler(stream)
+    target.setFormatter(json_logging.JSONLogFormatter())
+    handler = json_logging.AsyncHandler(target)
+    items = ["first"]
+    try:
+        raise ValueError("failed")
+    except ValueError:
+        record = logging.LogRecord(LOGGER_NAME, logging.ERROR, __file__, 42, "items %s", (items,), sys.exc_info())
+
+    prepared = handler.prepare(record)
+    assert (prepared.msg, prepared.args, prepared.exc_info) == ("items ['first']", None, None)
+
+    handler.handle(record)
+    items.append("second")
+    handler.close()
+    log_object = json.loads(stream.getvalue())
+    assert log_object["msg"] == "items ['first']"
+    if structured:
+        assert log_object["exc_info"]["type"] == "ValueError"
+    else:
+        assert log_object["exc_info"].rstrip().endswith("ValueError: failed")
+
+
+def test_async_handler_renders_traceback_for_plain_formatters(json_logging):
+    """Test if the traceback is rendered into exc_text for formatters without prepare_record"""
+    stream = io.StringIO()
+    target = logging.StreamHandler(stream)
+    target.setFormatter(logging.Formatter("%(message)s"))
+    handler = json_logging.AsyncHandler(target)
+    try:
+        raise ValueError("failed")
+    except ValueError:
+        record = logging.LogRecord(LOGGER_NAME, logging.ERROR, __file__, 42, "failed", None, sys.exc_info())
+
+    handler.handle(record)
+    handler.close()
+    assert stream.getvalue().startswith("failed\nTraceback")
+    assert stream.getvalue().endswith("ValueError: failed\n")
+
+
+def test_async_handler_leaves_record_to_other_handlers(json_logging):
+    """Test if a handler next to an AsyncHandler still sees the arguments and traceback of the record"""
+    stream = io.StringIO()
+    target = logging.StreamHandler(stream)
+    target.setFormatter(json_logging.JSONLogFormatter())
+    handler = json_logging.AsyncHandler(target)
+    plain_stream = io.StringIO()
+    plain_handler = logging.StreamHandler(plain_stream)
+    plain_handler.setFormatter(logging.Formatter("%(msg)s|%(args)s|%(message)s"))
+    logger = logging.getLogger(LOGGER_NAME + ".copy")
+    logger.propagate = False
+    logger.addHandler(handler)
+    logger.addHandler(plain_handler)
+    try:
+        try:
+            raise ValueError("failed")
+        except ValueError:
+            logger.exception("hello %s", "world")
+    finally:
+        logger.removeHandler(handler)
+        logger.removeHandler(plain_handler)
+        handler.close()
+
+    assert plain_stream.getvalue().startswith("hello %s|('world',)|hello world\nTraceback")
+    assert plain_stream.getvalue().endswith("ValueError: failed\n")
+    log_object = json.loads(stream.getvalue())
+    assert log_object["msg"] == "hello world"
+    assert log_object["exc_info"].rstrip().endswith("ValueError: failed")
+
+
+def test_invalid_overflow_policy(json_logging):
+    """Test if unknown overflow policies are rejected"""
+    with pytest.raises(ValueError):
+        json_logging.AsyncHandler(logging.NullHandler(), overflow_policy="unknown")
+
+
+class CountingBytesIO(io.BytesIO):
+    """A binary buffer that counts the write calls"""
+
+    def __init__(self):
+        super().__init__()
+        self.write_count = 0
+
+    def write(self, data):
+        self.write_count += 1
+        return super().write(data)
+
+
+def test_buffered_handler_coalesces_writes(json_logging):
+    """Test if many records are written with a single write once the buffer size is reached"""
+    buffer = CountingBytesIO()
+    stream = io.TextIOWrapper(buffer, encoding="utf-8")
+    handler = json_logging.BufferedJSONStreamHandler(stream, buffer_size=10 ** 6, flush_interval=None)
+    handler.setFormatter(json_logging.JSONLogFormatter())
+
+    for i in range(50):
+        handler.handle(make_record(str(i)))
+    assert buffer.write_count == 0
+
+    handler.flush()
+
+    assert buffer.write_count == 1
+    assert len(buffer.getvalue().splitlines()) == 50
+    handler.close()
+
+
+def test_buffered_handler_keeps_emit_order(json_logging):
+    """Test if lines rendered as text and as bytes are written in the order they have been emitted"""
+    buffer = CountingBytesIO()
+    stream = io.TextIOWrapper(buffer, encoding="utf-8")
+    handler = json_logging.BufferedJSONStreamHandler(stream, buffer_size=10 ** 6, flush_interval=None)
+
+    for index, formatter in enumerate([json_logging.JSONLogFormatter(), logging.Formatter("%(message)s"),
+                                       json_logging.JSONLogFormatter()]):
+        handler.setFormatter(formatter)
+        handler.handle(make_record(str(index)))
+    handler.flush()
+
+    lines = buffer.getvalue().decode("utf-8").splitlines()
+    assert [json.loads(lines[0])["msg"], lines[1], json.loads(lines[2])["msg"]] == ["0", "1", "2"]
+    assert buffer.write_count == 1
+    handler.close()
+
+
+def test_buffered_handler_flushes_on_level(json_logging):
+    """Test if records at or above flush_level are written immediately together with the buffered ones"""
+    stream = io.StringIO()
+    handler = json_logging.BufferedJSONStreamHandler(stream, buffer_size=10 ** 6, flush_interval=None)
+    handler.setFormatter(json_logging.JSONLogFormatter())
+
+    handler.handle(make_record("info"))
+    assert stream.getvalue() == ""
+
+    handler.handle(make_record("error", level=logging.ERROR))
+
+    assert [json.loads(line)["msg"] for line in stream.getvalue().splitlines()] == ["info", "error"]
+    handler.close()
+
+
+def test_buffered_handler_flushes_on_interval(json_logging):
+    """Test if buffered records are written by the background flusher after flush_interval"""
+    stream = io.StringIO()
+    handler = json_logging.BufferedJSONStreamHandler(stream, buffer_size=10 ** 6, flush_interval=0.05)
+    handler.setFormatter(json_logging.JSONLogFormatter())
+
+    handler.handle(make_record())
+    deadline = time.monotonic() + 5
+    while not stream.getvalue() and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    assert len(stream.getvalue().splitlines()) == 1
+    handler.close()
+
+
+class FailingOnceStringIO(io.StringIO):
+    """A text stream whose first write fails"""
+
+    def __init__(self):
+        super().__init__()
+        self.failed = False
+
+    def write(self, s):
+        if not self.failed:
+            self.failed = True
+            raise OSError("broken pipe")
+        return super().write(s)
+
+
+def test_buffered_handler_survives_write_errors(json_logging):
+    """Test if the flusher keeps running after a failed write and the failed lines are not kept buffered"""
+    stream = FailingOnceStringIO()
+    handler = json_logging.BufferedJSONStreamHandler(stream, buffer_size=10 ** 6, flush_interval=0.05)
+    handler.setFormatter(json_logging.JSONLogFormatter())
+    errors = []
+    handler.handleError = errors.append
+
+    handler.handle(make_record("lost"))
+    deadline = time.monotonic() + 5
+    while not errors and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert errors == [None]
+    assert handler._pending == []
+
+    handler.handle(make_record("written"))
+    deadline = time.monotonic() + 5
+    while not stream.getvalue() and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    assert [json.loads(line)["msg"] for line in stream.getvalue().splitlines()] == ["written"]
+    handler.close()
+
+
+@pytest.mark.parametrize("encoding_name, framing", [("msgpack", None), ("cbor", None), (None, "length_prefixed")])
+def test_json_stream_handler_length_prefixed_records(json_logging, encoding_name, framing):
+    """Test if records are written length-prefixed in the record encoding, readable without decoding"""
+    from json_logging import encoders
+
+    stream = io.TextIOWrapper(io.BytesIO(), encoding="utf-8")
+    encoding = encoders.get_record_encoding(encoding_name)
+    handler = json_logging.JSONStreamHandler(stream, record_encoding=encoding, framing=framing)
+    formatter = json_logging.JSONLogFormatter()
+    handler.setFormatter(formatter)
+
+    records = [make_record("first"), make_record("second")]
+    for record in records:
+        handler.handle(record)
+
+    stream.buffer.seek(0)
+    expected = [formatter.format_encoded(record, encoding) for record in records]
+    assert list(encoders.iter_length_prefixed(stream.buffer)) == expected
+    if encoding is None:
+        assert [json.loads(data)["msg"] for data in expected] == ["first", "second"]
+
+
+def test_buffered_handler_binary_stream(json_logging):
+    """Test if binary records are coalesced and written to a binary stream"""
+    from json_logging import encoders
+
+    stream = io.BytesIO()
+    handler = json_logging.BufferedJSONStreamHandler(stream, flush_interval=None,
+                                                     record_encoding=encoders.get_record_encoding("msgpack"))
+    handler.setFormatter(json_logging.JSONLogFormatter())
+
+    handler.handle(make_record())
+    assert stream.getvalue() == b""
+    handler.flush()
+
+    stream.seek(0)
+    assert len(list(encoders.iter_length_prefixed(stream))) == 1
+
+
+def test_binary_encoding_requires_length_prefixed_framing(json_logging):
+    """Test if binary records can't be written as lines, nor to text only streams"""
+    from json_logging import encoders
+
+    with pytest.raises(ValueError):
+        json_logging.JSONStreamHandler(io.BytesIO(), record_encoding=encoders.get_record_encoding("msgpack"),
+                                       framing="newline")
+    with pytest.raises(ValueError):
+        json_logging.JSONStreamHandler(io.StringIO(), framing="length_prefixed")
+
+
+def test_output_handler_uses_configured_encoding(json_logging):
+    """Test if handlers created by json_logging write in LOG_OUTPUT_ENCODING"""
+    json_logging.LOG_OUTPUT_ENCODING = "msgpack"
+    handler = json_logging._create_output_handler(io.BytesIO())
+
+    assert handler.record_encoding.name == "msgpack"
+    assert handler.framing == "length_prefixed"
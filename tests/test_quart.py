@@ -0,0 +1,89 @@
+"""Test suite for the quart backend"""
+import asyncio
+import logging
+
+import pytest
+
+from helpers.handler import FormattedMessageCollectorHandler
+from helpers.imports import undo_imports_from_package
+
+quart = pytest.importorskip("quart")
+
+LOGGER_NAME = "quart-test"
+
+
+@pytest.fixture
+def app_and_log_handler():
+    import json_logging
+
+    # Init app
+    app = quart.Quart(__name__)
+
+    # Init std logging
+    logger = logging.getLogger(LOGGER_NAME)
+    logger.setLevel(logging.DEBUG)
+    handler = FormattedMessageCollectorHandler()
+    logger.addHandler(handler)
+
+    # Add json_logging
+    json_logging.CORRELATION_ID_SAMPLE_RATE = 0.0
+    json_logging.REQUEST_LOG_BUFFERING = True
+    json_logging.init_quart(enable_json=True)
+    json_logging.init_request_instrument(app)
+
+    # Prepare test endpoints
+    @app.route("/request-context")
+    async def request_context():
+        from json_logging.context import get_request_context
+        from json_logging.sampling import is_current_request_sampled
+
+        context = get_request_context()
+        return {
+            "has_context": context is not None,
+            "sampled": is_current_request_sampled(),
+            "correlation_id": json_logging.get_correlation_id(),
+        }
+
+    yield app, handler
+
+    # Tear down test environment
+    logger.removeHandler(handler)
+    undo_imports_from_package("json_logging")  # Necessary because of json-logging's global state
+
+
+def test_request_context_visible_in_view(app_and_log_handler):
+    """Test if the sampling decision and correlation id of the request reach the view coroutine"""
+    app, _ = app_and_log_handler
+
+    async def get():
+        response = await app.test_client().get("/request-context", headers={"X-Correlation-ID": "quart-id"})
+        return await response.get_json()
+
+    body = asyncio.run(get())
+
+    assert body == {"has_context": True, "sampled": False, "correlation_id": "quart-id"}
+
+
+def test_request_log_buffer_visible_in_view(app_and_log_handler):
+    """Test if the records of a request are buffered and dropped for a successful, fast request"""
+    import json_logging
+
+    app, handler = app_and_log_handler
+    json_logging.CORRELATION_ID_SAMPLE_RATE = None
+    buffered = []
+
+    @app.route("/buffered")
+    async def buffered_view():
+        from json_logging.context import get_request_context
+
+        buffered.append(get_request_context().log_buffer is not None)
+        logging.getLogger(LOGGER_NAME).info("buffered message")
+        return {}
+
+    async def get():
+        response = await app.test_client().get("/buffered")
+        return response.status_code
+
+    assert asyncio.run(get()) == 200
+    assert buffered == [True]
+    assert handler.messages == []
@@ -0,0 +1,244 @@
+"""Test suite for the request log sampling"""
+import json
+import logging
+
+import flask
+import pytest
+
+from helpers.handler import FormattedMessageCollectorHandler
+from helpers.imports import undo_imports_from_package
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def sampling(monkeypatch):
+    import json_logging.sampling
+
+    clock = FakeClock()
+    monkeypatch.setattr(json_logging.sampling.time, "monotonic", clock)
+    json_logging.sampling.clock = clock
+
+    yield json_logging.sampling
+
+    undo_imports_from_package("json_logging")  # Necessary because of json-logging's global state
+
+
+def test_token_bucket_per_route(sampling):
+    """Test if each route keeps its own budget of request logs per second"""
+    sampler = sampling.RequestSampler(2)
+
+    assert [sampler.sample("/a") is not None for _ in range(4)] == [True, True, False, False]
+    assert sampler.sample("/b") is not None
+
+    sampling.clock.now += 0.5
+    assert sampler.sample("/a") is not None
+    assert sampler.sample("/a") is None
+
+
+def test_sample_rate_of_previous_window(sampling):
+    """Test if kept request logs are stamped with the share of requests kept in the previous second"""
+    sampler = sampling.RequestSampler(2)
+
+    assert [sampler.sample("/a") for _ in range(4)] == [1.0, 1.0, None, None]
+
+    sampling.clock.now += 1.0
+    assert sampler.sample("/a") == 0.5
+
+    # no information about the rate after a quiet period
+    sampling.clock.now += 5.0
+    assert sampler.sample("/a") == 1.0
+
+
+def test_least_recently_requested_route_is_forgotten(sampling):
+    """Test if the number of tracked routes is bounded"""
+    sampler = sampling.RequestSampler(1, max_routes=2)
+
+    assert sampler.sample("/a") is not None
+    assert sampler.sample("/b") is not None
+    assert sampler.sample("/a") is None
+    assert sampler.sample("/c") is not None
+    assert list(sampler._buckets) == ["/a", "/c"]
+    assert sampler.sample("/a") is None
+
+
+def test_errors_and_slow_requests_are_always_kept(sampling):
+    """Test which requests are kept regardless of sampling"""
+    sampler = sampling.RequestSampler(1, slow_request_threshold_ms=100)
+
+    assert sampler.is_always_kept(500, 0)
+    assert sampler.is_always_kept(200, 100 * 1000000)
+    assert not sampler.is_always_kept(404, 99 * 1000000)
+    assert not sampling.RequestSampler(1, slow_request_threshold_ms=None).is_always_kept(200, 10 ** 12)
+
+
+def test_sampled_request_logs_flask():
+    """Test if sampled out requests produce no DTO and no request log unless they fail"""
+    import json_logging
+
+    json_logging.REQUEST_SAMPLING_RATE = 1
+    app = flask.Flask(__name__)
+    created = []
+
+    class CountingDTO(json_logging.DefaultRequestResponseDTO):
+        def __init__(self, request, **kwargs):
+            super(CountingDTO, self).__init__(request, **kwargs)
+            created.append(self)
+
+    json_logging.init_flask(enable_json=True)
+    json_logging.init_request_instrument(app, request_response_dto_class=CountingDTO)
+    request_logger = logging.getLogger("flask-request-logger")
+    handler = FormattedMessageCollectorHandler()
+    handler.setFormatter(json_logging.JSONRequestLogFormatter())
+    request_logger.addHandler(handler)
+
+    @app.route("/read")
+    def read():
+        return {}
+
+    @app.route("/fail")
+    def fail():
+        return {}, 503
+
+    try:
+        with app.test_client() as test_client:
+            for _ in range(5):
+                assert test_client.get("/read").status_code == 200
+            for _ in range(3):
+                assert test_client.get("/fail").status_code == 503
+
+        messages = [json.loads(message) for message in handler.messages]
+        assert [(msg["request"], msg["response_status"], msg["sample_rate"]) for msg in messages] == \
+               [("/read", 200, 1.0), ("/fail", 503, 1.0), ("/fail", 503, 1.0), ("/fail", 503, 1.0)]
+        assert messages[2]["request_received_at"] <= messages[2]["response_sent_at"]
+        assert len(created) == 4
+    finally:
+        undo_imports_from_package("json_logging")
+
+
+def test_streamed_request_raising_after_status_sent_is_kept():
+    """Test if requests raising while their body is streamed bypass request sampling like status >= 500"""
+    import json_logging
+
+    json_logging.REQUEST_SAMPLING_RATE = 1
+    json_logging.REQUEST_INSTRUMENTATION_WSGI_MIDDLEWARE = True
+    app = flask.Flask(__name__)
+    json_logging.init_flask(enable_json=True)
+    json_logging.init_request_instrument(app)
+    request_logger = logging.getLogger("flask-request-logger")
+    handler = FormattedMessageCollectorHandler()
+    handler.setFormatter(json_logging.JSONRequestLogFormatter())
+    request_logger.addHandler(handler)
+
+    @app.route("/stream")
+    def stream():
+        def chunks():
+            yield "x" * 1000
+            raise RuntimeError("unhandled")
+
+        return flask.Response(chunks(), mimetype="text/plain")
+
+    try:
+        with app.test_client() as test_client:
+            for _ in range(3):
+                response = test_client.get("/stream")
+                with pytest.raises(RuntimeError):
+                    response.get_data()
+                response.close()
+
+        assert [(json.loads(message)["response_status"], json.loads(message)["sample_rate"])
+                for message in handler.messages] == [(200, 1.0)] * 3
+    finally:
+        undo_imports_from_package("json_logging")
+
+
+def test_correlation_id_sampling_is_deterministic(sampling):
+    """Test if the decision only depends on correlation id and rate"""
+    ids = ["id-%d" % i for i in range(1000)]
+    sampled = [i for i in ids if sampling.is_correlation_id_sampled(i, 0.25)]
+
+    assert 150 < len(sampled) < 350
+    assert sampled == [i for i in ids if sampling.is_correlation_id_sampled(i, 0.25)]
+    assert set(sampled) <= {i for i in ids if sampling.is_correlation_id_sampled(i, 0.5)}
+    assert all(sampling.is_correlation_id_sampled(i, 1.0) for i in ids)
+    assert not any(sampling.is_correlation_id_sampled(i, 0.0) for i in ids)
+
+
+def test_correlation_id_sampling_flask():
+    """Test if request and application logs of a request are dropped together, unless forced by header"""
+    import json_logging
+    from json_logging.sampling import is_correlation_id_sampled
+
+    json_logging.CORRELATION_ID_SAMPLE_RATE = 0.5
+    app = flask.Flask(__name__)
+    logger = logging.getLogger("sampling-test")
+    logger.setLevel(logging.DEBUG)
+    app_handler = FormattedMessageCollectorHandler()
+    logger.addHandler(app_handler)
+    json_logging.init_flask(enable_json=True)
+    json_logging.init_request_instrument(app)
+    request_logger = logging.getLogger("flask-request-logger")
+    request_handler = FormattedMessageCollectorHandler()
+    request_handler.setFormatter(json_logging.JSONRequestLogFormatter())
+    request_logger.addHandler(request_handler)
+
+    @app.route("/")
+    def index():
+        logger.info("handling request")
+        return {}
+
+    ids = ["id-%d" % i for i in range(20)]
+    kept_id = next(i for i in ids if is_correlation_id_sampled(i, 0.5))
+    dropped_id = next(i for i in ids if not is_correlation_id_sampled(i, 0.5))
+
+    try:
+        with app.test_client() as test_client:
+            test_client.get("/", headers={"X-Correlation-Id": kept_id})
+            test_client.get("/", headers={"X-Correlation-Id": dropped_id})
+            test_client.get("/", headers={"X-Correlation-Id": dropped_id, "X-Force-Log": "true"})
+        logger.info("outside of requests")
+
+        messages = [json.loads(message) for message in app_handler.messages]
+        assert [msg["correlation_id"] for msg in messages[:2]] == [kept_id, dropped_id]
+        assert messages[2]["msg"] == "outside of requests"
+        request_logs = [json.loads(message) for message in request_handler.messages]
+        assert [(msg["correlation_id"], msg["sample_rate"]) for msg in request_logs] == \
+               [(kept_id, 0.5), (dropped_id, 0.5)]
+    finally:
+        logger.removeHandler(app_handler)
+        undo_imports_from_package("json_logging")
+
+
+def test_requests_are_sampled_per_route_template_flask():
+    """Test if requests to the same route with different paths share a budget"""
+    import json_logging
+
+    json_logging.REQUEST_SAMPLING_RATE = 1
+    app = flask.Flask(__name__)
+    json_logging.init_flask(enable_json=True)
+    json_logging.init_request_instrument(app)
+    request_logger = logging.getLogger("flask-request-logger")
+    handler = FormattedMessageCollectorHandler()
+    handler.setFormatter(json_logging.JSONRequestLogFormatter())
+    request_logger.addHandler(handler)
+
+    @app.route("/users/<int:user_id>")
+    def user(user_id):
+        return {}
+
+    try:
+        with app.test_client() as test_client:
+            for user_id in range(3):
+                assert test_client.get("/users/%d" % user_id).status_code == 200
+            assert test_client.get("/missing").status_code == 404
+
+        assert [json.loads(message)["request"] for message in handler.messages] == ["/users/0", "/missing"]
+        assert list(json_logging._request_sampler._buckets) == ["/users/<int:user_id>", "/missing"]
+    finally:
+        undo_imports_from_package("json_logging")
@@ -0,0 +1,374 @@
+"""Test suite for the socket sink handler"""
+import json
+import logging
+import os
+import socket
+import struct
+import threading
+import time
+
+import pytest
+
+from helpers.imports import undo_imports_from_package
+
+LOGGER_NAME = "sinks-test"
+
+
+@pytest.fixture
+def json_logging():
+    import json_logging
+
+    yield json_logging
+
+    undo_imports_from_package("json_logging")  # Necessary because of json-logging's global state
+
+
+class Peer(object):
+    """Log forwarder stand-in, stores all bytes received"""
+
+    def __init__(self, family, address):
+        self.data = bytearray()
+        self._server = socket.socket(family, socket.SOCK_STREAM)
+        self._server.bind(address)
+        self._server.listen(8)
+        self.address = self._server.getsockname()
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+        self._thread.start()
+
+    def _serve(self):
+        while True:
+            try:
+                connection, _ = self._server.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._receive, args=(connection,), daemon=True).start()
+
+    def _receive(self, connection):
+        with connection:
+            for chunk in iter(lambda: connection.recv(65536), b""):
+                self.data += chunk
+
+    def close(self):
+        self._server.close()
+
+
+def make_record(msg="test message", level=logging.INFO):
+    return logging.LogRecord(LOGGER_NAME, level, __file__, 42, msg, None, None)
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def unpack(data, offset=0):
+    """Decode the MessagePack subset written by json_logging.encoders.msgpack_dumps"""
+    code = data[offset]
+    offset += 1
+    if code <= 0x7f:
+        return code, offset
+    if code >= 0xe0:
+        return code - 0x100, offset
+    if 0xa0 <= code <= 0xbf or code in (0xd9, 0xda, 0xdb, 0xc4, 0xc5, 0xc6):
+        if 0xa0 <= code <= 0xbf:
+            length = code & 0x1f
+        else:
+            size = {0xd9: 1, 0xda: 2, 0xdb: 4, 0xc4: 1, 0xc5: 2, 0xc6: 4}[code]
+            length = int.from_bytes(data[offset:offset + size], "big")
+            offset += size
+        value = bytes(data[offset:offset + length])
+        return (value if code in (0xc4, 0xc5, 0xc6) else value.decode("utf-8")), offset + length
+    if 0x90 <= code <= 0x9f or 0x80 <= code <= 0x8f or code in (0xdc, 0xdd, 0xde, 0xdf):
+        if code <= 0x9f:
+            length = code & 0x0f
+        else:
+            size = 2 if code in (0xdc, 0xde) else 4
+            length = int.from_bytes(data[offset:offset + size], "big")
+            offset += size
+        items = []
+        for _ in range(length * (2 if code in (0xde, 0xdf) or code <= 0x8f else 1)):
+            item, offset = unpack(data, offset)
+            items.append(item)
+        if code in (0xde, 0xdf) or code <= 0x8f:
+            return dict(zip(items[::2], items[1::2])), offset
+        return items, offset
+    if code == 0xd7:
+        return ("ext", data[offset], bytes(data[offset + 1:offset + 9])), offset + 9
+    if code == 0xcb:
+        return struct.unpack_from(">d", data, offset)[0], offset + 8
+    if code in (0xcc, 0xcd, 0xce, 0xcf):
+        size = 1 << (code - 0xcc)
+        return int.from_bytes(data[offset:offset + size], "big"), offset + size
+    if code in (0xd0, 0xd1, 0xd2, 0xd3):
+        size = 1 << (code - 0xd0)
+        return int.from_bytes(data[offset:offset + size], "big", signed=True), offset + size
+    return {0xc0: None, 0xc2: False, 0xc3: True}[code], offset
+
+
+def test_newline_framing_over_tcp(json_logging):
+    """Test if records are sent as JSON lines once flushed"""
+    from json_logging.sinks import SocketSinkHandler
+
+    peer = Peer(socket.AF_INET, ("127.0.0.1", 0))
+    handler = SocketSinkHandler(peer.address, flush_interval=None)
+    handler.setFormatter(json_logging.JSONLogFormatter())
+    try:
+        for index in range(10):
+            handler.handle(make_record("message %d" % index))
+        handler.flush()
+
+        assert wait_for(lambda: peer.data.count(b"\n") == 10)
+        messages = [json.loads(line)["msg"] for line in peer.data.decode("utf-8").splitlines()]
+        assert messages == ["message %d" % index for index in range(10)]
+    finally:
+        handler.close()
+        peer.close()
+
+
+@pytest.mark.skipif(not hasattr(socket, "AF_UNIX"), reason="requires Unix sockets")
+def test_forward_framing_over_unix_socket(json_logging, tmp_path):
+    """Test if batches are sent as Fluent Forward PackedForward messages"""
+    from json_logging.sinks import SocketSinkHandler
+
+    peer = Peer(socket.AF_UNIX, str(tmp_path / "forward.sock"))
+    handler = SocketSinkHandler(peer.address, framing="forward", tag="app.logs", flush_interval=None)
+    handler.setFormatter(json_logging.JSONLogFormatter())
+    record = make_record("forwarded", level=logging.ERROR)
+    try:
+        handler.handle(make_record())
+        handler.handle(record)
+
+        handler.flush()
+        assert wait_for(lambda: peer.data.endswith(b"\x81\xa4size\x02"))
+        (tag, entries, options), end = unpack(peer.data)
+        assert end == len(peer.data)
+        assert tag == "app.logs"
+        assert options == {"size": 2}
+
+        (event_time, log_object), offset = unpack(entries, unpack(entries)[1])
+        assert offset == len(entries)
+        assert event_time[:2] == ("ext", 0)
+        seconds, nanoseconds = struct.unpack(">II", event_time[2])
+        assert abs(seconds + nanoseconds / 1e9 - record.created) < 1e-6
+        assert log_object["msg"] == "forwarded"
+        assert log_object["level"] == "ERROR"
+    finally:
+        handler.close()
+        peer.close()
+
+
+def test_records_are_spilled_while_peer_is_down(json_logging, tmp_path):
+    """Test if records are spilled to disk while the peer is unreachable, and sent first once it is back"""
+    from json_logging.sinks import SocketSinkHandler
+
+    probe = socket.socket()
+    probe.bind(("127.0.0.1", 0))
+    address = probe.getsockname()
+    probe.close()
+
+    spill_path = tmp_path / "logs.spill"
+    handler = SocketSinkHandler(address, flush_interval=0.05, buffer_limit=1, spill_path=str(spill_path),
+                                backoff_initial=0.05, backoff_max=0.05, flush_timeout=0.5)
+    handler.setFormatter(json_logging.JSONLogFormatter())
+    peer = None
+    try:
+        for index in range(3):
+            handler.handle(make_record("spilled %d" % index))
+        assert spill_path.read_bytes().count(b"\n") >= 2
+        assert handler.dropped_count == 0
+
+        peer = Peer(socket.AF_INET, address)
+        handler.handle(make_record("live"))
+        assert wait_for(lambda: peer.data.count(b"\n") == 4)
+        messages = [json.loads(line)["msg"] for line in peer.data.decode("utf-8").splitlines()]
+        assert messages == ["spilled 0", "spilled 1", "spilled 2", "live"]
+        assert spill_path.read_bytes() == b""
+    finally:
+        handler.close()
+        if peer is not None:
+            peer.close()
+
+
+def test_records_are_dropped_without_spill_file(json_logging):
+    """Test if records exceeding the buffer limit are dropped and counted when no spill file is configured"""
+    from json_logging.sinks import SocketSinkHandler
+
+    handler = SocketSinkHandler(("127.0.0.1", 9), flush_interval=None, buffer_limit=1, flush_timeout=0.1)
+    handler.setFormatter(json_logging.JSONLogFormatter())
+    try:
+        for _ in range(5):
+            handler.handle(make_record())
+        assert handler.dropped_count == 4
+    finally:
+        handler.close()
+    assert handler.dropped_count == 5
+
+
+def test_unwritable_spill_file_does_not_raise(json_logging, tmp_path):
+    """Test if records that can't be spilled are dropped and reported, without stopping the sender"""
+    from json_logging.sinks import SocketSinkHandler
+
+    errors = []
+    handler = SocketSinkHandler(("127.0.0.1", 9), flush_interval=0.05, buffer_limit=1, flush_timeout=0.1,
+                                spill_path=str(tmp_path / "missing" / "logs.spill"), backoff_initial=0.05)
+    handler.setFormatter(json_logging.JSONLogFormatter())
+    handler.handleError = errors.append
+    try:
+        for _ in range(3):
+            handler.handle(make_record())
+        assert wait_for(lambda: handler.dropped_count >= 2)
+        assert errors
+        assert handler._sender.is_alive()
+    finally:
+        handler.close()
+    assert handler.dropped_count == 3
+
+
+def test_connections_are_shared_per_address(json_logging):
+    """Test if handlers to the same peer share one connection"""
+    from json_logging.sinks import get_socket_connection
+
+    assert get_socket_connection(("127.0.0.1", 9)) is get_socket_connection(["127.0.0.1", 9])
+    assert get_socket_connection(("127.0.0.1", 9)) is not get_socket_connection(("127.0.0.1", 10))
+
+
+def read_index(handler):
+    with open(handler.index_path, "rb") as index_file:
+        return [json.loads(line) for line in index_file]
+
+
+def test_compressed_file_frames_and_index(json_logging, tmp_path):
+    """Test if frames are complete gzip members listed in the index"""
+    import gzip
+    from json_logging.sinks import RotatingCompressedFileHandler
+
+    handler = RotatingCompressedFileHandler(str(tmp_path / "job.jsonl"), frame_size=1, flush_interval=None)
+    handler.setFormatter(json_logging.JSONLogFormatter())
+    try:
+        for index in range(3):
+            handler.handle(make_record("message %d" % index))
+        segment_path = handler.segment_path
+        # readable while being written, every frame is complete
+        with open(segment_path, "rb") as segment_file:
+            data = segment_file.read()
+        lines = gzip.decompress(data).decode("utf-8").splitlines()
+        assert [json.loads(line)["msg"] for line in lines] == ["message %d" % index for index in range(3)]
+
+        entries = read_index(handler)
+        assert [entry["offset"] for entry in entries] == [0, entries[0]["length"],
+                                                          entries[0]["length"] + entries[1]["length"]]
+        assert all(entry["segment"] == os.path.basename(segment_path) for entry in entries)
+        third = data[entries[2]["offset"]:entries[2]["offset"] + entries[2]["length"]]
+        assert json.loads(gzip.decompress(third))["msg"] == "message 2"
+        assert entries[2]["records"] == 1
+    finally:
+        handler.close()
+
+
+def test_compressed_file_buffers_until_flush(json_logging, tmp_path):
+    """Test if lines are compressed in frames of frame_size bytes, records at flush_level are written at once"""
+    from json_logging.sinks import RotatingCompressedFileHandler
+
+    handler = RotatingCompressedFileHandler(str(tmp_path / "job.jsonl"), flush_interval=None)
+    handler.setFormatter(json_logging.JSONLogFormatter())
+    try:
+        handler.handle(make_record())
+        assert handler.segment_path is None
+        handler.handle(make_record(level=logging.ERROR))
+        assert [entry["records"] for entry in read_index(handler)] == [2]
+    finally:
+        handler.close()
+
+
+def test_compressed_file_rotation(json_logging, tmp_path):
+    """Test if segments are rotated once they hold max_bytes bytes of lines"""
+    import gzip
+    from json_logging.sinks import RotatingCompressedFileHandler
+
+    handler = RotatingCompressedFileHandler(str(tmp_path / "job.jsonl"), frame_size=1, max_bytes=1,
+                                            flush_interval=None)
+    handler.setFormatter(json_logging.JSONLogFormatter())
+    for index in range(3):
+        handler.handle(make_record("message %d" % index))
+    handler.close()
+
+    entries = read_index(handler)
+    assert len({entry["segment"] for entry in entries}) == 3
+    assert all(entry["segment"].endswith("-%d.jsonl.gz" % sequence) for sequence, entry in enumerate(entries))
+    messages = [json.loads(gzip.decompress((tmp_path / entry["segment"]).read_bytes()))["msg"] for entry in entries]
+    assert messages == ["message %d" % index for index in range(3)]
+
+
+def test_compressed_file_zstd_dictionary(json_logging, tmp_path):
+    """Test if zstd frames compressed with a trained dictionary can be decompressed with it"""
+    zstandard = pytest.importorskip("zstandard")
+    from json_logging.sinks import RotatingCompressedFileHandler, train_zstd_dictionary
+
+    formatter = json_logging.JSONLogFormatter()
+    samples = [formatter.format_bytes(make_record("sample %d" % index)) for index in range(1000)]
+    dictionary = train_zstd_dictionary(samples, dict_size=4096)
+
+    handler = RotatingCompressedFileHandler(str(tmp_path / "job.jsonl"), compression="zstd", frame_size=1,
+                                            flush_interval=None, zstd_dictionary=dictionary)
+    handler.setFormatter(formatter)
+    handler.handle(make_record("compressed"))
+    segment_path = handler.segment_path
+    handler.close()
+
+    decompressor = zstandard.ZstdDecompressor(dict_data=zstandard.ZstdCompressionDict(dictionary))
+    with open(segment_path, "rb") as segment_file:
+        assert json.loads(decompressor.decompress(segment_file.read()))["msg"] == "compressed"
+
+
+def test_compressed_file_index_error_does_not_duplicate_frame(json_logging, tmp_path):
+    """Test if a frame written to the segment is not written again when its index line can't be written"""
+    import gzip
+    from json_logging.sinks import RotatingCompressedFileHandler
+
+    class BrokenFile(object):
+        def write(self, data):
+            raise OSError("No space left on device")
+
+    handler = RotatingCompressedFileHandler(str(tmp_path / "job.jsonl"), frame_size=1, flush_interval=None)
+    handler.setFormatter(json_logging.JSONLogFormatter())
+    handler.handleError = lambda record: None
+    try:
+        handler.handle(make_record("message 0"))
+        index_file, handler._index_file = handler._index_file, BrokenFile()
+        handler.handle(make_record("message 1"))
+        handler._index_file = index_file
+        handler.handle(make_record("message 2"))
+        with open(handler.segment_path, "rb") as segment_file:
+            lines = gzip.decompress(segment_file.read()).decode("utf-8").splitlines()
+        assert [json.loads(line)["msg"] for line in lines] == ["message %d" % index for index in range(3)]
+        assert [entry["records"] for entry in read_index(handler)] == [1, 1]
+    finally:
+        handler.close()
+
+
+def test_compressed_file_flusher_survives_errors(json_logging, tmp_path):
+    """Test if write errors in the background flush are reported and retried"""
+    from json_logging.sinks import RotatingCompressedFileHandler
+
+    errors = []
+    handler = RotatingCompressedFileHandler(str(tmp_path / "job.jsonl"), flush_interval=0.05)
+    handler.setFormatter(json_logging.JSONLogFormatter())
+    handler.handleError = errors.append
+    write_frame = handler._write_frame
+
+    def failing_write_frame():
+        if not errors:
+            raise OSError("No space left on device")
+        write_frame()
+
+    handler._write_frame = failing_write_frame
+    try:
+        handler.handle(make_record())
+        assert wait_for(lambda: handler.segment_path is not None)
+        assert len(errors) == 1
+        assert handler._flusher.is_alive()
+        assert [entry["records"] for entry in read_index(handler)] == [1]
+    finally:
+        handler.close()
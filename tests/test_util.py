@@ -0,0 +1,59 @@
+"""Test suite for json_logging.util"""
+import re
+
+import pytest
+
+from helpers.imports import undo_imports_from_package
+
+PATTERNS = [
+    "/health",
+    "^/metrics",
+    r"^/static/.*\.js$",
+    re.compile("/ADMIN", re.IGNORECASE),
+    "(?i)/debug",
+    r"^/(v\d)/docs/\1$",
+    r"/(\w+)-\1$",
+]
+
+
+@pytest.fixture
+def util():
+    import json_logging.util
+
+    yield json_logging.util
+
+    undo_imports_from_package("json_logging")  # Necessary because of json-logging's global state
+
+
+@pytest.mark.parametrize("path", [
+    "/health", "/api/health/live", "/metrics", "/metrics/prometheus", "/api/metrics", "/static/app.js",
+    "/static/app.jsx", "/admin/users", "/DEBUG", "/v1/docs/v1", "/v1/docs/v2", "/files/ab-ab", "/files/ab-cd", "/",
+    "",
+])
+def test_url_pattern_matcher_matches_like_re_search(util, path):
+    """Test if the compiled matcher gives the same decision as re.search over every pattern"""
+    matcher = util.UrlPatternMatcher(PATTERNS)
+
+    expected = util.is_not_match_any_pattern(path, PATTERNS)
+
+    assert util.is_not_match_any_pattern(path, matcher) == expected
+    # cached decision
+    assert util.is_not_match_any_pattern(path, matcher) == expected
+
+
+def test_url_pattern_matcher_without_patterns(util):
+    """Test if an empty matcher never excludes and still iterates like a list"""
+    matcher = util.UrlPatternMatcher([])
+
+    assert util.is_not_match_any_pattern("/anything", matcher)
+    assert list(matcher) == []
+    assert list(util.UrlPatternMatcher(PATTERNS)) == PATTERNS
+
+
+def test_url_pattern_matcher_keeps_backreferences(util):
+    """Test if numbered backreferences still refer to their own group when other patterns are combined"""
+    matcher = util.UrlPatternMatcher([r"^/(api)/", r"/(\w+)-\1$", r"(x)(y)\2$"])
+
+    assert not util.is_not_match_any_pattern("/files/ab-ab", matcher)
+    assert util.is_not_match_any_pattern("/files/ab-cd", matcher)
+    assert not util.is_not_match_any_pattern("/xyy", matcher)